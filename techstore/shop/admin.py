@@ -1,10 +1,26 @@
-from django.apps import apps
 from django.contrib import admin
 
-app_config = apps.get_app_config('shop')
+from shop.models import (
+    Cart,
+    CartProduct,
+    Category,
+    DailyRevenue,
+    DeliveryStatus,
+    DeliveryStatusCount,
+    Order,
+    OrderArchive,
+    OrderProduct,
+    OrderProductArchive,
+    OrderStatusEvent,
+    Product,
+    ProductSales,
+    ShopAddress,
+    Stock,
+    StockReservation,
+)
 
-for model in app_config.get_models():
-    try:
-        admin.site.register(model)
-    except admin.sites.AlreadyRegistered:
-        pass
\ No newline at end of file
+admin.site.register([
+    Product, Category, Cart, CartProduct, ShopAddress, DeliveryStatus, Order, OrderProduct,
+    OrderArchive, OrderProductArchive, Stock, StockReservation, DailyRevenue, ProductSales, DeliveryStatusCount,
+    OrderStatusEvent,
+])
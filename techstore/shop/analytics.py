@@ -0,0 +1,139 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from shop.models import (
+    DailyRevenue, DeliveryStatusCount, Order, OrderArchive, OrderProduct, OrderProductArchive, ProductSales,
+)
+
+LINE_REVENUE = Sum(F('amount') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+# Active and archived orders with their line snapshots; archived orders still count.
+PARTITIONS = ((Order, OrderProduct), (OrderArchive, OrderProductArchive))
+
+
+def get_config():
+    config = {
+        'BUCKETS': 16,
+    }
+    config.update(getattr(settings, 'SHOP_ANALYTICS', {}))
+    return config
+
+
+def bucket(key):
+    """The row of a day or status that the change keyed by ``key`` (an order id) goes to."""
+    return key % get_config()['BUCKETS']
+
+
+def _increment(model, lookup, defaults=None, **deltas):
+    """Add ``deltas`` to the rollup row matching ``lookup``, creating it on first use."""
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Another transaction created the row first.
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_order(order, lines, sign=1):
+    """
+    Add an order and its line snapshots to the revenue rollups, or take them
+    out again with ``sign=-1``. Rows are touched in a fixed order (products by
+    id, then the day) so concurrent checkouts cannot deadlock on them, and
+    the day's row is one of ``BUCKETS`` picked by order id so they rarely wait
+    on each other either.
+    """
+    products = defaultdict(lambda: [0, Decimal('0.00'), ''])
+    units, revenue = 0, Decimal('0.00')
+    for line in lines:
+        units += line.amount
+        revenue += line.amount * line.price
+        if line.product_id is not None:
+            totals = products[line.product_id]
+            totals[0] += line.amount
+            totals[1] += line.amount * line.price
+            totals[2] = line.name
+    for product_id in sorted(products):
+        product_units, product_revenue, name = products[product_id]
+        _increment(ProductSales, {'product_id': product_id}, defaults={'name': name},
+                   orders=sign, units=sign * product_units, revenue=sign * product_revenue)
+    _increment(DailyRevenue, {'date': timezone.localdate(order.date), 'bucket': bucket(order.pk)},
+               orders=sign, units=sign * units, revenue=sign * revenue)
+
+
+def record_status_change(order_id, old_status_id, new_status_id, created=False, deleted=False):
+    if old_status_id == new_status_id and not created and not deleted:
+        return
+    # Only the sum over a status' buckets means anything, so the order may
+    # move out of one bucket it was never counted in.
+    lookup = {'bucket': bucket(order_id)}
+    if not created:
+        _increment(DeliveryStatusCount, {**lookup, 'deliveryStatus_id': old_status_id}, orders=-1)
+    if not deleted:
+        _increment(DeliveryStatusCount, {**lookup, 'deliveryStatus_id': new_status_id}, orders=1)
+
+
+def record_status_transitions(order_id, old_status_counts, new_status_id):
+    """
+    Move orders counted under other statuses, ``{status_id: orders}``, to
+    ``new_status_id``, in the buckets of ``order_id``, one of the orders.
+    """
+    lookup = {'bucket': bucket(order_id)}
+    for old_status_id in sorted(old_status_counts, key=lambda pk: (pk is not None, pk or 0)):
+        _increment(DeliveryStatusCount, {**lookup, 'deliveryStatus_id': old_status_id},
+                   orders=-old_status_counts[old_status_id])
+    _increment(DeliveryStatusCount, {**lookup, 'deliveryStatus_id': new_status_id},
+               orders=sum(old_status_counts.values()))
+
+
+@transaction.atomic
+def backfill():
+    """Rebuild every rollup from the orders and line snapshots in the database, archived ones included."""
+    DailyRevenue.objects.all().delete()
+    ProductSales.objects.filter(product__isnull=False).delete()
+    DeliveryStatusCount.objects.all().delete()
+
+    days = {}
+    products = {}
+    statuses = defaultdict(int)
+    for order_model, line_model in PARTITIONS:
+        for row in order_model.objects.annotate(day=TruncDate('date')).order_by().values('day').annotate(orders=Count('id')):
+            day = days.setdefault(row['day'], DailyRevenue(date=row['day'], orders=0, units=0, revenue=Decimal('0.00')))
+            day.orders += row['orders']
+        for row in (
+            line_model.objects.annotate(day=TruncDate('order__date')).order_by().values('day')
+            .annotate(units=Sum('amount'), revenue=LINE_REVENUE)
+        ):
+            days[row['day']].units += row['units']
+            days[row['day']].revenue += row['revenue']
+        for row in line_model.objects.filter(product__isnull=False).order_by().values('product_id').annotate(
+            current_name=F('product__name'), orders=Count('order_id', distinct=True),
+            units=Sum('amount'), revenue=LINE_REVENUE,
+        ):
+            sales = products.setdefault(row['product_id'], ProductSales(
+                product_id=row['product_id'], name=row['current_name'], orders=0, units=0, revenue=Decimal('0.00'),
+            ))
+            sales.orders += row['orders']
+            sales.units += row['units']
+            sales.revenue += row['revenue']
+        for row in order_model.objects.order_by().values('deliveryStatus_id').annotate(orders=Count('id')):
+            statuses[row['deliveryStatus_id']] += row['orders']
+
+    DailyRevenue.objects.bulk_create(days.values(), batch_size=1000)
+    ProductSales.objects.bulk_create(products.values(), batch_size=1000)
+    DeliveryStatusCount.objects.bulk_create([
+        DeliveryStatusCount(deliveryStatus_id=status_id, orders=orders) for status_id, orders in statuses.items()
+    ])
+    return {
+        'days': len(days),
+        'products': ProductSales.objects.filter(product__isnull=False).count(),
+        'statuses': DeliveryStatusCount.objects.count(),
+    }
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self):
+        from django.conf import settings
+
+        from shop import routers, signals  # noqa: F401
+        if 'shop.middleware.RequestMetricsMiddleware' in settings.MIDDLEWARE:
+            from shop.metrics import instrument_serializers
+            instrument_serializers()
@@ -0,0 +1,182 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from . import fastpath
+from .events import fetch_events, get_config as get_events_config, hub
+from .models import Cart, CartProduct, Category, Product
+from .pagination import OrderKeysetPagination, ProductKeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import OrderChangesSerializer, OrderFilterSerializer, ProductFilterSerializer, ProductSerializer
+from .views import filter_products, order_partitions
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of ``APIView`` for read endpoints served by ASGI.
+
+    Authentication, permissions and throttles use the same DRF classes as the
+    sync views (run in a worker thread, since they may touch the database);
+    handlers are coroutines that return ``(data, status)``, or a finished
+    response, and query through the async ORM.
+    """
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    http_method_names = ['get']
+    renderer = FastJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        try:
+            await sync_to_async(self.initial)(request)
+            if request.method.lower() not in self.http_method_names:
+                raise exceptions.MethodNotAllowed(request.method)
+            handler = getattr(self, request.method.lower())
+            result = await handler(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+        if isinstance(result, HttpResponseBase):
+            return result
+        return self.render(*result)
+
+    def initial(self, request):
+        request.user
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+        durations = []
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                durations.append(throttle.wait())
+        if durations:
+            raise exceptions.Throttled(max((d for d in durations if d is not None), default=None))
+
+    def handle_exception(self, request, exc):
+        headers = {}
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            if request.authenticators:
+                headers['WWW-Authenticate'] = request.authenticators[0].authenticate_header(request)
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+        response = exception_handler(exc, {'view': self, 'request': request})
+        rendered = self.render(response.data, response.status_code)
+        for key, value in {**headers, **response.headers}.items():
+            rendered[key] = value
+        return rendered
+
+    def render(self, data, code):
+        return HttpResponse(self.renderer.render(data), status=code, content_type='application/json')
+
+
+class AsyncProductListAPIView(AsyncAPIView):
+    permission_classes = (AllowAny,)
+    throttle_scope = 'products'
+
+    async def get(self, request):
+        filters = ProductFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        lst = filter_products(Product.objects.all(), filters.validated_data)
+        paginator = ProductKeysetPagination()
+        page = await paginator.apaginate_queryset(fastpath.products.rows(lst), request, view=self)
+        return paginator.get_paginated_response(fastpath.products.serialize(page)).data, status.HTTP_200_OK
+
+
+class AsyncProductDetailAPIView(AsyncAPIView):
+    async def get(self, request, pk):
+        try:
+            product = await Product.objects.aget(pk=pk)
+        except Product.DoesNotExist:
+            raise exceptions.NotFound()
+        return ProductSerializer(product).data, status.HTTP_200_OK
+
+
+class AsyncCategoryListAPIView(AsyncAPIView):
+    async def get(self, request):
+        lst = [row async for row in fastpath.categories.rows(Category.objects.all())]
+        return fastpath.categories.serialize(lst), status.HTTP_200_OK
+
+
+class AsyncCartProductListAPIView(AsyncAPIView):
+    async def get(self, request):
+        active_cart = await Cart.objects.filter(user_id=request.user.id, isPurchase=False).afirst()
+        lst = []
+        if active_cart:
+            lst = [row async for row in fastpath.cart_products.rows(CartProduct.objects.filter(cart=active_cart))]
+        return fastpath.cart_products.serialize(lst), status.HTTP_200_OK
+
+
+class AsyncOrderListAPIView(AsyncAPIView):
+    async def get(self, request):
+        filters = OrderFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        paginator = OrderKeysetPagination()
+        page = await paginator.apaginate_partitions(
+            order_partitions({**filters.validated_data, 'user_id': request.user.id}), request, view=self
+        )
+        return paginator.get_paginated_response(fastpath.orders.serialize(page)).data, status.HTTP_200_OK
+
+
+class AsyncOrderChangesAPIView(AsyncAPIView):
+    """
+    Status and delivery changes of the user's orders after ``cursor``. With a
+    ``timeout`` the request is held open until a change arrives (long polling);
+    waiting requests are served from the in-process event hub, not the database.
+    """
+
+    async def get(self, request):
+        params = OrderChangesSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        timeout = min(data['timeout'], get_events_config()['LONG_POLL_TIMEOUT'])
+        if not timeout:
+            events = await sync_to_async(fetch_events)(request.user.id, data['cursor'], data['limit'])
+            cursor = events[-1]['id'] if events else data['cursor']
+            return {'events': events, 'cursor': cursor}, status.HTTP_200_OK
+        subscription = await hub.subscribe(request.user.id, data['cursor'])
+        try:
+            events = await subscription.next(timeout, data['limit'])
+        finally:
+            hub.unsubscribe(subscription)
+        return {'events': events, 'cursor': subscription.cursor}, status.HTTP_200_OK
+
+
+class AsyncOrderEventStreamAPIView(AsyncAPIView):
+    """
+    Server-Sent Events stream of the user's order changes. Resumes after the
+    ``Last-Event-ID`` header (or ``cursor`` parameter) on reconnect.
+    """
+
+    async def get(self, request):
+        cursor = request.headers.get('Last-Event-ID') or request.query_params.get('cursor') or 0
+        try:
+            cursor = max(int(cursor), 0)
+        except ValueError:
+            raise exceptions.ValidationError({'cursor': ['A valid integer is required.']})
+        response = StreamingHttpResponse(self.stream(request.user.id, cursor), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Keep nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, user_id, cursor):
+        keepalive = get_events_config()['KEEPALIVE']
+        subscription = await hub.subscribe(user_id, cursor)
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                events = await subscription.next(keepalive)
+                if not events:
+                    yield ': keepalive\n\n'
+                for event in events:
+                    yield 'id: %d\nevent: order\ndata: %s\n\n' % (event['id'], self.renderer.render(event).decode())
+        finally:
+            hub.unsubscribe(subscription)
@@ -0,0 +1,88 @@
+import copy
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        config = getattr(settings, 'SHOP_AUTH_CACHE', {})
+        if not config.get('BACKEND'):
+            return None
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _user_cache
+
+
+def _user_key(user_id):
+    return 'shop:auth-user:%s' % user_id
+
+
+def forget_user(user_id):
+    """Drop a cached user, so the next request with its token reloads the row."""
+    cache = get_user_cache()
+    if cache is not None:
+        cache.delete(_user_key(user_id))
+
+
+def _timeout():
+    return getattr(settings, 'SHOP_AUTH_CACHE', {}).get('TIMEOUT', 60)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that keeps the tokens it has verified and the users
+    it loads in ``SHOP_AUTH_CACHE`` for ``TIMEOUT`` seconds, so authenticated
+    requests usually neither decode the token again nor touch the database.
+    Cached users are dropped whenever their row is saved or deleted
+    (deactivation, password change), for every worker sharing the backend;
+    rows changed with ``update()`` are picked up when the entry expires.
+    """
+
+    def get_validated_token(self, raw_token):
+        cache = get_user_cache()
+        if cache is None:
+            return super().get_validated_token(raw_token)
+        # The signature is part of the key, so a hit is a token verified before.
+        key = 'shop:auth-token:%s' % hashlib.sha256(raw_token).hexdigest()
+        token = cache.get(key)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            lifetime = token.get('exp', 0) - time.time()
+            if lifetime > 0:
+                cache.set(key, token, min(_timeout(), lifetime))
+        return token
+
+    def get_user(self, validated_token):
+        cache = get_user_cache()
+        if cache is None:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = _user_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, _timeout())
+        elif api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        # Views may set attributes on request.user; keep them off the shared instance.
+        return copy.copy(user)
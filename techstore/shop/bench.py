@@ -0,0 +1,178 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from shop.analytics import backfill as backfill_analytics
+from shop.cache import bump_version
+from shop.categories import rebuild_category_tree
+from shop.models import (
+    Cart,
+    CartProduct,
+    Category,
+    DeliveryStatus,
+    Order,
+    OrderProduct,
+    Product,
+    ShopAddress,
+)
+from shop.search import inverted_index
+from shop.services import delete_products
+
+PREFIX = 'bench-'
+ADMIN_USERNAME = PREFIX + 'admin'
+PASSWORD = 'bench-password'
+WORDS = (
+    'laptop', 'phone', 'tablet', 'monitor', 'keyboard', 'mouse', 'camera', 'speaker',
+    'router', 'charger', 'cable', 'watch', 'headphones', 'printer', 'console', 'drive',
+)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Throughput and latency percentiles (milliseconds) for one benchmark run."""
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def sync_only_middleware():
+    """
+    ``MIDDLEWARE`` entries that can't run on the event loop. Under ASGI Django
+    adapts the handler chain below the first of them, so every request
+    would hold a thread no matter how async its view is.
+    """
+    return [path for path in settings.MIDDLEWARE if not getattr(import_string(path), 'async_capable', False)]
+
+
+def has_seed_data():
+    return Product.objects.filter(name__startswith=PREFIX).exists()
+
+
+def seed(categories=50, products=100_000, users=100, cart_lines=5, orders=3, batch_size=5000, rng_seed=0, log=None):
+    """
+    Bulk-insert a synthetic catalog plus users with open carts and past orders.
+
+    Every row is named with ``PREFIX`` so ``clear_seed`` can remove it again.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(rng_seed)
+    log = log or (lambda message: None)
+    password = make_password(PASSWORD)
+
+    with transaction.atomic():
+        category_ids = [c.pk for c in Category.objects.bulk_create(
+            [Category(name='%scategory-%03d' % (PREFIX, i)) for i in range(categories)]
+        )]
+        shop_address = ShopAddress.objects.create(address='%sshop address' % PREFIX)
+        delivery_status = DeliveryStatus.objects.create(name='%sdelivered' % PREFIX)
+    log('Created %d categories' % len(category_ids))
+
+    product_ids, prices = [], {}
+    for start in range(0, products, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, products)):
+            words = rng.sample(WORDS, 3)
+            batch.append(Product(
+                name='%sproduct-%06d %s' % (PREFIX, i, words[0]),
+                price=Decimal(rng.randrange(100, 500_000)) / 100,
+                description=' '.join(words),
+                category_id=rng.choice(category_ids),
+            ))
+        for product in Product.objects.bulk_create(batch):
+            product_ids.append(product.pk)
+            prices[product.pk] = product.price
+        log('Created %d/%d products' % (len(product_ids), products))
+
+    with transaction.atomic():
+        user_objs = User.objects.bulk_create(
+            [User(username='%suser-%05d' % (PREFIX, i), password=password) for i in range(users)]
+        )
+        User.objects.create(username=ADMIN_USERNAME, password=password, is_staff=True, is_superuser=True)
+
+        carts = Cart.objects.bulk_create(
+            [Cart(user=user, isPurchase=False) for user in user_objs]
+            + [Cart(user=user, isPurchase=True) for user in user_objs for _ in range(orders)]
+        )
+        open_carts, purchased_carts = carts[:len(user_objs)], carts[len(user_objs):]
+        cart_products = []
+        for cart in open_carts:
+            for product_id in rng.sample(product_ids, min(cart_lines, len(product_ids))):
+                cart_products.append(CartProduct(cart=cart, product_id=product_id, amount=rng.randint(1, 3)))
+        CartProduct.objects.bulk_create(cart_products, batch_size=batch_size)
+
+        order_objs = Order.objects.bulk_create([
+            Order(user_id=cart.user_id, cart=cart, deliveryType=True,
+                  shopAddress=shop_address, deliveryStatus=delivery_status)
+            for cart in purchased_carts
+        ])
+        order_lines = []
+        for order in order_objs:
+            for product_id in rng.sample(product_ids, min(cart_lines, len(product_ids))):
+                order_lines.append(OrderProduct(
+                    order=order, product_id=product_id, name='%sproduct' % PREFIX,
+                    price=prices[product_id], amount=rng.randint(1, 3),
+                ))
+        OrderProduct.objects.bulk_create(order_lines, batch_size=batch_size)
+    log('Created %d users, %d cart lines and %d orders' % (len(user_objs), len(cart_products), len(order_objs)))
+
+    _catalog_changed()
+    return {
+        'categories': len(category_ids),
+        'products': len(product_ids),
+        'users': len(user_objs),
+        'cart_lines': len(cart_products),
+        'orders': len(order_objs),
+        'order_lines': len(order_lines),
+    }
+
+
+def clear_seed():
+    """Delete everything created by ``seed``."""
+    with transaction.atomic():
+        User.objects.filter(username__startswith=PREFIX).delete()
+        # Deleting row by row would fire the per-product search/cache signals 100k times.
+        delete_products(Product.objects.filter(name__startswith=PREFIX), batch_size=10_000)
+        Category.objects.filter(name__startswith=PREFIX).delete()
+        ShopAddress.objects.filter(address__startswith=PREFIX, order__isnull=True).delete()
+        DeliveryStatus.objects.filter(name__startswith=PREFIX, order__isnull=True).delete()
+    _catalog_changed()
+
+
+def _catalog_changed():
+    # bulk_create and raw deletes skip the model signals.
+    rebuild_category_tree()
+    backfill_analytics()
+    bump_version(Category)
+    bump_version(Product)
+    bump_version(ShopAddress)
+    bump_version(DeliveryStatus)
+    inverted_index.reset()
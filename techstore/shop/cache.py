@@ -0,0 +1,292 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.response import Response
+
+from shop.routers import current_replica
+
+
+class LocMemLRUBackend:
+    """Process-local cache that evicts the least recently used entry once full."""
+
+    def __init__(self, max_entries=1024, **kwargs):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Shares entries between workers through a configured ``CACHES`` alias."""
+
+    def __init__(self, alias='default', **kwargs):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        # Cache connections are per thread.
+        return caches[self.alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class _Call:
+    __slots__ = ('done', 'result')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time within the process: callers arriving while
+    a call for their key is running wait for its result instead of repeating
+    the work.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout=None):
+        """
+        Return ``(result, shared)``. The first caller runs ``func``; the others
+        get its result with ``shared=True``. When that result is None, or it
+        takes longer than ``timeout`` seconds, waiters run ``func`` themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if leader:
+            try:
+                call.result = func()
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result, False
+        if call.done.wait(timeout) and call.result is not None:
+            return call.result, True
+        return func(), False
+
+
+class ResponseCache:
+    """
+    Read-through cache for GET responses keyed by per-model version stamps.
+
+    Every write to a cached model bumps its version, so stale entries are never
+    served: they simply stop being addressed and age out of the backend.
+    Versions themselves expire after ``version_timeout`` seconds (None keeps
+    them), which bounds how long a process-local backend can miss the bumps
+    made by other workers.
+    """
+    prefix = 'shop'
+
+    def __init__(self, backend, timeout=300, coalesce_timeout=10, version_timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.coalesce_timeout = coalesce_timeout
+        self.version_timeout = version_timeout
+        self.inflight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def _version_key(self, model):
+        return '%s:version:%s' % (self.prefix, model._meta.label_lower)
+
+    def get_version(self, model):
+        version = self.backend.get(self._version_key(model))
+        if version is None:
+            version = self.bump(model)
+        return version
+
+    def bump(self, model):
+        now = time.time()
+        version = ('%d' % time.time_ns(), now)
+        self.backend.set(self._version_key(model), version, self.version_timeout)
+        return version
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    def compute(self, key, func):
+        """
+        Run ``func`` for a missed ``key``, sharing its result with concurrent
+        misses of the same key. Returns ``(value, shared)``.
+        """
+        value, shared = self.inflight.do(key, func, self.coalesce_timeout)
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+        return value, shared
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        config = getattr(settings, 'SHOP_RESPONSE_CACHE', {})
+        if not config.get('BACKEND'):
+            return None
+        with _response_cache_lock:
+            if _response_cache is None:
+                options = config.get('OPTIONS', {})
+                backend = import_string(config['BACKEND'])(**options)
+                _response_cache = ResponseCache(
+                    backend,
+                    timeout=config.get('TIMEOUT', 300),
+                    coalesce_timeout=config.get('COALESCE_TIMEOUT', 10),
+                    version_timeout=config.get('VERSION_TIMEOUT'),
+                )
+    return _response_cache
+
+
+def bump_version(model):
+    """
+    Invalidate the responses cached for ``model`` once the current transaction
+    commits; bumping earlier would let a concurrent request cache the data the
+    write hasn't replaced yet under the new version.
+    """
+    cache = get_response_cache()
+    if cache is not None:
+        transaction.on_commit(partial(cache.bump, model))
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def cached_response(*models):
+    """
+    Cache a view's GET handler until any of ``models`` changes.
+
+    Adds ``ETag``/``Last-Modified`` headers and answers conditional requests
+    with 304 Not Modified without running the handler. Concurrent misses for
+    the same key run the handler once and share its 200 response data.
+
+    Misses read from the primary: the result is filed under the current
+    versions for every client, and a lagging replica could be behind them.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            cache = get_response_cache()
+            if cache is None:
+                return method(view, request, *args, **kwargs)
+
+            versions = [cache.get_version(model) for model in models]
+            query = sorted(request.query_params.lists())
+            tokens = ','.join(token for token, _ in versions)
+            raw_key = '%s%s?%s|%s' % (request.get_host(), request.path, query, tokens)
+            digest = hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = max(modified for _, modified in versions)
+
+            if _not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                key = '%s:response:%s' % (cache.prefix, digest)
+                data = cache.get(key)
+                if data is not None:
+                    response = Response(data, status=status.HTTP_200_OK)
+                    response['X-Cache'] = 'HIT'
+                else:
+                    response = None
+
+                    def produce():
+                        nonlocal response
+                        token = current_replica.set(None)
+                        try:
+                            response = method(view, request, *args, **kwargs)
+                        finally:
+                            current_replica.reset(token)
+                        if response.status_code != status.HTTP_200_OK:
+                            return None
+                        cache.set(key, response.data)
+                        return response.data
+
+                    data, shared = cache.compute(key, produce)
+                    if shared:
+                        response = Response(data, status=status.HTTP_200_OK)
+                        response['X-Cache'] = 'COALESCED'
+                    elif response.status_code != status.HTTP_200_OK:
+                        return response
+                    else:
+                        response['X-Cache'] = 'MISS'
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,163 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import transaction
+
+from shop import snapshots
+from shop.cache import bump_version
+from shop.categories import rebuild_category_tree
+from shop.models import Category, Product
+from shop.search import inverted_index
+from shop.serializers import CategoryImportSerializer, ProductImportSerializer
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = {
+    'category': ('id', 'name'),
+    'product': ('id', 'name', 'price', 'description', 'category', 'category_id'),
+}
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'rows': self.rows, 'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def guess_format(name, default='csv'):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    return extension if extension in FORMATS else default
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line, row)`` pairs from a text stream without loading it whole."""
+    if fmt == 'csv':
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+    for line, raw in enumerate(stream, start=1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError as e:
+            yield line, e
+            continue
+        yield line, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def import_catalog(model, stream, fmt, batch_size=1000):
+    """
+    Upsert categories or products by name from a CSV/JSONL stream.
+
+    Rows are validated and written one batch at a time, each batch in its own
+    transaction with a single ``INSERT ... ON CONFLICT (name) DO UPDATE``.
+    Invalid rows are collected in the returned report instead of aborting.
+    """
+    importer = _import_categories if model == 'category' else _import_products
+    report = ImportReport()
+    for batch in chunked(read_rows(stream, fmt), batch_size):
+        report.rows += len(batch)
+        valid = {}
+        for line, row in batch:
+            if isinstance(row, Exception):
+                report.add_error(line, {'non_field_errors': [str(row)]})
+                continue
+            serializer = (CategoryImportSerializer if model == 'category' else ProductImportSerializer)(data=row)
+            if serializer.is_valid():
+                # Later rows win when a batch repeats a name: ON CONFLICT cannot touch a row twice.
+                valid[serializer.validated_data['name']] = (line, serializer.validated_data)
+            else:
+                report.add_error(line, serializer.errors)
+        if valid:
+            with transaction.atomic():
+                report.imported += importer(list(valid.values()), report)
+    if report.imported:
+        rebuild_category_tree()
+        bump_version(Category)
+        bump_version(Product)
+        inverted_index.reset()
+        snapshots.invalidate()
+    return report
+
+
+def _import_categories(rows, report):
+    Category.objects.bulk_create(
+        [Category(name=data['name']) for _, data in rows],
+        update_conflicts=True, unique_fields=['name'], update_fields=['name'],
+    )
+    return len(rows)
+
+
+def _import_products(rows, report):
+    names = {data['category'] for _, data in rows if data.get('category')}
+    ids = {data['category_id'] for _, data in rows if data.get('category_id')}
+    categories = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+    known_ids = set(Category.objects.filter(id__in=ids).values_list('id', flat=True))
+    products = []
+    for line, data in rows:
+        # Exports carry both: the id within this database, the name in another one.
+        category_id = data.get('category_id')
+        if category_id not in known_ids:
+            category_id = categories.get(data.get('category'))
+        if category_id is None:
+            report.add_error(line, {'category': ['Category not found']})
+            continue
+        products.append(Product(
+            name=data['name'],
+            price=data['price'],
+            description=data.get('description', ''),
+            category_id=category_id,
+        ))
+    Product.objects.bulk_create(
+        products,
+        update_conflicts=True, unique_fields=['name'], update_fields=['price', 'description', 'category'],
+    )
+    return len(products)
+
+
+def export_catalog(model, fmt, chunk_size=2000):
+    """Yield the catalog as CSV or JSONL text, one chunk of rows at a time."""
+    fields = EXPORT_FIELDS[model]
+    if model == 'category':
+        rows = Category.objects.order_by('id').values_list(*fields)
+    else:
+        rows = Product.objects.order_by('id').values_list(
+            'id', 'name', 'price', 'description', 'category__name', 'category_id'
+        )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == 'csv':
+        writer.writerow(fields)
+    for batch in chunked(rows.iterator(chunk_size=chunk_size), chunk_size):
+        for row in batch:
+            if fmt == 'csv':
+                writer.writerow(row)
+            else:
+                record = dict(zip(fields, row))
+                if 'price' in record:
+                    record['price'] = str(record['price'])
+                buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
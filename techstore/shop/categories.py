@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, Subquery
+
+from shop.cache import bump_version
+from shop.models import Category, Product, path_ids
+
+
+def adjust_product_count(category_id, delta):
+    """Add ``delta`` to the product count of a category and all of its ancestors."""
+    path = Category.objects.filter(pk=category_id).values_list('path', flat=True).first()
+    if path:
+        Category.objects.filter(pk__in=path_ids(path)).update(productCount=F('productCount') + delta)
+        bump_version(Category)
+
+
+def subtree(category_id):
+    """Categories under ``category_id``, itself included, as a lazy queryset."""
+    path = Category.objects.filter(pk=category_id).values('path')
+    return Category.objects.filter(path__startswith=Subquery(path))
+
+
+def rebuild_category_tree():
+    """
+    Recompute ``path``, ``depth`` and ``productCount`` of every category from
+    the parent links, for rows written without ``Category.save()`` (bulk
+    inserts, raw updates).
+    """
+    children = defaultdict(list)
+    for category in Category.objects.only('id', 'parent_id', 'path', 'depth'):
+        children[category.parent_id].append(category)
+
+    changed = []
+    stack = [(category, '', 0) for category in children[None]]
+    while stack:
+        category, parent_path, depth = stack.pop()
+        path = '%s%d/' % (parent_path, category.pk)
+        if (category.path, category.depth) != (path, depth):
+            category.path, category.depth = path, depth
+            changed.append(category)
+        stack.extend((child, path, depth + 1) for child in children[category.pk])
+    Category.objects.bulk_update(changed, ['path', 'depth'], batch_size=1000)
+
+    _recount()
+    bump_version(Category)
+
+
+def recount_products():
+    """Recompute ``productCount`` of every category, after products were moved or deleted in bulk."""
+    _recount()
+    bump_version(Category)
+
+
+def _recount():
+    # One grouped count per category, rolled up to the ancestors in Python.
+    direct = dict(
+        Product.objects.order_by().values('category_id').annotate(n=Count('pk')).values_list('category_id', 'n')
+    )
+    totals = defaultdict(int)
+    for category_id, path in Category.objects.values_list('id', 'path'):
+        for ancestor_id in path_ids(path):
+            totals[ancestor_id] += direct.get(category_id, 0)
+    changed = [
+        Category(pk=category_id, productCount=totals.get(category_id, 0))
+        for category_id, count in Category.objects.values_list('id', 'productCount')
+        if count != totals.get(category_id, 0)
+    ]
+    Category.objects.bulk_update(changed, ['productCount'], batch_size=1000)
+
+
+def build_category_tree():
+    """The whole category tree as nested dicts, children sorted by name."""
+    nodes, roots = {}, []
+    for category in Category.objects.order_by('depth', 'name').values('id', 'name', 'parent_id', 'productCount'):
+        node = {**category, 'children': []}
+        nodes[node['id']] = node
+        parent = nodes.get(node.pop('parent_id'))
+        (parent['children'] if parent else roots).append(node)
+    return roots
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from shop.models import OrderStatusEvent
+from shop.serializers import OrderStatusEventSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    config = {
+        'POLL_INTERVAL': 1.0,
+        'BUFFER_SIZE': 10000,
+        'BATCH_SIZE': 500,
+        'LONG_POLL_TIMEOUT': 25,
+        'KEEPALIVE': 15,
+        'COMMIT_GRACE': 10,
+    }
+    config.update(getattr(settings, 'SHOP_ORDER_EVENTS', {}))
+    return config
+
+
+def tracked_values(order):
+    return {field: getattr(order, field) for field in OrderStatusEvent.TRACKED_FIELDS}
+
+
+def record_order_change(order, previous):
+    """Log the tracked fields of ``order`` that differ from ``previous``, a ``tracked_values()`` dict."""
+    changes = {field: value for field, value in tracked_values(order).items() if previous[field] != value}
+    if changes:
+        OrderStatusEvent.objects.create(
+            order=order, user_id=order.user_id, deliveryStatus_id=order.deliveryStatus_id, changes=changes,
+        )
+        transaction.on_commit(hub.poke)
+
+
+def grace_edge():
+    return timezone.now() - timedelta(seconds=get_config()['COMMIT_GRACE'])
+
+
+def settled(rows, after_id, edge):
+    """
+    The leading ``rows`` (events ordered by id, following ``after_id``) that
+    no other event can still be committed before.
+
+    Ids are handed out on insert but become visible on commit, so a gap in
+    the ids may be a transaction still in flight whose event would land
+    behind the clients' cursors. A gap is taken as final (rolled back, or
+    rotated away) once the event after it is older than ``COMMIT_GRACE``
+    seconds; ``after_id`` 0 stands for the start of the table.
+    """
+    for index, row in enumerate(rows):
+        if after_id and row.id != after_id + 1 and row.createdAt > edge:
+            return rows[:index]
+        after_id = row.id
+    return rows
+
+
+def settled_id():
+    """The id up to which the event table won't change any more."""
+    edge = grace_edge()
+    batch_size = get_config()['BATCH_SIZE']
+    events = OrderStatusEvent.objects.using(DEFAULT_DB_ALIAS).only('id', 'createdAt')
+    last_id = events.filter(createdAt__lte=edge).order_by('-id').values_list('id', flat=True).first() or 0
+    while True:
+        ready = settled(list(events.filter(id__gt=last_id).order_by('id')[:batch_size]), last_id, edge)
+        if ready:
+            last_id = ready[-1].id
+        if len(ready) < batch_size:
+            return last_id
+
+
+def fetch_events(user_id, cursor, limit):
+    # Always from the primary: a lagging replica could hide an event whose
+    # successors are already in the hub, and the cursor would skip it.
+    events = (
+        OrderStatusEvent.objects.using(DEFAULT_DB_ALIAS)
+        .filter(user_id=user_id, id__gt=cursor, id__lte=settled_id()).order_by('id')[:limit]
+    )
+    return list(OrderStatusEventSerializer(events, many=True).data)
+
+
+class Subscription:
+    """
+    A client waiting for its order events after ``cursor``, the id of the
+    last event it has been given.
+    """
+
+    def __init__(self, hub, user_id, cursor):
+        self.hub = hub
+        self.user_id = user_id
+        self.cursor = cursor
+        # Hub position up to which events have been checked.
+        self.position = None
+        self.catching_up = True
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+
+    def notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The loop is gone with its request.
+            pass
+
+    async def next(self, timeout, limit=500):
+        """
+        The events after the cursor, waiting up to ``timeout`` seconds for new
+        ones; an empty list if none arrived. Only the first call, and calls
+        after the hub's buffer moved past this subscription, read the database.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            self._ready.clear()
+            events = self.hub.take(self)
+            if events is None or self.catching_up:
+                self.position = self.hub.last_id
+                events = await sync_to_async(fetch_events)(self.user_id, self.cursor, limit)
+                self.catching_up = len(events) == limit
+            events = [event for event in events if event['id'] > self.cursor]
+            if events:
+                self.cursor = events[-1]['id']
+                return events
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return []
+            try:
+                await asyncio.wait_for(self._ready.wait(), remaining)
+            except TimeoutError:
+                return []
+
+
+class EventHub:
+    """
+    Fan-out of new order events to the clients waiting on them in this process.
+
+    One daemon thread polls the event table for settled ids past the last one
+    it has seen and keeps the newest ``BUFFER_SIZE`` events in memory; subscriptions
+    are woken up and pick their events from that buffer, so the number of
+    waiting clients doesn't change the database load. Writes made in this
+    process poke the poller on commit, those of other processes are picked up
+    within ``POLL_INTERVAL``. The thread stops polling while nobody listens.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscriptions = set()
+        self._events = deque()
+        self._floor = None
+        self._thread = None
+        self.last_id = None
+
+    async def subscribe(self, user_id, cursor):
+        subscription = Subscription(self, user_id, cursor)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shop-order-events', daemon=True)
+                self._thread.start()
+        if self.last_id is None:
+            await sync_to_async(self._prime)()
+        self._wake.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+            if not self._subscriptions:
+                # Let the poller go idle and close its connection.
+                self._wake.set()
+
+    def poke(self):
+        self._wake.set()
+
+    def take(self, subscription):
+        """
+        Buffered events of the subscription's user newer than its position,
+        or None if the buffer no longer reaches back that far.
+        """
+        with self._lock:
+            if subscription.position is None or self._floor is None or subscription.position < self._floor:
+                return None
+            events = []
+            for user_id, event in reversed(self._events):
+                if event['id'] <= subscription.position:
+                    break
+                if user_id == subscription.user_id:
+                    events.append(event)
+            subscription.position = self.last_id
+        return events[::-1]
+
+    def _prime(self):
+        if self.last_id is None:
+            last_id = settled_id()
+            with self._lock:
+                if self.last_id is None:
+                    self.last_id = self._floor = last_id
+
+    def _run(self):
+        idle = False
+        while True:
+            self._wake.wait(None if idle else get_config()['POLL_INTERVAL'])
+            self._wake.clear()
+            with self._lock:
+                idle = not self._subscriptions
+                if idle:
+                    self._events.clear()
+                    self.last_id = self._floor = None
+            if idle:
+                connections.close_all()
+                continue
+            close_old_connections()
+            try:
+                self._poll()
+            except DatabaseError:
+                logger.exception('Failed to poll order events')
+
+    def _poll(self):
+        config = get_config()
+        self._prime()
+        edge = grace_edge()
+        while True:
+            rows = settled(list(
+                OrderStatusEvent.objects.using(DEFAULT_DB_ALIAS)
+                .filter(id__gt=self.last_id).order_by('id')[:config['BATCH_SIZE']]
+            ), self.last_id, edge)
+            if not rows:
+                return
+            events = OrderStatusEventSerializer(rows, many=True).data
+            with self._lock:
+                self._events.extend(zip((row.user_id for row in rows), events))
+                while len(self._events) > config['BUFFER_SIZE']:
+                    self._floor = self._events.popleft()[1]['id']
+                self.last_id = rows[-1].id
+                subscriptions = list(self._subscriptions)
+            for subscription in subscriptions:
+                subscription.notify()
+            if len(rows) < config['BATCH_SIZE']:
+                return
+
+
+hub = EventHub()
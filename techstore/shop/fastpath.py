@@ -0,0 +1,142 @@
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from shop.images import srcset_from_variants
+from shop.metrics import current_metrics
+from shop.models import Product
+from shop.serializers import (
+    CartProductSerializer,
+    CategorySerializer,
+    OrderSerializer,
+    ProductSerializer,
+)
+
+# Fields whose to_representation() returns database values of these types unchanged.
+PASSTHROUGH_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+def _constant(converter):
+    return lambda: converter
+
+
+def _decimal_converter(field):
+    """``DecimalField.to_representation`` for values already stored at the field's scale."""
+    places = field.decimal_places
+    if (not places or field.max_digits is None or field.normalize_output or field.localize
+            or not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)):
+        return _constant(field.to_representation)
+    max_adjusted = field.max_digits - places
+
+    def convert(value):
+        if type(value) is Decimal and value.adjusted() < max_adjusted:
+            text = format(value, 'f')
+            # Quantizing is a no-op when the value has exactly ``places`` decimals.
+            if text[-places - 1] == '.':
+                return text
+        return field.to_representation(value)
+    return _constant(convert)
+
+
+def _datetime_converter(field):
+    """``DateTimeField.to_representation`` with the timezone looked up once per response."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() == ISO_8601:
+        return _constant(field.to_representation)
+
+    def make():
+        tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if tz is None:
+            return field.to_representation
+
+        def convert(value):
+            if timezone.is_aware(value):
+                return value.astimezone(tz).strftime(output_format)
+            return field.to_representation(value)
+        return convert
+    return make
+
+
+def compile_field(field):
+    """A factory for the converter of one field, called once per serialized list."""
+    if type(field) in PASSTHROUGH_FIELDS:
+        return None
+    if type(field) is serializers.DecimalField:
+        return _decimal_converter(field)
+    if type(field) is serializers.DateTimeField:
+        return _datetime_converter(field)
+    return _constant(field.to_representation)
+
+
+class ValuesListSerializer:
+    """
+    Read-only ``many=True`` path for a plain ``Serializer``: rows are fetched with
+    ``values_list`` and turned into dicts by converters compiled once from the
+    serializer's own fields, skipping DRF's per-row field binding and attribute
+    lookups. The output is identical to ``serializer_class(rows, many=True).data``.
+
+    ``overrides`` maps a field name to ``(column, converter)`` for fields that
+    don't read a single column as is (method fields, files).
+    """
+
+    def __init__(self, serializer_class, **overrides):
+        self.keys = []
+        self.columns = []
+        self.converters = []
+        for name, field in serializer_class().fields.items():
+            if name in overrides:
+                column, converter = overrides[name]
+                make = _constant(converter)
+            elif isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField)) or field.source == '*':
+                raise ImproperlyConfigured('%s.%s needs an override' % (serializer_class.__name__, name))
+            else:
+                column = field.source.replace('.', '__')
+                make = compile_field(field)
+            self.keys.append(name)
+            self.columns.append(column)
+            if make is not None:
+                self.converters.append((len(self.keys) - 1, make))
+        self.keys = tuple(self.keys)
+        # The id column doubles as the pagination key.
+        if 'id' not in self.columns:
+            self.columns.append('id')
+
+    def rows(self, queryset):
+        """``queryset`` as named tuples carrying the serialized columns."""
+        return queryset.values_list(*self.columns, named=True)
+
+    def serialize(self, rows):
+        metrics = current_metrics.get()
+        start = time.perf_counter()
+        keys = self.keys
+        converters = [(index, make()) for index, make in self.converters]
+        data = []
+        for row in rows:
+            values = list(row)
+            for index, converter in converters:
+                # None is passed through like Serializer.to_representation does.
+                if values[index] is not None:
+                    values[index] = converter(values[index])
+            data.append(dict(zip(keys, values)))
+        if metrics is not None:
+            metrics.serializer_time += time.perf_counter() - start
+        return data
+
+
+def _photo_url(storage):
+    # ImageField.to_representation without a request in the context.
+    return lambda name: storage.url(name) if name else None
+
+
+products = ValuesListSerializer(
+    ProductSerializer,
+    photo=('photo', _photo_url(Product._meta.get_field('photo').storage)),
+    photo_srcset=('photoVariants', srcset_from_variants),
+)
+categories = ValuesListSerializer(CategorySerializer)
+cart_products = ValuesListSerializer(CartProductSerializer)
+orders = ValuesListSerializer(OrderSerializer)
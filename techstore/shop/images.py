@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from shop.cache import bump_version
+from shop.models import Product
+
+logger = logging.getLogger(__name__)
+
+FORMATS = (
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+)
+
+# Sent with ``product_id`` once new variants are saved; the row is written with
+# update(), so post_save doesn't fire.
+variants_saved = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    config = {'WIDTHS': [320, 640, 1280], 'WORKERS': 2, 'QUALITY': 80}
+    config.update(getattr(settings, 'SHOP_IMAGE_VARIANTS', {}))
+    return config
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_config()['WORKERS'], thread_name_prefix='shop-images'
+                )
+    return _executor
+
+
+def schedule_variants(product, stale=None):
+    """
+    Queue resized variants of ``product.photo`` once the current transaction
+    commits. With ``WORKERS`` set to 0 they are generated inline instead.
+    ``stale`` variants, those of the photo it replaced, are deleted once the
+    new ones are stored.
+    """
+    product_id, photo_name = product.pk, product.photo.name
+    if not photo_name:
+        if stale:
+            transaction.on_commit(lambda: delete_variants(stale))
+        return
+
+    def submit():
+        if get_config()['WORKERS'] > 0:
+            get_executor().submit(_run_in_worker, product_id, photo_name, stale)
+        else:
+            generate_variants(product_id, photo_name, stale)
+
+    transaction.on_commit(submit)
+
+
+def _run_in_worker(product_id, photo_name, stale=None):
+    try:
+        generate_variants(product_id, photo_name, stale)
+    except Exception:
+        logger.exception('Failed to generate image variants for product %s', product_id)
+    finally:
+        connection.close()
+
+
+def delete_variants(variants):
+    """Remove the files of a ``photoVariants`` value from storage."""
+    for files in (variants or {}).values():
+        for variant in files:
+            default_storage.delete(variant['name'])
+
+
+def generate_variants(product_id, photo_name, stale=None):
+    try:
+        return _generate_variants(product_id, photo_name)
+    finally:
+        # Whether or not the new set made it, nothing refers to these any more.
+        delete_variants(stale)
+
+
+def _generate_variants(product_id, photo_name):
+    # Pillow is only needed by the variant workers, not to boot a web process.
+    from PIL import Image, ImageOps
+
+    config = get_config()
+    with default_storage.open(photo_name) as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    widths = sorted({width for width in config['WIDTHS'] if width < image.width} or {image.width})
+    stem = os.path.splitext(os.path.basename(photo_name))[0]
+    variants = {extension: [] for extension, _ in FORMATS}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for extension, image_format in FORMATS:
+            buffer = BytesIO()
+            output = resized.convert('RGB') if image_format == 'JPEG' else resized
+            output.save(buffer, image_format, quality=config['QUALITY'], optimize=True)
+            name = default_storage.save(
+                'products/variants/%s/%s-%sw.%s' % (product_id, stem, width, extension),
+                ContentFile(buffer.getvalue()),
+            )
+            variants[extension].append({'name': name, 'width': width, 'height': height})
+
+    previous = Product.objects.filter(pk=product_id).values_list('photoVariants', flat=True).first()
+    updated = Product.objects.filter(pk=product_id, photo=photo_name).update(photoVariants=variants)
+    delete_variants(variants if not updated else previous)
+    if updated:
+        bump_version(Product)
+        variants_saved.send(sender=Product, product_id=product_id)
+    return variants
+
+
+def get_srcset(product):
+    """Map each format to an ``<img srcset>`` value, e.g. ``{'webp': 'a.webp 320w, b.webp 640w'}``."""
+    return srcset_from_variants(product.photoVariants)
+
+
+def srcset_from_variants(variants):
+    return {
+        extension: ', '.join('%s %sw' % (default_storage.url(v['name']), v['width']) for v in files)
+        for extension, files in (variants or {}).items()
+        if files
+    }
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shop.analytics import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the revenue, product sales and delivery status rollups from existing orders.'
+
+    def handle(self, *args, **options):
+        counts = backfill()
+        self.stdout.write(self.style.SUCCESS(
+            'Rebuilt %(days)d days, %(products)d products and %(statuses)d delivery statuses.' % counts
+        ))
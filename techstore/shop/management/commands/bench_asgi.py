@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop.bench import Timer, summarize, sync_only_middleware
+
+ENDPOINTS = {
+    'products': ('/shop/api/v1/products/', '/shop/api/v1/async/products/', False),
+    'categories': ('/shop/api/v1/categories/', '/shop/api/v1/async/categories/', True),
+    'cartproducts': ('/shop/api/v1/cartproducts/', '/shop/api/v1/async/cartproducts/', True),
+    'orders': ('/shop/api/v1/orders/', '/shop/api/v1/async/orders/', True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the WSGI views (thread per in-flight request) with their async '
+        'ASGI counterparts under concurrent load, in-process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), action='append',
+                            help='Endpoint to benchmark; repeat for several (default: all usable).')
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--username', help='User to authenticate as for endpoints that require it.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        adapted = sync_only_middleware()
+        if adapted:
+            raise CommandError(
+                'The ASGI side would be measured on threads, these middleware are sync-only: %s'
+                % ', '.join(adapted)
+            )
+        headers = {}
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError('User "%s" does not exist' % options['username'])
+            headers['Authorization'] = 'Bearer %s' % RefreshToken.for_user(user).access_token
+        names = options['endpoint'] or [
+            name for name, (_, _, auth) in ENDPOINTS.items() if 'Authorization' in headers or not auth
+        ]
+
+        results = {}
+        # Every request comes from one client, which the rate limits would soon cut off.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            SHOP_THROTTLE={**settings.SHOP_THROTTLE, 'RATES': {}},
+        ):
+            for name in names:
+                sync_path, async_path, auth = ENDPOINTS[name]
+                if auth and 'Authorization' not in headers:
+                    raise CommandError('--username is required to benchmark %s' % name)
+                results[name] = {
+                    'wsgi': self.run_wsgi(sync_path, headers, options['requests'], options['concurrency']),
+                    'asgi': asyncio.run(
+                        self.run_asgi(async_path, headers, options['requests'], options['concurrency'])
+                    ),
+                }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            for mode in ('wsgi', 'asgi'):
+                r = result[mode]
+                self.stdout.write('%-13s %s  %8.1f req/s  p50 %8.2f ms  p99 %8.2f ms  errors %d' % (
+                    name, mode, r['throughput_rps'], r['p50_ms'], r['p99_ms'], r['errors']))
+
+    def run_wsgi(self, path, headers, requests, concurrency):
+        def worker(count):
+            client = Client()
+            latencies, errors = [], 0
+            try:
+                for _ in range(count):
+                    start = time.perf_counter()
+                    response = client.get(path, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                    errors += response.status_code != 200
+            finally:
+                connection.close()
+            return latencies, errors
+
+        with Timer() as timer, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            chunks = list(pool.map(worker, self.split(requests, concurrency)))
+        return summarize([l for c, _ in chunks for l in c], timer.elapsed, sum(e for _, e in chunks))
+
+    async def run_asgi(self, path, headers, requests, concurrency):
+        client = AsyncClient()
+
+        async def worker(count):
+            latencies, errors = [], 0
+            for _ in range(count):
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+            return latencies, errors
+
+        with Timer() as timer:
+            chunks = await asyncio.gather(*(worker(count) for count in self.split(requests, concurrency)))
+        return summarize([l for c, _ in chunks for l in c], timer.elapsed, sum(e for _, e in chunks))
+
+    @staticmethod
+    def split(total, parts):
+        return [total // parts + (1 if i < total % parts else 0) for i in range(parts) if total // parts or i < total]
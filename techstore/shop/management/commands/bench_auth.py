@@ -0,0 +1,72 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop.authentication import CachedJWTAuthentication, forget_user, get_user_cache
+from shop.bench import ADMIN_USERNAME, Timer, summarize
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the per-request cost of authenticating a bearer token with the stock '
+        'JWTAuthentication and with CachedJWTAuthentication (cache hits and misses).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--username', default=ADMIN_USERNAME,
+                            help='User to issue the token for (default: the seeded benchmark admin).')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User "%s" does not exist' % options['username'])
+        if get_user_cache() is None:
+            raise CommandError('SHOP_AUTH_CACHE has no BACKEND configured')
+        header = 'Bearer %s' % RefreshToken.for_user(user).access_token
+        factory = RequestFactory()
+
+        def run(authentication, before=None):
+            latencies, queries = [], 0
+            for _ in range(options['requests']):
+                if before is not None:
+                    before()
+                request = Request(factory.get('/', HTTP_AUTHORIZATION=header), authenticators=[authentication])
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.perf_counter()
+                    request.user
+                    latencies.append(time.perf_counter() - start)
+                queries += len(captured)
+            return latencies, queries
+
+        results = {}
+        modes = (
+            ('jwt', JWTAuthentication(), None),
+            ('cached_miss', CachedJWTAuthentication(), lambda: forget_user(user.pk)),
+            ('cached_hit', CachedJWTAuthentication(), None),
+        )
+        for name, authentication, before in modes:
+            run(authentication, before)  # warm up
+            with Timer() as timer:
+                latencies, queries = run(authentication, before)
+            results[name] = {
+                **summarize(latencies, timer.elapsed),
+                'queries_per_request': round(queries / options['requests'], 2),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, r in results.items():
+            self.stdout.write('%-12s mean %8.1f us  p50 %8.1f us  p99 %8.1f us  queries %.2f' % (
+                name, r['mean_ms'] * 1000, r['p50_ms'] * 1000, r['p99_ms'] * 1000, r['queries_per_request']))
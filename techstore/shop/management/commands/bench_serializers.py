@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from shop import fastpath
+from shop.models import CartProduct, Category, Order, Product
+from shop.renderers import FastJSONRenderer, orjson
+from shop.serializers import CartProductSerializer, CategorySerializer, OrderSerializer, ProductSerializer
+
+TARGETS = {
+    'products': (Product, ProductSerializer, fastpath.products),
+    'categories': (Category, CategorySerializer, fastpath.categories),
+    'cartproducts': (CartProduct, CartProductSerializer, fastpath.cart_products),
+    'orders': (Order, OrderSerializer, fastpath.orders),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare DRF serializers plus JSONRenderer with the values_list fast path plus '
+        'FastJSONRenderer on the same rows, checking that both produce identical bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), action='append',
+                            help='Model to benchmark; repeat for several (default: all).')
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per response.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        results = {}
+        for name in options['target'] or TARGETS:
+            model, serializer_class, fast = TARGETS[name]
+            queryset = model.objects.order_by('id')[:options['rows']]
+            if not queryset.exists():
+                self.stderr.write('Skipping %s: no rows (run seed_bench_data).' % name)
+                continue
+            drf_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+
+            def drf():
+                return drf_renderer.render(serializer_class(list(queryset), many=True).data)
+
+            def fast_path():
+                return fast_renderer.render(fast.serialize(list(fast.rows(queryset))))
+
+            if drf() != fast_path():
+                raise CommandError('Fast path output differs from %s' % serializer_class.__name__)
+            results[name] = {
+                'rows': queryset.count(),
+                'drf_ms': self.measure(drf, options['repeat']),
+                'fast_ms': self.measure(fast_path, options['repeat']),
+            }
+            results[name]['speedup'] = round(results[name]['drf_ms'] / results[name]['fast_ms'], 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('renderer: %s' % ('orjson' if orjson is not None else 'json (orjson not installed)'))
+        for name, r in results.items():
+            self.stdout.write('%-13s %5d rows  drf %8.2f ms  fast %8.2f ms  x%.2f' % (
+                name, r['rows'], r['drf_ms'], r['fast_ms'], r['speedup']))
+
+    @staticmethod
+    def measure(func, repeat):
+        """Median milliseconds per call, database fetch included."""
+        func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return round(statistics.median(timings) * 1000, 3)
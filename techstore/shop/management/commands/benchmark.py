@@ -0,0 +1,379 @@
+import io
+import json
+import platform
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop.bench import ADMIN_USERNAME, PREFIX, WORDS, Timer, summarize
+from shop.metrics import RequestMetrics
+from shop.models import CartProduct, DeliveryStatus, Order, Product, ShopAddress
+from shop.services import apply_cart_deltas
+
+TRANSPORTS = ('client', 'http')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Route:
+    """One request to benchmark; ``path`` and ``data`` are formatted with the seeded fixture ids."""
+
+    def __init__(self, name, path, method='GET', auth='user', data=None, multipart=False,
+                 expected=(200,), prepare=None, write=False):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.auth = auth
+        self.data = data
+        self.multipart = multipart
+        self.expected = expected
+        self.prepare = prepare
+        self.write = write or prepare is not None
+
+    def build(self, fixtures):
+        """Return ``(path, body, content_type)`` for the next request."""
+        values = dict(fixtures)
+        if self.prepare is not None:
+            values.update(self.prepare(fixtures))
+        path = self.path.format(**values)
+        data = self.data(values) if callable(self.data) else self.data
+        if data is None:
+            return path, b'', None
+        if self.multipart:
+            return path, encode_multipart(BOUNDARY, data), MULTIPART_CONTENT
+        return path, json.dumps(data).encode(), 'application/json'
+
+
+def add_to_cart(fixtures):
+    cart = apply_cart_deltas(fixtures['user_id'], {fixtures['product_id']: 1})
+    line = CartProduct.objects.get(cart=cart, product_id=fixtures['product_id'])
+    return {'line_id': line.pk}
+
+
+def create_product(fixtures):
+    product = Product.objects.create(
+        name='%sbulk-delete-%d' % (PREFIX, time.time_ns()), price='1.00', category_id=fixtures['category_id'],
+    )
+    return {'new_product_id': product.pk}
+
+
+def import_file(fixtures):
+    names = Product.objects.filter(name__startswith=PREFIX).order_by('id').values_list('name', 'price')[:50]
+    rows = ['name,price,category_id'] + ['"%s",%s,%s' % (name, price, fixtures['category_id']) for name, price in names]
+    stream = io.BytesIO('\n'.join(rows).encode())
+    stream.name = 'products.csv'
+    return {'model': 'product', 'file': stream}
+
+
+ROUTES = [
+    Route('products.list', '/shop/api/v1/products/', auth=None),
+    Route('products.list_filtered', '/shop/api/v1/products/?category_id={category_id}&ordering=price', auth=None),
+    Route('products.search', '/shop/api/v1/products/search/?q={search}', auth=None),
+    Route('products.detail', '/shop/api/v1/products/{product_id}/'),
+    Route('categories.list', '/shop/api/v1/categories/'),
+    Route('categories.detail', '/shop/api/v1/categories/{category_id}/'),
+    Route('categories.tree', '/shop/api/v1/categories/tree/', auth=None),
+    Route('products.stock', '/shop/api/v1/products/{product_id}/stock/', auth='admin'),
+    Route('catalog.snapshot', '/shop/api/v1/catalog/snapshot/', auth=None),
+    Route('catalog.snapshot_category', '/shop/api/v1/catalog/snapshot/?category_id={category_id}', auth=None),
+    Route('catalog.export', '/shop/api/v1/catalog/export/?model=category', auth='admin'),
+    Route('cartproducts.list', '/shop/api/v1/cartproducts/'),
+    Route('cartproducts.list_expanded', '/shop/api/v1/cartproducts/?expand=true'),
+    Route('shopaddresses.list', '/shop/api/v1/shopaddresses/'),
+    Route('shopaddresses.detail', '/shop/api/v1/shopaddresses/{shop_address_id}/'),
+    Route('deliverystatuses.list', '/shop/api/v1/deliverystatuses/'),
+    Route('deliverystatuses.detail', '/shop/api/v1/deliverystatuses/{delivery_status_id}/'),
+    Route('orders.list', '/shop/api/v1/orders/'),
+    Route('orders.list_expanded', '/shop/api/v1/orders/?expand=true'),
+    Route('orders.list_oldest', '/shop/api/v1/orders/?ordering=date'),
+    Route('orders.detail', '/shop/api/v1/orders/{order_id}/'),
+    Route('orders.all', '/shop/api/v1/orders/all/', auth='admin'),
+    Route('orders.all_by_status', '/shop/api/v1/orders/all/?deliveryStatus_id={delivery_status_id}', auth='admin'),
+    Route('analytics.revenue', '/shop/api/v1/analytics/revenue/', auth='admin'),
+    Route('analytics.products', '/shop/api/v1/analytics/products/', auth='admin'),
+    Route('analytics.categories', '/shop/api/v1/analytics/categories/', auth='admin'),
+    Route('analytics.deliverystatuses', '/shop/api/v1/analytics/deliverystatuses/', auth='admin'),
+    Route('metrics', '/shop/api/v1/metrics/', auth='admin'),
+    Route('async.products.list', '/shop/api/v1/async/products/', auth=None),
+    Route('async.products.detail', '/shop/api/v1/async/products/{product_id}/'),
+    Route('async.categories.list', '/shop/api/v1/async/categories/'),
+    Route('async.cartproducts.list', '/shop/api/v1/async/cartproducts/'),
+    Route('async.orders.list', '/shop/api/v1/async/orders/'),
+    Route('async.orders.changes', '/shop/api/v1/async/orders/changes/'),
+    Route('cartproducts.add', '/shop/api/v1/cartproducts/', method='POST', write=True,
+          data=lambda f: {'product_id': f['product_id'], 'amount': 1}, expected=(201,)),
+    Route('cartproducts.bulk', '/shop/api/v1/cartproducts/bulk/', method='POST', write=True,
+          data=lambda f: {'items': [{'product_id': f['product_id'], 'amount': 1}]}),
+    Route('cartproducts.delete', '/shop/api/v1/cartproducts/{line_id}/', method='DELETE',
+          prepare=add_to_cart, expected=(204,)),
+    Route('orders.checkout', '/shop/api/v1/orders/', method='POST', prepare=add_to_cart,
+          data=lambda f: {'deliveryType': True, 'shopAddress_id': f['shop_address_id']}, expected=(201,)),
+    Route('orders.status_bulk', '/shop/api/v1/orders/status/', method='POST', auth='admin', write=True,
+          data=lambda f: {'order_ids': [f['order_id']], 'deliveryStatus_id': f['delivery_status_id']}),
+    Route('products.update', '/shop/api/v1/products/{product_id}/', method='PUT', write=True,
+          data=lambda f: {'description': '%sproduct description' % PREFIX}),
+    Route('products.bulk_update', '/shop/api/v1/products/bulk/update/', method='POST', auth='admin', write=True,
+          data=lambda f: {'category_id': f['category_id'], 'price_delta': '0.00'}),
+    Route('products.bulk_delete', '/shop/api/v1/products/bulk/delete/', method='POST', auth='admin',
+          prepare=create_product, data=lambda f: {'ids': [f['new_product_id']]}),
+    Route('shopaddresses.update', '/shop/api/v1/shopaddresses/{shop_address_id}/', method='PUT', write=True,
+          data=lambda f: {'address': '%sshop address' % PREFIX}),
+    Route('catalog.import', '/shop/api/v1/catalog/import/', method='POST', auth='admin', write=True,
+          data=import_file, multipart=True),
+]
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every shop endpoint against data created by seed_bench_data, through the '
+        'Django test client and a local threaded HTTP server. Reports throughput, latency '
+        'percentiles and queries per request, optionally compared with a saved baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads for the HTTP transport.')
+        parser.add_argument('--transport', choices=TRANSPORTS, action='append',
+                            help='Repeat for several (default: both).')
+        parser.add_argument('--route', action='append',
+                            help='Only run routes whose name starts with this prefix; repeatable.')
+        parser.add_argument('--writes', action='store_true', help='Also run routes that modify data.')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='JSON file from an earlier run to compare against.')
+        parser.add_argument('--max-regression', type=float,
+                            help='Fail if any p95 latency grew by more than this percentage over the '
+                                 'baseline, or any route runs more queries per request.')
+
+    def handle(self, *args, **options):
+        fixtures = self.load_fixtures()
+        routes = [
+            route for route in ROUTES
+            if (options['writes'] or not route.write)
+            and (not options['route'] or any(route.name.startswith(prefix) for prefix in options['route']))
+        ]
+        if not routes:
+            raise CommandError('No routes selected.')
+
+        results = {}
+        # Every request comes from one client, which the rate limits would soon cut off.
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver', '127.0.0.1'],
+            SHOP_THROTTLE={**settings.SHOP_THROTTLE, 'RATES': {}},
+        ):
+            for transport in options['transport'] or TRANSPORTS:
+                run = self.run_client if transport == 'client' else self.run_http
+                results[transport] = run(routes, fixtures, options)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'products': Product.objects.count(),
+            },
+            'results': results,
+        }
+        self.print_results(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write('Results written to %s' % options['output'])
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_regression'])
+
+    def load_fixtures(self):
+        user = User.objects.filter(username__startswith=PREFIX + 'user-').order_by('id').first()
+        admin = User.objects.filter(username=ADMIN_USERNAME).first()
+        product = Product.objects.filter(name__startswith=PREFIX).order_by('id').first()
+        if user is None or admin is None or product is None:
+            raise CommandError('No benchmark data found, run seed_bench_data first.')
+        order = Order.objects.filter(user=user).order_by('id').first()
+        return {
+            'user_id': user.pk,
+            'product_id': product.pk,
+            'category_id': product.category_id,
+            'shop_address_id': ShopAddress.objects.filter(address__startswith=PREFIX).values_list('id', flat=True).first(),
+            'delivery_status_id': DeliveryStatus.objects.filter(name__startswith=PREFIX).values_list('id', flat=True).first(),
+            'order_id': order.pk if order else 0,
+            'search': WORDS[0],
+            'tokens': {
+                'user': 'Bearer %s' % RefreshToken.for_user(user).access_token,
+                'admin': 'Bearer %s' % RefreshToken.for_user(admin).access_token,
+            },
+        }
+
+    def headers(self, route, fixtures):
+        return {'Authorization': fixtures['tokens'][route.auth]} if route.auth else {}
+
+    def run_client(self, routes, fixtures, options):
+        client = Client(raise_request_exception=False)
+        results = {}
+        for route in routes:
+            headers = self.headers(route, fixtures)
+            for _ in range(options['warmup']):
+                path, body, content_type = route.build(fixtures)
+                client.generic(route.method, path, body, content_type or 'application/octet-stream', headers=headers)
+            latencies, queries, errors = [], 0, 0
+            with Timer() as timer:
+                for _ in range(options['requests']):
+                    path, body, content_type = route.build(fixtures)
+                    metrics = RequestMetrics()
+                    with ExitStack() as stack:
+                        for conn in connections.all():
+                            stack.enter_context(conn.execute_wrapper(metrics))
+                        start = time.perf_counter()
+                        response = client.generic(route.method, path, body, content_type or 'application/octet-stream', headers=headers)
+                        latencies.append(time.perf_counter() - start)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    queries += metrics.queries
+                    errors += response.status_code not in route.expected
+            results[route.name] = self.result(route, latencies, timer.elapsed, errors, queries)
+            self.stdout.write('client %-28s done' % route.name)
+        return results
+
+    def run_http(self, routes, fixtures, options):
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = 'http://127.0.0.1:%d' % server.server_port
+        results = {}
+        try:
+            for route in routes:
+                headers = self.headers(route, fixtures)
+                for _ in range(options['warmup']):
+                    self.http_request(base_url, route, fixtures, headers)
+                # Routes with a prepare step set up state for exactly one request, and SQLite
+                # allows a single writer, so those run serially.
+                serial = route.prepare or (route.write and connection.vendor == 'sqlite')
+                concurrency = 1 if serial else options['concurrency']
+
+                def worker(count):
+                    latencies, queries, errors = [], [], 0
+                    try:
+                        for _ in range(count):
+                            latency, status, query_count = self.http_request(base_url, route, fixtures, headers)
+                            latencies.append(latency)
+                            if query_count is not None:
+                                queries.append(query_count)
+                            errors += status not in route.expected
+                    finally:
+                        connection.close()
+                    return latencies, queries, errors
+
+                with Timer() as timer, ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    chunks = list(pool.map(worker, self.split(options['requests'], concurrency)))
+                queries = [q for _, c, _ in chunks for q in c]
+                results[route.name] = self.result(
+                    route, [l for c, _, _ in chunks for l in c], timer.elapsed,
+                    sum(e for _, _, e in chunks), sum(queries) if queries else None,
+                )
+                self.stdout.write('http   %-28s done' % route.name)
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def http_request(self, base_url, route, fixtures, headers):
+        path, body, content_type = route.build(fixtures)
+        request = urllib.request.Request(base_url + path, data=body or None, method=route.method, headers=headers)
+        if content_type:
+            request.add_header('Content-Type', content_type)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as e:
+            e.read()
+            status, timing = e.code, e.headers.get('Server-Timing', '')
+        latency = time.perf_counter() - start
+        match = SERVER_TIMING_QUERIES.search(timing)
+        return latency, status, int(match.group(1)) if match else None
+
+    def result(self, route, latencies, elapsed, errors, queries):
+        result = {'method': route.method, 'path': route.path, **summarize(latencies, elapsed, errors)}
+        result['queries_per_request'] = round(queries / len(latencies), 2) if queries is not None and latencies else None
+        return result
+
+    def print_results(self, results):
+        for transport, routes in results.items():
+            self.stdout.write('\n%s' % transport)
+            self.stdout.write('%-28s %10s %9s %9s %9s %8s %7s' % ('route', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'))
+            for name, r in routes.items():
+                self.stdout.write('%-28s %10.1f %9.2f %9.2f %9.2f %8s %7d' % (
+                    name, r['throughput_rps'], r['p50_ms'], r['p95_ms'], r['p99_ms'],
+                    '-' if r['queries_per_request'] is None else r['queries_per_request'], r['errors'],
+                ))
+
+    def compare(self, results, path, max_regression):
+        try:
+            with open(path, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError('Cannot read baseline %s: %s' % (path, e))
+
+        regressions = []
+        for transport, routes in results.items():
+            self.stdout.write('\n%s vs baseline' % transport)
+            self.stdout.write('%-28s %10s %10s %10s %14s' % ('route', 'req/s', 'p50', 'p95', 'queries'))
+            for name, r in routes.items():
+                old = baseline.get(transport, {}).get(name)
+                if old is None:
+                    self.stdout.write('%-28s %s' % (name, 'new'))
+                    continue
+                p95_change = self.change(old['p95_ms'], r['p95_ms'])
+                self.stdout.write('%-28s %10s %10s %10s %14s' % (
+                    name,
+                    self.format_change(self.change(old['throughput_rps'], r['throughput_rps'])),
+                    self.format_change(self.change(old['p50_ms'], r['p50_ms'])),
+                    self.format_change(p95_change),
+                    '%s -> %s' % (old.get('queries_per_request'), r['queries_per_request']),
+                ))
+                if max_regression is None:
+                    continue
+                if p95_change is not None and p95_change > max_regression:
+                    regressions.append('%s %s: p95 %+.1f%%' % (transport, name, p95_change))
+                if None not in (old.get('queries_per_request'), r['queries_per_request']) \
+                        and r['queries_per_request'] > old['queries_per_request']:
+                    regressions.append('%s %s: %s -> %s queries per request' % (
+                        transport, name, old['queries_per_request'], r['queries_per_request']))
+        if regressions:
+            raise CommandError('Regressions against %s:\n  %s' % (path, '\n  '.join(regressions)))
+
+    @staticmethod
+    def change(old, new):
+        return (new - old) / old * 100 if old else None
+
+    @staticmethod
+    def format_change(change):
+        return '-' if change is None else '%+.1f%%' % change
+
+    @staticmethod
+    def split(total, parts):
+        return [total // parts + (1 if i < total % parts else 0) for i in range(parts) if total // parts or i < total]
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.snapshots import FULL_CATALOG, build, get_config
+
+
+class Command(BaseCommand):
+    help = (
+        'Render the catalog snapshots served by /api/v1/catalog/snapshot/. Run it on deploy '
+        'and after bulk changes made outside the web processes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', type=int, action='append', dest='categories',
+                            help='Only rebuild this category (and the full catalog); repeatable.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        manifest = build(options['categories'])
+        entry = manifest['entries'][FULL_CATALOG]
+        self.stdout.write('Wrote %d snapshots to %s in %.2f s; full catalog %d bytes (%s).' % (
+            len(manifest['entries']), get_config()['DIR'], time.perf_counter() - start, entry['size'],
+            ', '.join(sorted(entry['files'])),
+        ))
@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.services import archive_purchased_carts, delete_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the lines of purchased carts (kept as order line snapshots) and open carts '
+        'abandoned for longer than SHOP_CARTS allows, in small transactions. Safe to stop '
+        'and rerun; --after-id resumes a run from the last cart id it reported.'
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'SHOP_CARTS', {})
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--abandoned-days', type=int, default=config.get('ABANDONED_DAYS', 30),
+                            help='Delete open carts untouched for this many days.')
+        parser.add_argument('--empty-days', type=int, default=config.get('EMPTY_DAYS', 1),
+                            help='Delete empty open carts untouched for this many days.')
+        parser.add_argument('--after-id', type=int, default=0, help='Only look at carts with a larger id.')
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, to go easy on a busy database.')
+        parser.add_argument('--skip-archive', action='store_true', help="Don't touch purchased carts.")
+        parser.add_argument('--skip-abandoned', action='store_true', help="Don't delete open carts.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if not options['skip_archive']:
+            lines = 0
+            for last_id, deleted in archive_purchased_carts(options['batch_size'], options['after_id']):
+                lines += deleted
+                self.progress('Archived purchased carts up to id %d: %d lines deleted.' % (last_id, lines), options)
+            self.stdout.write('Deleted %d lines of purchased carts.' % lines)
+
+        if not options['skip_abandoned']:
+            now = timezone.now()
+            carts = released = 0
+            batches = delete_abandoned_carts(
+                now - timedelta(days=options['abandoned_days']),
+                now - timedelta(days=options['empty_days']),
+                batch_size=options['batch_size'],
+                after_id=options['after_id'],
+            )
+            for last_id, deleted, reservations in batches:
+                carts += deleted
+                released += reservations
+                self.progress('Deleted abandoned carts up to id %d: %d carts.' % (last_id, carts), options)
+            self.stdout.write('Deleted %d abandoned carts, released %d reservations.' % (carts, released))
+        self.stdout.write('Done in %.1f s.' % (time.perf_counter() - start))
+
+    def progress(self, message, options):
+        if options['verbosity']:
+            self.stdout.write(message)
+        if options['pause']:
+            time.sleep(options['pause'])
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from shop.catalog_io import FORMATS, export_catalog, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Stream categories or products to a CSV or JSONL file (or stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=['category', 'product'])
+        parser.add_argument('--output', help='Defaults to stdout.')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the output extension, else csv.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['output'] or '')
+        if not options['output']:
+            for chunk in export_catalog(options['model'], fmt):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in export_catalog(options['model'], fmt):
+                f.write(chunk)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from shop.images import generate_variants
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for product photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate variants that already exist.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(photo='').exclude(photo__isnull=True)
+        if not options['all']:
+            products = products.filter(photoVariants={})
+        done = failed = 0
+        for pk, photo in products.values_list('id', 'photo').iterator():
+            try:
+                generate_variants(pk, photo)
+                done += 1
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write('Product %s: %s' % (pk, e))
+        self.stdout.write(self.style.SUCCESS('Generated variants for %d products, %d failed.' % (done, failed)))
@@ -0,0 +1,28 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from shop.schema import generate, get_config
+
+
+class Command(BaseCommand):
+    help = (
+        'Write the OpenAPI schema to SHOP_OPENAPI["SCHEMA_FILE"] (or --output), which '
+        '/swagger.json and the Swagger UI then serve as a static file. Run it on deploy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write, "-" for stdout.')
+        parser.add_argument('--url', help='Base URL of the API written into the schema.')
+
+    def handle(self, *args, **options):
+        content = generate(options['url'])
+        path = options['output'] or get_config()['SCHEMA_FILE']
+        if path == '-':
+            self.stdout.write(content.decode())
+            return
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+        self.stdout.write('Wrote %d bytes to %s.' % (len(content), path))
@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import FORMATS, guess_format, import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Upsert categories or products by name from a CSV or JSONL file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=['category', 'product'])
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--report', help='Write rejected rows to this JSONL file.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+                report = import_catalog(options['model'], stream, fmt, batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(e)
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as f:
+                for error in report.errors:
+                    f.write(json.dumps(error, ensure_ascii=False) + '\n')
+        self.stdout.write(self.style.SUCCESS(
+            'Read %d rows: %d imported, %d failed.' % (report.rows, report.imported, report.failed)
+        ))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from shop.services import reconcile_reserved, release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = 'Give the stock held by expired cart reservations back. Run it from cron, or with --interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=int,
+                            help='Keep running, sweeping every INTERVAL seconds.')
+        parser.add_argument('--reconcile', action='store_true',
+                            help='Also reset reserved counts to the sum of existing reservations.')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_reservations(batch_size=options['batch_size'])
+            self.stdout.write('Released %d expired reservations.' % released)
+            if options['reconcile']:
+                self.stdout.write('Reconciled %d stock rows.' % reconcile_reserved())
+            if not options['interval']:
+                return
+            connection.close()
+            time.sleep(options['interval'])
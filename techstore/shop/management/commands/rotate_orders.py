@@ -0,0 +1,40 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from shop.services import rotate_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Move orders older than SHOP_ORDERS["ARCHIVE_AFTER_DAYS"] (or --days) with their '
+        'lines to the archive tables, oldest first, in small transactions. Safe to stop and rerun.'
+    )
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'SHOP_ORDERS', {})
+        parser.add_argument('--days', type=int, default=config.get('ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive orders placed more than this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0,
+                            help='Seconds to sleep between batches, to go easy on a busy database.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            # Archived orders must stay older than every order placed from now on.
+            raise CommandError('--days must not be negative.')
+        start = time.perf_counter()
+        before = timezone.now() - timedelta(days=options['days'])
+        orders = lines = 0
+        for moved, moved_lines in rotate_orders(before, options['batch_size']):
+            orders += moved
+            lines += moved_lines
+            if options['verbosity'] > 1:
+                self.stdout.write('Archived %d orders so far.' % orders)
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write('Archived %d orders with %d lines placed before %s in %.1f s.' % (
+            orders, lines, before.strftime('%Y-%m-%d %H:%M'), time.perf_counter() - start))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.bench import ADMIN_USERNAME, PASSWORD, clear_seed, has_seed_data, seed
+
+
+class Command(BaseCommand):
+    help = 'Create synthetic categories, products, users, carts and orders for the benchmark command.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--cart-lines', type=int, default=5, help='Lines per open cart and per order.')
+        parser.add_argument('--orders', type=int, default=3, help='Past orders per user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data.')
+        parser.add_argument('--clear', action='store_true', help='Remove existing benchmark data first.')
+        parser.add_argument('--clear-only', action='store_true', help='Remove benchmark data and exit.')
+
+    def handle(self, *args, **options):
+        if options['clear'] or options['clear_only']:
+            clear_seed()
+            self.stdout.write('Removed existing benchmark data.')
+            if options['clear_only']:
+                return
+        if has_seed_data():
+            raise CommandError('Benchmark data already exists, pass --clear to recreate it.')
+        if options['categories'] < 1 or options['products'] < 1 or options['users'] < 1:
+            raise CommandError('--categories, --products and --users must be positive.')
+
+        counts = seed(
+            categories=options['categories'],
+            products=options['products'],
+            users=options['users'],
+            cart_lines=options['cart_lines'],
+            orders=options['orders'],
+            batch_size=options['batch_size'],
+            rng_seed=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded %s. Admin user "%s", password "%s".' % (
+                ', '.join('%d %s' % (count, name.replace('_', ' ')) for name, count in counts.items()),
+                ADMIN_USERNAME, PASSWORD,
+            )
+        ))
@@ -0,0 +1,89 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker does before serving its first request.
+BOOT = '''
+import json, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(json.dumps({'setup_s': setup - start, 'urls_s': time.perf_counter() - setup}))
+'''
+
+
+def parse_importtime(output):
+    """``(module, self_us, cumulative_us)`` rows of ``python -X importtime`` output."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            rows.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+        except (IndexError, ValueError):
+            continue  # The header line.
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Boot the project in a fresh interpreter (django.setup() and the URLconf, as a '
+        'worker does) under "python -X importtime" and report the slowest imports.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help='Rows to show.')
+        parser.add_argument('--sort', choices=('self', 'cumulative'), default='cumulative')
+        parser.add_argument('--by-package', action='store_true',
+                            help='Add up self times per top-level package.')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError('Boot failed:\n%s' % process.stderr[-2000:])
+        timings = json.loads(process.stdout.strip().splitlines()[-1])
+        rows = parse_importtime(process.stderr)
+
+        if options['by_package']:
+            packages = defaultdict(int)
+            for module, self_us, _ in rows:
+                packages[module.split('.')[0]] += self_us
+            modules = [{'module': name, 'self_ms': us / 1000} for name, us in packages.items()]
+            key = 'self_ms'
+        else:
+            modules = [{'module': m, 'self_ms': s / 1000, 'cumulative_ms': c / 1000} for m, s, c in rows]
+            key = options['sort'] + '_ms'
+        modules.sort(key=lambda row: row[key], reverse=True)
+
+        results = {
+            'setup_ms': round(timings['setup_s'] * 1000, 1),
+            'urls_ms': round(timings['urls_s'] * 1000, 1),
+            'imports_ms': round(sum(row[1] for row in rows) / 1000, 1),
+            'modules_imported': len(rows),
+            'modules': modules[:options['limit']],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write('django.setup() %.1f ms, URLconf %.1f ms; %d modules imported in %.1f ms' % (
+            results['setup_ms'], results['urls_ms'], results['modules_imported'], results['imports_ms']))
+        for row in results['modules']:
+            if 'cumulative_ms' in row:
+                self.stdout.write('%9.1f ms %9.1f ms  %s' % (row['cumulative_ms'], row['self_ms'], row['module']))
+            else:
+                self.stdout.write('%9.1f ms  %s' % (row['self_ms'], row['module']))
@@ -0,0 +1,171 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.db.backends.signals import connection_created
+from rest_framework.serializers import BaseSerializer
+
+from shop.cache import get_response_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+current_metrics = ContextVar('shop_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters collected while a single request is being handled."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self._in_serializer = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def track_queries(connection, **kwargs):
+    """
+    Count the queries of ``connection`` against the request being measured.
+
+    The wrapper stays installed for the life of the connection and looks the
+    request up in ``current_metrics``, so queries an async view runs through
+    ``sync_to_async`` on another thread are counted too.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(track_queries)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process per-route aggregates, rendered in Prometheus text format."""
+    histograms = (
+        ('shop_request_duration_seconds', 'Total time spent handling the request.', DURATION_BUCKETS),
+        ('shop_request_db_seconds', 'Time spent executing SQL queries.', DURATION_BUCKETS),
+        ('shop_request_serializer_seconds', 'Time spent in DRF serializer .data.', DURATION_BUCKETS),
+        ('shop_request_queries', 'SQL queries executed per request.', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in self.histograms}
+            self._requests = {}
+
+    def observe(self, route, method, status_code, metrics, duration):
+        labels = (route, method)
+        values = {
+            'shop_request_duration_seconds': duration,
+            'shop_request_db_seconds': metrics.db_time,
+            'shop_request_serializer_seconds': metrics.serializer_time,
+            'shop_request_queries': metrics.queries,
+        }
+        with self._lock:
+            for name, _, buckets in self.histograms:
+                series = self._histograms[name]
+                if labels not in series:
+                    series[labels] = Histogram(buckets)
+                series[labels].observe(values[name])
+            key = (route, method, str(status_code))
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP shop_requests_total Requests handled, by route, method and status.',
+                '# TYPE shop_requests_total counter',
+            ]
+            for (route, method, code), value in sorted(self._requests.items()):
+                lines.append('shop_requests_total{%s} %d' % (_labels(route=route, method=method, status=code), value))
+            for name, help_text, buckets in self.histograms:
+                lines += ['# HELP %s %s' % (name, help_text), '# TYPE %s histogram' % name]
+                for (route, method), histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('%s_bucket{%s} %d' % (name, _labels(route=route, method=method, le=le), cumulative))
+                    labels = _labels(route=route, method=method)
+                    lines.append('%s_sum{%s} %r' % (name, labels, histogram.sum))
+                    lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+        cache = get_response_cache()
+        if cache is not None:
+            stats = cache.stats()
+            for kind in ('hits', 'misses', 'coalesced'):
+                lines += [
+                    '# HELP shop_response_cache_%s_total Response cache %s.' % (kind, kind),
+                    '# TYPE shop_response_cache_%s_total counter' % kind,
+                    'shop_response_cache_%s_total %d' % (kind, stats[kind]),
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    return ','.join(
+        '%s="%s"' % (key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+
+
+registry = MetricsRegistry()
+
+
+def instrument_serializers():
+    """
+    Time ``BaseSerializer.data`` for the request being measured.
+
+    ``Serializer.data`` and ``ListSerializer.data`` both end up here through
+    ``super()``, so only the outermost call of a request is counted.
+    """
+    original = BaseSerializer.data
+    if getattr(original.fget, 'instrumented', False):
+        return
+
+    def data(self):
+        metrics = current_metrics.get()
+        if metrics is None or metrics._in_serializer:
+            return original.fget(self)
+        metrics._in_serializer = True
+        start = time.perf_counter()
+        try:
+            return original.fget(self)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics._in_serializer = False
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
@@ -0,0 +1,117 @@
+import cProfile
+import hmac
+import logging
+import os
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from shop.metrics import RequestMetrics, current_metrics, registry, track_queries
+
+logger = logging.getLogger(__name__)
+
+
+def get_config():
+    config = {'PROFILE': 'off', 'PROFILE_SECRET': '', 'PROFILE_THRESHOLD_MS': 500, 'PROFILE_DIR': 'profiles'}
+    config.update(getattr(settings, 'SHOP_METRICS', {}))
+    return config
+
+
+class RequestMetricsMiddleware:
+    """
+    Count queries and time the DB, serializers and the whole request.
+
+    Results go to a ``Server-Timing`` header and to the per-route histograms
+    in ``shop.metrics.registry``. With ``SHOP_METRICS['PROFILE']`` set to
+    ``'all'`` (or ``'header'`` and an ``X-Profile`` request header carrying
+    ``PROFILE_SECRET``) the request runs under cProfile and is dumped to ``PROFILE_DIR`` when it takes
+    longer than ``PROFILE_THRESHOLD_MS``. Under ASGI the cProfile run only
+    follows the event loop thread, not the queries sent to ``sync_to_async``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before the middleware was loaded missed connection_created.
+        for connection in connections.all(initialized_only=True):
+            track_queries(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config, metrics, token, profiler, start = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            duration = self.stop(token, profiler, start)
+        return self.finish(request, response, config, metrics, profiler, duration)
+
+    async def __acall__(self, request):
+        config, metrics, token, profiler, start = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration = self.stop(token, profiler, start)
+        return self.finish(request, response, config, metrics, profiler, duration)
+
+    def start(self, request):
+        config = get_config()
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        profiler = self.start_profiler(request, config)
+        return config, metrics, token, profiler, time.perf_counter()
+
+    def stop(self, token, profiler, start):
+        duration = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+        current_metrics.reset(token)
+        return duration
+
+    def finish(self, request, response, config, metrics, profiler, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = '/' + match.route if match is not None else 'unmatched'
+        registry.observe(route, request.method, response.status_code, metrics, duration)
+        response['Server-Timing'] = ', '.join([
+            'db;dur=%.1f;desc="%d queries"' % (metrics.db_time * 1000, metrics.queries),
+            'serializer;dur=%.1f' % (metrics.serializer_time * 1000),
+            'total;dur=%.1f' % (duration * 1000),
+        ])
+        if profiler is not None and duration * 1000 >= config['PROFILE_THRESHOLD_MS']:
+            self.dump_profile(profiler, config, request, route, duration)
+        return response
+
+    def start_profiler(self, request, config):
+        mode = config['PROFILE']
+        if mode == 'all' or (mode == 'header' and self.may_profile(request, config)):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already running in this thread.
+                return None
+            return profiler
+        return None
+
+    def may_profile(self, request, config):
+        # Profiling slows the request down and writes to disk, so clients
+        # can't ask for it: header mode does nothing without a secret.
+        secret = config['PROFILE_SECRET']
+        header = request.headers.get('X-Profile', '')
+        return bool(secret) and hmac.compare_digest(header.encode(), secret.encode())
+
+    def dump_profile(self, profiler, config, request, route, duration):
+        os.makedirs(config['PROFILE_DIR'], exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-') or 'root'
+        name = '%d-%s-%s-%dms.prof' % (time.time_ns(), request.method, slug, round(duration * 1000))
+        path = os.path.join(config['PROFILE_DIR'], name)
+        profiler.dump_stats(path)
+        logger.warning('Slow request %s %s took %.0fms, profile saved to %s',
+                       request.method, request.path, duration * 1000, path)
@@ -0,0 +1,33 @@
+# Generated by Django 6.0 on 2026-10-18 06:44
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartProduct = apps.get_model('shop', 'CartProduct')
+    duplicates = (
+        CartProduct.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('amount'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        CartProduct.objects.filter(pk=row['keep_id']).update(amount=row['total'])
+        CartProduct.objects.filter(
+            cart_id=row['cart_id'], product_id=row['product_id']
+        ).exclude(pk=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartproduct',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='shop_cartproduct_unique_product'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-18 06:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def snapshot_order_lines(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    CartProduct = apps.get_model('shop', 'CartProduct')
+    OrderProduct = apps.get_model('shop', 'OrderProduct')
+    for order in Order.objects.all().iterator():
+        OrderProduct.objects.bulk_create(
+            OrderProduct(order=order, product_id=line.product_id, name=line.product.name,
+                         price=line.product.price, amount=line.amount)
+            for line in CartProduct.objects.filter(cart_id=order.cart_id).select_related('product')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_merge_open_carts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, verbose_name='Наименование')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='idempotencyKey',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('isPurchase', False)), fields=('user',), name='shop_cart_one_open_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('user', 'idempotencyKey'), name='shop_order_unique_idempotency_key'),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.order', verbose_name='Заказ'),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product', verbose_name='Товар'),
+        ),
+        migrations.RunPython(snapshot_order_lines, migrations.RunPython.noop),
+    ]
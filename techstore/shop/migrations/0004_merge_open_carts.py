@@ -0,0 +1,40 @@
+# Generated by Django 6.0 on 2026-10-18 06:45
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_open_carts(apps, schema_editor):
+    Cart = apps.get_model('shop', 'Cart')
+    CartProduct = apps.get_model('shop', 'CartProduct')
+    duplicates = (
+        Cart.objects.filter(isPurchase=False).values('user_id')
+        .annotate(carts=Count('id'), keep_id=Min('id'))
+        .filter(carts__gt=1)
+    )
+    for row in duplicates:
+        extra_carts = Cart.objects.filter(user_id=row['user_id'], isPurchase=False).exclude(pk=row['keep_id'])
+        kept = {line.product_id: line for line in CartProduct.objects.filter(cart_id=row['keep_id'])}
+        for line in CartProduct.objects.filter(cart__in=extra_carts):
+            if line.product_id in kept:
+                kept[line.product_id].amount += line.amount
+                kept[line.product_id].save(update_fields=['amount'])
+            else:
+                kept[line.product_id] = CartProduct.objects.create(
+                    cart_id=row['keep_id'], product_id=line.product_id, amount=line.amount
+                )
+        extra_carts.delete()
+
+
+class Migration(migrations.Migration):
+    # Apart from 0004_checkout_pipeline: on PostgreSQL the deleted carts leave
+    # deferred foreign key checks behind, and the unique index on open carts
+    # can't be built in a transaction that still has them pending.
+
+    dependencies = [
+        ('shop', '0003_cartproduct_unique_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_open_carts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0 on 2026-10-18 06:47
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('simple', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce({row}description, '')), 'B')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("""
+        CREATE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW."searchVector" := %s;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """ % SEARCH_VECTOR_SQL.format(row='NEW.'))
+    schema_editor.execute("""
+        CREATE TRIGGER shop_product_search_vector
+        BEFORE INSERT OR UPDATE OF name, description ON shop_product
+        FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update()
+    """)
+    schema_editor.execute('UPDATE shop_product SET "searchVector" = %s' % SEARCH_VECTOR_SQL.format(row=''))
+    schema_editor.execute('CREATE INDEX shop_product_search_idx ON shop_product USING gin ("searchVector")')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS shop_product_search_idx')
+    schema_editor.execute('DROP TRIGGER IF EXISTS shop_product_search_vector ON shop_product')
+    schema_editor.execute('DROP FUNCTION IF EXISTS shop_product_search_vector_update()')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_checkout_pipeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='searchVector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 06:54
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def deduplicate_names(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+    # Categories with the same name are the same category: move their products to the oldest one.
+    duplicates = Category.objects.values('name').annotate(rows=Count('id'), keep_id=Min('id')).filter(rows__gt=1)
+    for row in duplicates:
+        extra = Category.objects.filter(name=row['name']).exclude(pk=row['keep_id'])
+        Product.objects.filter(category__in=extra).update(category_id=row['keep_id'])
+        extra.delete()
+    # Products are distinct items that happen to share a name: keep them, suffixed with their id.
+    duplicates = Product.objects.values('name').annotate(rows=Count('id'), keep_id=Min('id')).filter(rows__gt=1)
+    for row in duplicates:
+        for product in Product.objects.filter(name=row['name']).exclude(pk=row['keep_id']):
+            product.name = free_name(Product, product.name, product.pk)
+            product.save(update_fields=['name'])
+
+
+def free_name(Product, name, pk):
+    """``name`` suffixed with ``pk``, and a counter if another product already has that name."""
+    suffix = ' (%s)' % pk
+    attempt = 1
+    while True:
+        candidate = name[:150 - len(suffix)] + suffix
+        if not Product.objects.filter(name=candidate).exists():
+            return candidate
+        attempt += 1
+        suffix = ' (%s-%d)' % (pk, attempt)
+
+
+class Migration(migrations.Migration):
+    # Apart from 0007_unique_catalog_names: on PostgreSQL the deleted
+    # categories leave deferred foreign key checks behind, and the unique
+    # indexes can't be built in a transaction that still has them pending.
+
+    dependencies = [
+        ('shop', '0006_product_photo_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_deduplicate_catalog_names'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=150, unique=True, verbose_name='Наименование'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=150, unique=True, verbose_name='Наименование'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0 on 2026-10-18 07:58
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_category_tree'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='Дата')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказы')),
+                ('units', models.IntegerField(default=0, verbose_name='Единицы товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, verbose_name='Наименование')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказы')),
+                ('units', models.IntegerField(default=0, verbose_name='Единицы товара')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('product', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sales', to='shop.product', verbose_name='Товар')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeliveryStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказы')),
+                ('deliveryStatus', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shop.deliverystatus', verbose_name='Статус доставки')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('deliveryStatus', models.Value(0)), name='shop_deliverystatuscount_unique_status')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-18 14:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_order_status_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updatedAt',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Изменена'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('isPurchase', False)), fields=['updatedAt'], name='shop_cart_open_updated_idx'),
+        ),
+    ]
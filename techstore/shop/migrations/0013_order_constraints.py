@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+def normalize_delivery(apps, schema_editor):
+    """
+    Make old orders satisfy shop_order_delivery_destination: the destination
+    that is set decides the delivery type, and when both are, the type decides
+    which one is dropped. Orders with neither become courier orders with an
+    empty (unknown) address.
+    """
+    Order = apps.get_model('shop', 'Order')
+    Order.objects.filter(deliveryType=True, shopAddress__isnull=False).exclude(deliveryAddress=None).update(
+        deliveryAddress=None
+    )
+    Order.objects.filter(deliveryType=False, deliveryAddress__isnull=False).exclude(shopAddress=None).update(
+        shopAddress=None
+    )
+    Order.objects.filter(deliveryType=False, deliveryAddress=None, shopAddress__isnull=False).update(deliveryType=True)
+    Order.objects.filter(deliveryType=True, shopAddress=None, deliveryAddress__isnull=False).update(deliveryType=False)
+    Order.objects.filter(deliveryAddress=None, shopAddress=None).update(deliveryType=False, deliveryAddress='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_cart_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_delivery, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'date', 'id'], name='shop_order_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('deliveryAddress__isnull', True), ('deliveryType', True), ('shopAddress__isnull', False)), models.Q(('deliveryAddress__isnull', False), ('deliveryType', False), ('shopAddress__isnull', True)), _connector='OR'), name='shop_order_delivery_destination'),
+        ),
+    ]
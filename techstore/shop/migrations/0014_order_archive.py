@@ -0,0 +1,86 @@
+# Generated by Django 6.0 on 2026-10-18 16:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_order_constraints'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('deliveryAddress', models.CharField(blank=True, max_length=150, null=True, verbose_name='Адрес доставки')),
+                ('deliveryType', models.BooleanField(default=True, verbose_name='Тип')),
+                ('deliveryPhoneNumber', models.CharField(blank=True, max_length=20, null=True, verbose_name='Номер телефона')),
+                ('date', models.DateTimeField(verbose_name='Дата и время')),
+                ('idempotencyKey', models.CharField(blank=True, max_length=64, null=True, verbose_name='Ключ идемпотентности')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderProductArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=150, verbose_name='Наименование')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date', 'id'], name='shop_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['deliveryStatus', 'date', 'id'], name='shop_order_status_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='cart',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.cart', verbose_name='Корзина'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='deliveryStatus',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shop.deliverystatus', verbose_name='Статус доставки'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='shopAddress',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='shop.shopaddress', verbose_name='Адрес пункта выдачи'),
+        ),
+        migrations.AddField(
+            model_name='orderarchive',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddField(
+            model_name='orderproductarchive',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.orderarchive', verbose_name='Заказ'),
+        ),
+        migrations.AddField(
+            model_name='orderproductarchive',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='shop.product', verbose_name='Товар'),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=models.Index(fields=['user', 'date', 'id'], name='shop_orderarchive_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=models.Index(fields=['date', 'id'], name='shop_orderarchive_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderarchive',
+            index=models.Index(fields=['deliveryStatus', 'date', 'id'], name='shop_orderarchive_status_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-18 16:40
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_order_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='deliverystatuscount',
+            name='shop_deliverystatuscount_unique_status',
+        ),
+        migrations.AddField(
+            model_name='dailyrevenue',
+            name='bucket',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Сегмент'),
+        ),
+        migrations.AddField(
+            model_name='deliverystatuscount',
+            name='bucket',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Сегмент'),
+        ),
+        migrations.AlterField(
+            model_name='dailyrevenue',
+            name='date',
+            field=models.DateField(verbose_name='Дата'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(fields=('date', 'bucket'), name='shop_dailyrevenue_unique_bucket'),
+        ),
+        migrations.AddConstraint(
+            model_name='deliverystatuscount',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('deliveryStatus', models.Value(0)), models.F('bucket'), name='shop_deliverystatuscount_unique_status'),
+        ),
+    ]
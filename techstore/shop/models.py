@@ -1,27 +1,112 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
-from django.db.models import PROTECT
+from django.db.models import F, PROTECT, Value
+from django.db.models.functions import Coalesce, Concat, Substr
+
+
+class ProductManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().defer('searchVector')
 
 
 class Product(models.Model):
-    name = models.CharField(max_length=150, verbose_name='Наименование')
+    name = models.CharField(max_length=150, unique=True, verbose_name='Наименование')
     price = models.DecimalField(verbose_name='Цена', max_digits=10, decimal_places=2)
     photo = models.ImageField(upload_to='products/', null=True, blank=True, verbose_name='Фото')
+    # Resized copies of ``photo`` written by shop.images: {format: [{name, width, height}]}
+    photoVariants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Варианты фото')
     description = models.TextField(blank=True, verbose_name='Описание')
     category = models.ForeignKey('Category', on_delete=models.CASCADE, verbose_name='Категория')
+    # Maintained by a database trigger on PostgreSQL, see migration 0005.
+    searchVector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='shop_product_cat_price_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='shop_product_cat_name_idx'),
+            models.Index(fields=['price', 'id'], name='shop_product_price_idx'),
+            models.Index(fields=['name', 'id'], name='shop_product_name_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Category(models.Model):
-    name = models.CharField(max_length=150, verbose_name='Наименование')
+    name = models.CharField(max_length=150, unique=True, verbose_name='Наименование')
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='children', blank=True, null=True, verbose_name='Родительская категория')
+    # Materialized path of ids from the root, e.g. "1/7/12/": a subtree is a prefix match.
+    path = models.CharField(max_length=255, default='', editable=False, verbose_name='Путь')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень')
+    # Products in this category and all of its subcategories, kept up to date by shop.signals.
+    productCount = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество товаров')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['path'], name='shop_category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
     def __str__(self):
         return self.name
 
+    @property
+    def ancestor_ids(self):
+        """Ids from the root down to and including this category."""
+        return path_ids(self.path)
+
+    def save(self, *args, **kwargs):
+        old = Category.objects.filter(pk=self.pk).values('path', 'depth').first() if self.pk else None
+        parent = Category.objects.filter(pk=self.parent_id).values('path', 'depth').first() if self.parent_id else None
+        if parent and old and parent['path'].startswith(old['path']):
+            raise ValueError("A category can't be moved into its own subtree")
+        super().save(*args, **kwargs)
+        path = (parent['path'] if parent else '') + '%d/' % self.pk
+        depth = parent['depth'] + 1 if parent else 0
+        if old and old['path'] and old['path'] != path:
+            self._move_subtree(old['path'], old['depth'], path, depth)
+        elif not old or old['path'] != path:
+            Category.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        self.path, self.depth = path, depth
+
+    def _move_subtree(self, old_path, old_depth, path, depth):
+        Category.objects.filter(path__startswith=old_path).update(
+            path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (depth - old_depth),
+        )
+        count = Category.objects.filter(pk=self.pk).values_list('productCount', flat=True).first()
+        if count:
+            Category.objects.filter(pk__in=path_ids(old_path)[:-1]).update(productCount=F('productCount') - count)
+            Category.objects.filter(pk__in=path_ids(path)[:-1]).update(productCount=F('productCount') + count)
+
+
+def path_ids(path):
+    return [int(pk) for pk in path.split('/') if pk]
+
 
 class Cart(models.Model):
     isPurchase = models.BooleanField(verbose_name='Куплена', default=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
+    updatedAt = models.DateTimeField(auto_now=True, verbose_name='Изменена')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'], condition=models.Q(isPurchase=False), name='shop_cart_one_open_per_user'
+            ),
+        ]
+        indexes = [
+            # Stale open carts for cleanup_carts.
+            models.Index(fields=['updatedAt'], condition=models.Q(isPurchase=False), name='shop_cart_open_updated_idx'),
+        ]
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.cartproduct_set.all()), Decimal('0.00'))
 
 
 class ShopAddress(models.Model):
@@ -41,6 +126,86 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name='Пользователь')
     shopAddress = models.ForeignKey(ShopAddress, on_delete=models.PROTECT, verbose_name='Адрес пункта выдачи', blank=True, null=True)
     deliveryStatus = models.ForeignKey(DeliveryStatus, on_delete=PROTECT, verbose_name='Статус доставки', blank=True, null=True)
+    idempotencyKey = models.CharField(max_length=64, blank=True, null=True, verbose_name='Ключ идемпотентности')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotencyKey'], name='shop_order_unique_idempotency_key'),
+            # The rules of OrderSerializer.validate: pickup orders (deliveryType) name a
+            # shop and no address, courier orders an address and no shop.
+            models.CheckConstraint(
+                condition=(
+                    models.Q(deliveryType=True, deliveryAddress__isnull=True, shopAddress__isnull=False)
+                    | models.Q(deliveryType=False, deliveryAddress__isnull=False, shopAddress__isnull=True)
+                ),
+                name='shop_order_delivery_destination',
+            ),
+        ]
+        indexes = [
+            # A user's orders by date, read backwards for the newest.
+            models.Index(fields=['user', 'date', 'id'], name='shop_order_user_date_idx'),
+            # The staff listing, and rotate_orders looking for old orders.
+            models.Index(fields=['date', 'id'], name='shop_order_date_idx'),
+            models.Index(fields=['deliveryStatus', 'date', 'id'], name='shop_order_status_date_idx'),
+        ]
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.lines.all()), Decimal('0.00'))
+
+
+class OrderProduct(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, verbose_name='Товар')
+    name = models.CharField(max_length=150, verbose_name='Наименование')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    @property
+    def total(self):
+        return self.amount * self.price
+
+
+class OrderArchive(models.Model):
+    """
+    Orders moved out of ``Order`` by the rotate_orders command, with the same
+    columns and ids. Only orders older than every remaining one are moved, so
+    a listing by date reads this table once it has run out of active orders.
+    Archived orders are read-only.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    deliveryAddress = models.CharField(max_length=150, blank=True, verbose_name='Адрес доставки', null=True)
+    deliveryType = models.BooleanField(default=True, verbose_name='Тип')
+    deliveryPhoneNumber = models.CharField(max_length=20, blank=True, verbose_name='Номер телефона', null=True)
+    date = models.DateTimeField(verbose_name='Дата и время')
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='+', verbose_name='Корзина')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    shopAddress = models.ForeignKey(ShopAddress, on_delete=models.PROTECT, related_name='+', verbose_name='Адрес пункта выдачи', blank=True, null=True)
+    deliveryStatus = models.ForeignKey(DeliveryStatus, on_delete=PROTECT, related_name='+', verbose_name='Статус доставки', blank=True, null=True)
+    idempotencyKey = models.CharField(max_length=64, blank=True, null=True, verbose_name='Ключ идемпотентности')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date', 'id'], name='shop_orderarchive_user_idx'),
+            models.Index(fields=['date', 'id'], name='shop_orderarchive_date_idx'),
+            models.Index(fields=['deliveryStatus', 'date', 'id'], name='shop_orderarchive_status_idx'),
+        ]
+
+    @property
+    def total(self):
+        return sum((line.total for line in self.lines.all()), Decimal('0.00'))
+
+
+class OrderProductArchive(models.Model):
+    order = models.ForeignKey(OrderArchive, on_delete=models.CASCADE, related_name='lines', verbose_name='Заказ')
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='+', verbose_name='Товар')
+    name = models.CharField(max_length=150, verbose_name='Наименование')
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='Цена')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    @property
+    def total(self):
+        return self.amount * self.price
 
 
 class CartProduct(models.Model):
@@ -48,3 +213,104 @@ class CartProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Товар')
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, verbose_name='Корзина')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='shop_cartproduct_unique_product'),
+        ]
+
+    @property
+    def total(self):
+        return self.amount * self.product.price
+
+
+class Stock(models.Model):
+    """
+    Units of a product on hand, either central (no ``shopAddress``) or at a
+    pickup point. ``available`` is what can still be put in a cart,
+    ``reserved`` is held by carts until checkout or expiry. Products without
+    a stock row are not tracked and never run out.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stocks', verbose_name='Товар')
+    shopAddress = models.ForeignKey(ShopAddress, on_delete=models.CASCADE, blank=True, null=True, verbose_name='Пункт выдачи')
+    available = models.PositiveIntegerField(default=0, verbose_name='Доступно')
+    reserved = models.PositiveIntegerField(default=0, verbose_name='Зарезервировано')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shopAddress'], name='shop_stock_unique_location'),
+            models.UniqueConstraint(
+                fields=['product'], condition=models.Q(shopAddress__isnull=True), name='shop_stock_unique_central'
+            ),
+        ]
+
+
+class StockReservation(models.Model):
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='reservations', verbose_name='Остаток')
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations', verbose_name='Корзина')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+    expiresAt = models.DateTimeField(db_index=True, verbose_name='Действует до')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'stock'], name='shop_stockreservation_unique_stock'),
+        ]
+
+
+class DailyRevenue(models.Model):
+    date = models.DateField(verbose_name='Дата')
+    # A day is spread over several rows so concurrent checkouts don't queue
+    # on one; readers sum them.
+    bucket = models.PositiveSmallIntegerField(default=0, verbose_name='Сегмент')
+    orders = models.IntegerField(default=0, verbose_name='Заказы')
+    units = models.IntegerField(default=0, verbose_name='Единицы товара')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'bucket'], name='shop_dailyrevenue_unique_bucket'),
+        ]
+
+
+class ProductSales(models.Model):
+    # Kept with the name snapshot when the product itself is deleted.
+    product = models.OneToOneField(Product, on_delete=models.SET_NULL, null=True, related_name='sales', verbose_name='Товар')
+    name = models.CharField(max_length=150, verbose_name='Наименование')
+    orders = models.IntegerField(default=0, verbose_name='Заказы')
+    units = models.IntegerField(default=0, verbose_name='Единицы товара')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Выручка')
+
+
+class DeliveryStatusCount(models.Model):
+    # A null status counts orders that have none yet.
+    deliveryStatus = models.ForeignKey(DeliveryStatus, on_delete=models.CASCADE, null=True, blank=True, verbose_name='Статус доставки')
+    # Spread like DailyRevenue: every new order counts under the null status.
+    bucket = models.PositiveSmallIntegerField(default=0, verbose_name='Сегмент')
+    orders = models.IntegerField(default=0, verbose_name='Заказы')
+
+    class Meta:
+        constraints = [
+            # One row per status and bucket, the null status included.
+            models.UniqueConstraint(Coalesce('deliveryStatus', Value(0)), 'bucket', name='shop_deliverystatuscount_unique_status'),
+        ]
+
+
+class OrderStatusEvent(models.Model):
+    """
+    One change of an order's status or delivery fields. Ids only grow, so the
+    last id a client has seen is its cursor into the feed; events are handed
+    out once no lower id can still be committed (``shop.events.settled``).
+    """
+    TRACKED_FIELDS = ('deliveryStatus_id', 'deliveryAddress', 'deliveryType', 'deliveryPhoneNumber', 'shopAddress_id')
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events', verbose_name='Заказ')
+    # Copied from the order so a user's feed is read from this table alone.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name='Пользователь')
+    deliveryStatus = models.ForeignKey(DeliveryStatus, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name='Статус доставки')
+    # {field: new value} for the tracked fields that changed.
+    changes = models.JSONField(default=dict, verbose_name='Изменения')
+    createdAt = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='shop_orderstatusevent_feed_idx'),
+        ]
@@ -0,0 +1,180 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek-method pagination: every page is fetched with
+    ``WHERE (field, id) > (last_field, last_id) ORDER BY field, id LIMIT n``,
+    so its cost does not depend on how deep the client has paged.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    ordering_fields = ('id',)
+    default_ordering = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._finish_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self._finish_page([obj async for obj in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        self._start(request)
+        return self._seek_queryset(queryset)
+
+    def _start(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = self.cursor is not None and self.cursor['r']
+
+    def _seek_queryset(self, queryset):
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        if self.cursor is not None:
+            try:
+                value = queryset.model._meta.get_field(field).to_python(self.cursor['v'])
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self._seek(field, descending != self.reverse, value, self.cursor['id']))
+
+        if descending != self.reverse:
+            order_by = ('-' + field, '-id') if field != 'id' else ('-id',)
+        else:
+            order_by = (field, 'id') if field != 'id' else ('id',)
+        return queryset.order_by(*order_by)[:self.page_size + 1]
+
+    def _finish_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not self.reverse else self.cursor is not None
+        self.has_previous = self.cursor is not None if not self.reverse else has_more
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            return self.default_ordering
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_position(self, instance, field):
+        return getattr(instance, field), instance.id
+
+    def encode_cursor(self, instance, reverse):
+        value, pk = self.get_position(instance, self.ordering.lstrip('-'))
+        if not isinstance(value, (int, str)) or isinstance(value, bool):
+            value = str(value)
+        token = json.dumps({'o': self.ordering, 'v': value, 'id': pk, 'r': int(reverse)})
+        encoded = urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+        url = replace_query_param(self.base_url, self.cursor_query_param, encoded)
+        return replace_query_param(url, self.ordering_query_param, self.ordering)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            cursor = {'v': cursor['v'], 'id': int(cursor['id']), 'r': bool(cursor['r']), 'o': cursor['o']}
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if cursor['o'] != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _seek(self, field, descending, value, pk):
+        after = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{'id__' + after: pk})
+        return Q(**{field + '__' + after: value}) | Q(**{field: value, 'id__' + after: pk})
+
+
+class ProductKeysetPagination(KeysetPagination):
+    ordering_fields = ('id', 'price', 'name')
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """
+    Orders by date, newest first unless ``ordering=date``, read from the
+    active and the archived orders as if they were one table.
+    """
+    ordering_fields = ('date',)
+    default_ordering = '-date'
+
+    def paginate_partitions(self, querysets, request, view=None):
+        """
+        Page through ``querysets`` that hold consecutive ranges of the
+        ordering field, oldest first. A partition is only queried when the
+        ones before it in the paging direction don't fill the page.
+        """
+        results = []
+        for queryset in self._partitions(querysets, request):
+            results += queryset[:self.page_size + 1 - len(results)]
+            if len(results) > self.page_size:
+                break
+        return self._finish_page(results)
+
+    async def apaginate_partitions(self, querysets, request, view=None):
+        results = []
+        for queryset in self._partitions(querysets, request):
+            results += [obj async for obj in queryset[:self.page_size + 1 - len(results)]]
+            if len(results) > self.page_size:
+                break
+        return self._finish_page(results)
+
+    def _partitions(self, querysets, request):
+        self._start(request)
+        if self.ordering.startswith('-') != self.reverse:
+            querysets = reversed(querysets)
+        return [self._seek_queryset(queryset) for queryset in querysets]
+
+
+class ProductSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
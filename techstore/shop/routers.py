@@ -0,0 +1,123 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Replica alias chosen for the request being handled, or None to use the primary.
+current_replica = ContextVar('shop_current_replica', default=None)
+
+
+def get_config():
+    config = {
+        'REPLICAS': [alias for alias in settings.DATABASES if alias != 'default'],
+        'STICKY_SECONDS': 5,
+        'CACHE': 'default',
+    }
+    config.update(getattr(settings, 'SHOP_DB_ROUTING', {}))
+    return config
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to the replica picked for the current request, if any, and
+    everything else to ``default``. Outside a read-only request (writes,
+    management commands, worker threads) all queries go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return current_replica.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data.
+        return True
+
+
+def client_key(request):
+    """Identify the client by its credentials, without touching the database."""
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'shop:db-pin:%s' % hashlib.sha256(credentials.encode()).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe-method requests from a read replica, except for clients that
+    wrote something within ``STICKY_SECONDS``: those keep reading from the
+    primary so they see their own cart and order changes despite replica lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        config = get_config()
+        key = client_key(request)
+        pinned = self.may_read_replica(request, config, key) and caches[config['CACHE']].get(key)
+        token = current_replica.set(self.pick_replica(request, config, pinned))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_replica.reset(token)
+        if self.should_pin(request, response, config, key):
+            caches[config['CACHE']].set(key, True, config['STICKY_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        config = get_config()
+        key = client_key(request)
+        pinned = self.may_read_replica(request, config, key) and await caches[config['CACHE']].aget(key)
+        token = current_replica.set(self.pick_replica(request, config, pinned))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_replica.reset(token)
+        if self.should_pin(request, response, config, key):
+            await caches[config['CACHE']].aset(key, True, config['STICKY_SECONDS'])
+        return response
+
+    @staticmethod
+    def may_read_replica(request, config, key):
+        # Only a known client on a safe request needs its pin looked up.
+        return bool(config['REPLICAS']) and request.method in SAFE_METHODS and key is not None
+
+    @staticmethod
+    def pick_replica(request, config, pinned):
+        if config['REPLICAS'] and request.method in SAFE_METHODS and not pinned:
+            return random.choice(config['REPLICAS'])
+        return None
+
+    @staticmethod
+    def should_pin(request, response, config, key):
+        return (bool(config['REPLICAS']) and key is not None and request.method not in SAFE_METHODS
+                and response.status_code < 400)
+
+
+@checks.register(checks.Tags.caches)
+def check_pin_cache(app_configs, **kwargs):
+    config = get_config()
+    backend = settings.CACHES.get(config['CACHE'], {}).get('BACKEND', '')
+    if config['REPLICAS'] and backend.endswith('.LocMemCache'):
+        return [checks.Warning(
+            'Replica routing pins clients to the primary through a per-process cache.',
+            hint='With several workers, point SHOP_DB_ROUTING["CACHE"] at a shared cache, '
+                 'or clients may not read their own writes.',
+            id='shop.W001',
+        )]
+    return []
@@ -0,0 +1,124 @@
+import os
+import threading
+from importlib import import_module
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+
+
+def get_config():
+    config = {
+        'ENABLED': True,
+        'SCHEMA_FILE': os.path.join(settings.BASE_DIR, 'openapi.json'),
+        'TITLE': 'Snippets API',
+        'VERSION': 'v1',
+    }
+    config.update(getattr(settings, 'SHOP_OPENAPI', {}))
+    return config
+
+
+class Parameter:
+    """
+    An ``openapi.Parameter`` that is only built with the schema. ``in_`` and
+    ``type`` take the values of drf_yasg's constants: 'query', 'header',
+    'formData'; 'string', 'boolean', 'file'.
+    """
+
+    def __init__(self, name, in_, **kwargs):
+        self.name = name
+        self.in_ = in_
+        self.kwargs = kwargs
+
+    def resolve(self):
+        from drf_yasg import openapi
+
+        return openapi.Parameter(self.name, self.in_, **self.kwargs)
+
+
+_pending = []
+_lock = threading.Lock()
+
+
+def swagger_auto_schema(**kwargs):
+    """
+    drf_yasg's ``swagger_auto_schema`` without importing drf_yasg: the
+    arguments are recorded and applied by ``apply_pending`` before a schema
+    is generated, so serving the API never loads the OpenAPI stack.
+    """
+    def decorator(view_method):
+        with _lock:
+            _pending.append((view_method, kwargs))
+        return view_method
+    return decorator
+
+
+def apply_pending():
+    from drf_yasg.utils import swagger_auto_schema as decorate
+
+    # The views register their schemas when the URLconf imports them.
+    import_module(settings.ROOT_URLCONF)
+    with _lock:
+        while _pending:
+            view_method, kwargs = _pending.pop()
+            if 'manual_parameters' in kwargs:
+                kwargs = {**kwargs, 'manual_parameters': [p.resolve() for p in kwargs['manual_parameters']]}
+            decorate(**kwargs)(view_method)
+
+
+def get_info():
+    from drf_yasg import openapi
+
+    config = get_config()
+    return openapi.Info(title=config['TITLE'], default_version=config['VERSION'])
+
+
+def generate(url=None):
+    """The public schema as pretty-printed JSON bytes, the document the Swagger UI shows."""
+    from drf_yasg.app_settings import swagger_settings
+    from drf_yasg.codecs import OpenAPICodecJson
+
+    apply_pending()
+    generator = swagger_settings.DEFAULT_GENERATOR_CLASS(info=get_info(), url=url)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(generator.get_schema(request=None, public=True))
+
+
+_views = {}
+
+
+def _view(name):
+    """drf_yasg's schema views, built on first use."""
+    if name not in _views:
+        from drf_yasg.views import get_schema_view
+        from rest_framework import permissions
+
+        apply_pending()
+        schema_view = get_schema_view(get_info(), public=True, permission_classes=(permissions.AllowAny,))
+        with _lock:
+            _views.setdefault('ui', schema_view.with_ui('swagger', cache_timeout=0))
+            _views.setdefault('json', schema_view.without_ui(cache_timeout=0))
+    return _views[name]
+
+
+def _schema_file():
+    path = get_config()['SCHEMA_FILE']
+    if path and os.path.exists(path):
+        return FileResponse(open(path, 'rb'), content_type='application/json')
+    return None
+
+
+def swagger_ui(request, *args, **kwargs):
+    """The Swagger UI; the document it loads comes from the pre-generated file when there is one."""
+    if not get_config()['ENABLED']:
+        raise Http404
+    if request.GET.get('format') == 'openapi':
+        response = _schema_file()
+        if response is not None:
+            return response
+    return _view('ui')(request, *args, **kwargs)
+
+
+def schema_json(request):
+    """The schema document: the file written by ``generate_schema``, or generated on the spot."""
+    if not get_config()['ENABLED']:
+        raise Http404
+    return _schema_file() or _view('json')(request, format='.json')
@@ -0,0 +1,132 @@
+import bisect
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+from shop.models import Product
+
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+class InvertedIndex:
+    """
+    In-process token -> product index used when the database has no full-text
+    search (SQLite in development and tests). Built lazily on first query and
+    kept current by the Product signals in ``shop.signals``.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._vocabulary = []
+        self._built = False
+        self._lock = threading.RLock()
+
+    def build(self):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary = []
+            for pk, name, description in Product.objects.values_list('id', 'name', 'description').iterator():
+                self._add(pk, name, description)
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def update(self, product):
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(product.pk)
+            self._add(product.pk, product.name, product.description)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._built:
+                self._remove(pk)
+
+    def reset(self):
+        with self._lock:
+            self._built = False
+
+    def search(self, query):
+        """Return product ids matching every query token (as a prefix), best first."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        self.ensure_built()
+        with self._lock:
+            scores = None
+            for token in tokens:
+                matches = defaultdict(int)
+                start = bisect.bisect_left(self._vocabulary, token)
+                for term in self._vocabulary[start:]:
+                    if not term.startswith(token):
+                        break
+                    for pk, weight in self._postings[term].items():
+                        matches[pk] += weight
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {pk: score + matches[pk] for pk, score in scores.items() if pk in matches}
+                if not scores:
+                    return []
+        return [pk for pk, score in sorted(scores.items(), key=lambda item: (-item[1], item[0]))]
+
+    def _add(self, pk, name, description):
+        weights = defaultdict(int)
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(description):
+            weights[token] += DESCRIPTION_WEIGHT
+        for token, weight in weights.items():
+            if token not in self._postings:
+                bisect.insort(self._vocabulary, token)
+            self._postings[token][pk] = weight
+        self._documents[pk] = list(weights)
+
+    def _remove(self, pk):
+        for token in self._documents.pop(pk, ()):
+            posting = self._postings[token]
+            posting.pop(pk, None)
+            if not posting:
+                del self._postings[token]
+                index = bisect.bisect_left(self._vocabulary, token)
+                del self._vocabulary[index]
+
+
+inverted_index = InvertedIndex()
+
+
+def uses_database_search():
+    return connection.vendor == 'postgresql'
+
+
+def search_products(query):
+    """
+    Return ranked matches for ``query``: a queryset on PostgreSQL, where the
+    trigger-maintained ``searchVector`` column and its GIN index do the work,
+    or a list of ids from the in-process index elsewhere.
+    """
+    tokens = tokenize(query)
+    if uses_database_search():
+        if not tokens:
+            return Product.objects.none()
+        search_query = SearchQuery(' & '.join(token + ':*' for token in tokens), config='simple', search_type='raw')
+        return (
+            Product.objects.filter(searchVector=search_query)
+            .annotate(rank=SearchRank(F('searchVector'), search_query))
+            .order_by('-rank', 'id')
+        )
+    return inverted_index.search(query)
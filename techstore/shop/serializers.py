@@ -1,22 +1,120 @@
 import re
+from decimal import Decimal
 
 from rest_framework import serializers
-from rest_framework.validators import UniqueValidator
 
-from shop.models import *
+from shop.images import get_srcset
+from shop.models import Category, Product, ShopAddress
 
 
 class ProductSerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
-    name = serializers.CharField(max_length=150, validators=[UniqueValidator(queryset=Product.objects.all())])
+    # Unique in the database; the views turn violations into this field's error.
+    name = serializers.CharField(max_length=150)
     price = serializers.DecimalField(max_digits=10, decimal_places=2)
     photo = serializers.ImageField(allow_null=True, required=False)
+    photo_srcset = serializers.SerializerMethodField()
     description = serializers.CharField()
     category_id = serializers.IntegerField()
 
+    def get_photo_srcset(self, obj):
+        return get_srcset(obj)
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField(required=False)
+    include_subcategories = serializers.BooleanField(required=False, default=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    ordering = serializers.ChoiceField(choices=['id', '-id', 'price', '-price', 'name', '-name'], required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, required=False)
+    cursor = serializers.CharField(required=False)
+
+    def validate(self, value):
+        min_price = value.get('min_price')
+        max_price = value.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError("min_price can't be greater than max_price")
+        return value
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    page = serializers.IntegerField(min_value=1, required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, required=False)
+
+
+class ProductImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=150)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    category = serializers.CharField(max_length=150, required=False)
+    category_id = serializers.IntegerField(required=False)
+
+    def validate(self, value):
+        if not value.get('category') and not value.get('category_id'):
+            raise serializers.ValidationError("category or category_id is required")
+        return value
+
+
+class ProductSelectionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=10000)
+    category_id = serializers.IntegerField(required=False)
+    include_subcategories = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, value):
+        if 'ids' not in value and 'category_id' not in value:
+            raise serializers.ValidationError("ids or category_id is required")
+        return value
+
+
+class ProductBulkUpdateSerializer(ProductSelectionSerializer):
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False)
+    price_delta = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_percent = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=Decimal('-99.99'), required=False)
+    new_category_id = serializers.IntegerField(required=False)
+
+    def validate(self, value):
+        value = super().validate(value)
+        price_changes = [field for field in ('price', 'price_delta', 'price_percent') if field in value]
+        if len(price_changes) > 1:
+            raise serializers.ValidationError("Only one of price, price_delta and price_percent can be given")
+        if not price_changes and 'new_category_id' not in value:
+            raise serializers.ValidationError("Nothing to update")
+        return value
+
+
+class CatalogSnapshotSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField(required=False)
+
+
+class CatalogTransferSerializer(serializers.Serializer):
+    model = serializers.ChoiceField(choices=['category', 'product'])
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False)
+
 
 class CategorySerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
+    # Unique in the database; the views turn violations into this field's error.
+    name = serializers.CharField(max_length=150)
+    parent_id = serializers.IntegerField(required=False, allow_null=True)
+    depth = serializers.IntegerField(read_only=True)
+    productCount = serializers.IntegerField(read_only=True)
+
+    def validate_parent_id(self, value):
+        if value is not None and not Category.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("Parent category not found")
+        return value
+
+
+class CategoryTreeSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    productCount = serializers.IntegerField(read_only=True)
+    children = serializers.ListField(child=serializers.DictField(), read_only=True)
+
+
+class CategoryImportSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=150)
 
 
@@ -33,6 +131,58 @@ class CartProductSerializer(serializers.Serializer):
     cart_id = serializers.IntegerField(read_only=True)
 
 
+class CartProductProductSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    photo = serializers.ImageField(read_only=True)
+
+
+class CartProductExpandedSerializer(CartProductSerializer):
+    product = CartProductProductSerializer(read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, source='total', read_only=True)
+
+
+class CartExpandedSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True, allow_null=True)
+    items = CartProductExpandedSerializer(many=True, read_only=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+
+class CartProductDeltaSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    amount = serializers.IntegerField(default=1)
+    shopAddress_id = serializers.IntegerField(required=False, help_text='Reserve stock at this pickup point')
+
+
+class CartProductBulkSerializer(serializers.Serializer):
+    items = CartProductDeltaSerializer(many=True, allow_empty=False, max_length=500)
+    shopAddress_id = serializers.IntegerField(required=False, help_text='Reserve stock at this pickup point')
+
+    def validate_items(self, value):
+        deltas = {}
+        for item in value:
+            deltas[item['product_id']] = deltas.get(item['product_id'], 0) + item['amount']
+        found = set(Product.objects.filter(id__in=deltas).values_list('id', flat=True))
+        missing = sorted(set(deltas) - found)
+        if missing:
+            raise serializers.ValidationError("Products not found: %s" % ', '.join(map(str, missing)))
+        return deltas
+
+
+class StockSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    product_id = serializers.IntegerField(read_only=True)
+    shopAddress_id = serializers.IntegerField(required=False, allow_null=True, default=None)
+    available = serializers.IntegerField(min_value=0)
+    reserved = serializers.IntegerField(read_only=True)
+
+    def validate_shopAddress_id(self, value):
+        if value is not None and not ShopAddress.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("Shop address not found")
+        return value
+
+
 class ShopAddressSerializer(serializers.Serializer):
     id = serializers.IntegerField(read_only=True)
     address = serializers.CharField(max_length=150)
@@ -81,4 +231,100 @@ class OrderSerializer(serializers.Serializer):
             raise serializers.ValidationError("Phone number must be entered in the format: +375299999999 or 80299999999")
 
 
+class OrderFilterSerializer(serializers.Serializer):
+    deliveryStatus_id = serializers.IntegerField(required=False)
+    deliveryType = serializers.BooleanField(required=False)
+    # Days in the server's time zone, both included.
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    ordering = serializers.ChoiceField(choices=['date', '-date'], required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, required=False)
+    cursor = serializers.CharField(required=False)
+
+    def validate(self, value):
+        if value.get('date_from') and value.get('date_to') and value['date_from'] > value['date_to']:
+            raise serializers.ValidationError("date_from can't be later than date_to")
+        return value
+
+
+class StaffOrderFilterSerializer(OrderFilterSerializer):
+    user_id = serializers.IntegerField(required=False)
+
+
+class OrderProductSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    product_id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    photo = serializers.ImageField(read_only=True, source='product.photo', allow_null=True)
+    amount = serializers.IntegerField(read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, source='total', read_only=True)
+
+
+class OrderExpandedSerializer(OrderSerializer):
+    shopAddress = ShopAddressSerializer(read_only=True)
+    deliveryStatus = DeliveryStatusSerializer(read_only=True)
+    items = OrderProductSerializer(many=True, read_only=True, source='lines.all')
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+
+
+class OrderStatusEventSerializer(serializers.Serializer):
+    id = serializers.IntegerField(read_only=True)
+    order_id = serializers.IntegerField(read_only=True)
+    deliveryStatus_id = serializers.IntegerField(read_only=True, allow_null=True)
+    changes = serializers.JSONField(read_only=True)
+    createdAt = serializers.DateTimeField(read_only=True, format='%Y-%m-%d %H:%M:%S')
+
+
+class OrderChangesSerializer(serializers.Serializer):
+    cursor = serializers.IntegerField(min_value=0, default=0)
+    timeout = serializers.IntegerField(min_value=0, max_value=60, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+
+class OrderStatusBulkSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    deliveryStatus_id = serializers.IntegerField(allow_null=True)
+
+
+class AnalyticsRangeSerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, value):
+        if value.get('date_from') and value.get('date_to') and value['date_from'] > value['date_to']:
+            raise serializers.ValidationError("date_from can't be later than date_to")
+        return value
+
+
+class TopProductsSerializer(serializers.Serializer):
+    ordering = serializers.ChoiceField(choices=['units', 'revenue', 'orders'], default='revenue')
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
+
+class DailyRevenueSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class ProductSalesSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(allow_null=True)
+    name = serializers.CharField()
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CategorySalesSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField()
+    name = serializers.CharField(source='category_name')
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
 
+class DeliveryStatusCountSerializer(serializers.Serializer):
+    deliveryStatus_id = serializers.IntegerField(allow_null=True)
+    name = serializers.CharField(allow_null=True)
+    orders = serializers.IntegerField()
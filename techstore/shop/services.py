@@ -0,0 +1,515 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+from shop import snapshots
+from shop.analytics import record_order, record_status_transitions
+from shop.cache import bump_version
+from shop.categories import recount_products
+from shop.events import hub
+from shop.images import delete_variants
+from shop.models import (
+    Cart, CartProduct, Category, Order, OrderArchive, OrderProduct, OrderProductArchive, OrderStatusEvent, Product,
+    ProductSales, Stock, StockReservation,
+)
+from shop.search import inverted_index, uses_database_search
+
+# Product.price is DecimalField(max_digits=10, decimal_places=2).
+MAX_PRICE = Decimal('99999999.99')
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class CatalogError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, product_id):
+        super().__init__("Not enough stock for product %s" % product_id, 409)
+        self.product_id = product_id
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'SHOP_STOCK', {}).get('RESERVATION_TTL', 900))
+
+
+def _reservations(cart, product_ids=None):
+    lst = StockReservation.objects.select_for_update(of=('self',)).filter(cart=cart).select_related('stock')
+    if product_ids is not None:
+        lst = lst.filter(stock__product_id__in=product_ids)
+    return {reservation.stock.product_id: reservation for reservation in lst}
+
+
+def _stock_ids(product_ids, shop_address_id=None):
+    if not product_ids:
+        return {}
+    return dict(
+        Stock.objects.filter(product_id__in=product_ids, shopAddress_id=shop_address_id)
+        .values_list('product_id', 'id')
+    )
+
+
+def _move_stock(stock_id, take, release=0):
+    """
+    Take ``take`` units from ``available`` (a negative value gives them back) and
+    drop ``release`` units from ``reserved``, as one conditional UPDATE that
+    fails instead of letting ``available`` go negative. Returns success.
+    """
+    return Stock.objects.filter(pk=stock_id, available__gte=max(take, 0)).update(
+        available=F('available') - take,
+        reserved=F('reserved') + take - release,
+    ) == 1
+
+
+def apply_cart_deltas(user_id, deltas, shop_address_id=None):
+    """
+    Apply ``{product_id: amount_delta}`` to the user's open cart in one transaction.
+
+    The open cart row is locked for the duration, so concurrent requests from
+    the same user are serialized instead of losing increments. Lines whose
+    amount drops to zero or below are removed. Added units of tracked products
+    are reserved from the central stock, or the ``shop_address_id`` pickup
+    point, until checkout or ``SHOP_STOCK['RESERVATION_TTL']``; raises
+    ``OutOfStockError`` if any cannot be. Returns the cart.
+    """
+    with transaction.atomic():
+        cart, created = Cart.objects.select_for_update().get_or_create(
+            user_id=user_id,
+            isPurchase=False
+        )
+        if not created:
+            Cart.objects.filter(pk=cart.pk).update(updatedAt=timezone.now())
+        existing = {
+            line.product_id: line
+            for line in CartProduct.objects.filter(cart=cart, product_id__in=deltas)
+        }
+        to_create, to_update, to_delete = [], [], []
+        changes = {}
+        for product_id, delta in deltas.items():
+            line = existing.get(product_id)
+            if line is None:
+                if delta > 0:
+                    to_create.append(CartProduct(cart=cart, product_id=product_id, amount=delta))
+                    changes[product_id] = delta
+                continue
+            changes[product_id] = max(line.amount + delta, 0) - line.amount
+            line.amount += delta
+            if line.amount > 0:
+                to_update.append(line)
+            else:
+                to_delete.append(line.pk)
+        _reserve(cart, changes, shop_address_id)
+        if to_create:
+            CartProduct.objects.bulk_create(to_create)
+        if to_update:
+            CartProduct.objects.bulk_update(to_update, ['amount'])
+        if to_delete:
+            CartProduct.objects.filter(pk__in=to_delete).delete()
+    return cart
+
+
+def _reserve(cart, changes, shop_address_id=None):
+    reservations = _reservations(cart, changes)
+    stock_ids = _stock_ids([p for p, change in changes.items() if change > 0 and p not in reservations], shop_address_id)
+    expires_at = timezone.now() + get_reservation_ttl()
+    moves, to_create, to_update, to_delete = {}, [], [], []
+    for product_id, change in changes.items():
+        reservation = reservations.get(product_id)
+        if reservation is None:
+            if change > 0 and product_id in stock_ids:
+                moves[stock_ids[product_id]] = (product_id, change)
+                to_create.append(StockReservation(
+                    cart=cart, stock_id=stock_ids[product_id], amount=change, expiresAt=expires_at
+                ))
+            continue
+        # Units whose reservation already expired are not given back twice.
+        change = max(change, -reservation.amount)
+        if change == 0:
+            continue
+        moves[reservation.stock_id] = (product_id, change)
+        reservation.amount += change
+        reservation.expiresAt = expires_at
+        (to_update if reservation.amount > 0 else to_delete).append(reservation)
+    # Fixed lock order, so carts touching the same products cannot deadlock.
+    for stock_id in sorted(moves):
+        product_id, change = moves[stock_id]
+        if not _move_stock(stock_id, change):
+            raise OutOfStockError(product_id)
+    if to_create:
+        StockReservation.objects.bulk_create(to_create)
+    if to_update:
+        StockReservation.objects.bulk_update(to_update, ['amount', 'expiresAt'])
+    if to_delete:
+        StockReservation.objects.filter(pk__in=[r.pk for r in to_delete]).delete()
+
+
+def remove_cart_line(line):
+    """Delete a cart line and give its reserved units back."""
+    with transaction.atomic():
+        cart = Cart.objects.select_for_update().get(pk=line.cart_id)
+        reservation = _reservations(cart, [line.product_id]).get(line.product_id)
+        if reservation is not None:
+            _move_stock(reservation.stock_id, -reservation.amount)
+            reservation.delete()
+        line.delete()
+        Cart.objects.filter(pk=cart.pk).update(updatedAt=timezone.now())
+
+
+def _commit_stock(cart, lines, shop_address_id=None):
+    """
+    Sell the cart's reserved units. Lines whose reservation expired meanwhile
+    are taken again from the ``shop_address_id`` pickup point, or central
+    stock for products it doesn't stock, if stock allows.
+    """
+    reservations = _reservations(cart)
+    unreserved = [line.product_id for line in lines if line.product_id not in reservations]
+    stock_ids = _stock_ids(unreserved)
+    if shop_address_id is not None:
+        stock_ids.update(_stock_ids(unreserved, shop_address_id))
+    moves = {}
+    for line in lines:
+        reservation = reservations.pop(line.product_id, None)
+        if reservation is not None:
+            moves[reservation.stock_id] = (line.product_id, line.amount - reservation.amount, reservation.amount)
+        elif line.product_id in stock_ids:
+            moves[stock_ids[line.product_id]] = (line.product_id, line.amount, 0)
+    # Reservations left over without a cart line are simply released.
+    for product_id, reservation in reservations.items():
+        moves[reservation.stock_id] = (product_id, -reservation.amount, reservation.amount)
+    for stock_id in sorted(moves):
+        product_id, take, held = moves[stock_id]
+        # Everything held for this cart leaves ``reserved``: sold, or given back when ``take`` is negative.
+        if not _move_stock(stock_id, take, release=take + held):
+            raise OutOfStockError(product_id)
+    StockReservation.objects.filter(cart=cart).delete()
+
+
+def release_expired_reservations(batch_size=500, now=None):
+    """
+    Give the units of expired reservations back to ``available``. Reservations
+    locked by a checkout in progress are skipped. Returns how many were released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expiresAt__lte=now).order_by('stock_id', 'id')[:batch_size]
+            )
+            if not batch:
+                return released
+            totals = defaultdict(int)
+            for reservation in batch:
+                totals[reservation.stock_id] += reservation.amount
+            for stock_id in sorted(totals):
+                _move_stock(stock_id, -totals[stock_id])
+            StockReservation.objects.filter(pk__in=[r.pk for r in batch]).delete()
+        released += len(batch)
+
+
+def reconcile_reserved():
+    """
+    Reset ``Stock.reserved`` to the sum of existing reservations, moving the
+    difference back to ``available``. Repairs counts after carts were deleted
+    without releasing their reservations. Returns how many rows were fixed.
+    """
+    fixed = 0
+    stocks = Stock.objects.annotate(held=Coalesce(Sum('reservations__amount'), 0)).exclude(reserved=F('held'))
+    for stock in stocks:
+        fixed += Stock.objects.filter(pk=stock.pk, reserved=stock.reserved).update(
+            available=F('available') + stock.reserved - stock.held,
+            reserved=stock.held,
+        )
+    return fixed
+
+
+def archive_purchased_carts(batch_size=500, after_id=0):
+    """
+    Delete the lines of purchased carts. What was bought lives on in the
+    order's ``OrderProduct`` snapshot, written here first for orders that lack
+    one; the cart rows stay, since orders point at them. Each batch is its own
+    transaction. Yields ``(last_cart_id, lines_deleted)`` per batch, so an
+    interrupted run can resume after ``last_cart_id``.
+    """
+    while True:
+        with transaction.atomic():
+            cart_ids = list(
+                CartProduct.objects.filter(cart__isPurchase=True, cart_id__gt=after_id)
+                .filter(
+                    Exists(Order.objects.filter(cart_id=OuterRef('cart_id')))
+                    | Exists(OrderArchive.objects.filter(cart_id=OuterRef('cart_id')))
+                )
+                .order_by('cart_id').values_list('cart_id', flat=True).distinct()[:batch_size]
+            )
+            if not cart_ids:
+                return
+            # Archived orders were given their snapshot when they were moved.
+            unsnapshotted = dict(
+                Order.objects.filter(cart_id__in=cart_ids)
+                .exclude(Exists(OrderProduct.objects.filter(order_id=OuterRef('pk'))))
+                .values_list('cart_id', 'id')
+            )
+            if unsnapshotted:
+                OrderProduct.objects.bulk_create(_snapshot_cart_lines(OrderProduct, unsnapshotted))
+            deleted, _ = CartProduct.objects.filter(cart_id__in=cart_ids).delete()
+        after_id = cart_ids[-1]
+        yield after_id, deleted
+
+
+def _snapshot_cart_lines(model, orders_by_cart):
+    """Line snapshots (``model`` instances) of the orders ``{cart_id: order_id}``, from their carts."""
+    return [
+        model(order_id=orders_by_cart[line.cart_id], product_id=line.product_id,
+              name=line.product.name, price=line.product.price, amount=line.amount)
+        for line in CartProduct.objects.filter(cart_id__in=orders_by_cart).select_related('product')
+    ]
+
+
+def rotate_orders(before, batch_size=500):
+    """
+    Move the orders placed before ``before`` to ``OrderArchive``, oldest
+    first and ``batch_size`` per transaction, with their line snapshots
+    (taken from the cart for orders cleanup_carts hasn't reached yet). Their
+    status events are deleted; the revenue and status rollups are left alone,
+    since archived orders still count. Yields ``(orders_moved, lines_moved)``
+    per batch.
+    """
+    position = Q()
+    while True:
+        with transaction.atomic():
+            # Locked, not skipped: an order left behind would be older than archived ones.
+            orders = list(
+                Order.objects.select_for_update().filter(position, date__lt=before).order_by('date', 'id')[:batch_size]
+            )
+            if not orders:
+                return
+            ids = [order.pk for order in orders]
+            OrderArchive.objects.bulk_create(
+                OrderArchive(**{field.attname: getattr(order, field.attname) for field in Order._meta.concrete_fields})
+                for order in orders
+            )
+            lines = [
+                OrderProductArchive(order_id=line.order_id, product_id=line.product_id, name=line.name,
+                                    price=line.price, amount=line.amount)
+                for line in OrderProduct.objects.filter(order_id__in=ids).order_by('id')
+            ]
+            snapshotted = {line.order_id for line in lines}
+            lines += _snapshot_cart_lines(
+                OrderProductArchive, {order.cart_id: order.pk for order in orders if order.pk not in snapshotted}
+            )
+            OrderProductArchive.objects.bulk_create(lines, batch_size=1000)
+            # Nothing else references these rows, so no collector (or its signals) is needed.
+            for queryset in (
+                OrderStatusEvent.objects.filter(order_id__in=ids),
+                OrderProduct.objects.filter(order_id__in=ids),
+                Order.objects.filter(pk__in=ids),
+            ):
+                queryset._raw_delete(queryset.db)
+        last = orders[-1]
+        position = Q(date__gt=last.date) | Q(date=last.date, id__gt=last.pk)
+        yield len(orders), len(lines)
+
+
+def delete_abandoned_carts(abandoned_before, empty_before=None, batch_size=500, after_id=0):
+    """
+    Delete open carts last changed before ``abandoned_before``, or before
+    ``empty_before`` when they have no lines, giving their reserved stock back
+    first. Carts locked by a request in progress are skipped. Yields
+    ``(last_cart_id, carts_deleted, reservations_released)`` per batch.
+    """
+    stale = Q(updatedAt__lt=abandoned_before)
+    if empty_before is not None:
+        stale |= Q(updatedAt__lt=empty_before) & ~Exists(CartProduct.objects.filter(cart_id=OuterRef('pk')))
+    while True:
+        with transaction.atomic():
+            cart_ids = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(stale, isPurchase=False, pk__gt=after_id)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not cart_ids:
+                return
+            reservations = list(StockReservation.objects.select_for_update().filter(cart_id__in=cart_ids))
+            totals = defaultdict(int)
+            for reservation in reservations:
+                totals[reservation.stock_id] += reservation.amount
+            for stock_id in sorted(totals):
+                _move_stock(stock_id, -totals[stock_id])
+            StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).delete()
+            CartProduct.objects.filter(cart_id__in=cart_ids).delete()
+            Cart.objects.filter(pk__in=cart_ids).delete()
+        after_id = cart_ids[-1]
+        yield after_id, len(cart_ids), len(reservations)
+
+
+def checkout(user_id, data, idempotency_key=None):
+    """
+    Turn the user's open cart into an order. Returns ``(order, created)``.
+
+    Runs as one transaction holding a row lock on the cart, so a double-submitted
+    checkout cannot produce two orders. Retries carrying the same idempotency key
+    get the original order back with ``created=False``.
+    """
+    try:
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(user_id=user_id, isPurchase=False).first()
+            if idempotency_key:
+                order = Order.objects.filter(user_id=user_id, idempotencyKey=idempotency_key).first()
+                if order is not None:
+                    return order, False
+            # Carts are created by their first line, so no open cart is an empty one.
+            lines = list(CartProduct.objects.filter(cart=cart).select_related('product')) if cart else []
+            if not lines:
+                raise CheckoutError("Cart is empty", 400)
+            _commit_stock(cart, lines, data.get('shopAddress_id'))
+            order = Order.objects.create(
+                user_id=user_id,
+                cart_id=cart.id,
+                idempotencyKey=idempotency_key,
+                **data
+            )
+            order_lines = OrderProduct.objects.bulk_create(
+                OrderProduct(order=order, product_id=line.product_id, name=line.product.name,
+                             price=line.product.price, amount=line.amount)
+                for line in lines
+            )
+            # The next cart is created by the first line added to it.
+            Cart.objects.filter(pk=cart.pk).update(isPurchase=True)
+            # Last, so the shared rollup rows stay locked only until the commit.
+            record_order(order, order_lines)
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        return Order.objects.get(user_id=user_id, idempotencyKey=idempotency_key), False
+    return order, True
+
+
+def transition_orders(order_ids, delivery_status_id):
+    """
+    Move many orders to one delivery status with a single UPDATE. ``update()``
+    skips the Order signals, so the status events and counts they would have
+    written are added here in bulk. Returns how many orders changed.
+    """
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update().filter(pk__in=order_ids)
+            .exclude(deliveryStatus_id=delivery_status_id).order_by('pk')
+            .values_list('pk', 'user_id', 'deliveryStatus_id')
+        )
+        if not orders:
+            return 0
+        Order.objects.filter(pk__in=[pk for pk, _, _ in orders]).update(deliveryStatus_id=delivery_status_id)
+        OrderStatusEvent.objects.bulk_create([
+            OrderStatusEvent(order_id=pk, user_id=user_id, deliveryStatus_id=delivery_status_id,
+                             changes={'deliveryStatus_id': delivery_status_id})
+            for pk, user_id, _ in orders
+        ], batch_size=1000)
+        old_status_counts = defaultdict(int)
+        for _, _, old_status_id in orders:
+            old_status_counts[old_status_id] += 1
+        record_status_transitions(orders[0][0], old_status_counts, delivery_status_id)
+        transaction.on_commit(hub.poke)
+    return len(orders)
+
+
+def _price_change(price=None, price_delta=None, price_percent=None):
+    """The price change as an UPDATE expression and as a function of one price, or None."""
+    if price is not None:
+        return price, lambda old: price
+    if price_delta is not None:
+        return F('price') + price_delta, lambda old: old + price_delta
+    if price_percent is not None:
+        factor = 1 + price_percent / 100
+        return Round(F('price') * factor, 2), lambda old: (old * factor).quantize(Decimal('0.01'))
+    return None
+
+
+def update_products(queryset, price=None, price_delta=None, price_percent=None, category_id=None, batch_size=1000):
+    """
+    Set, shift or scale the price of the products in ``queryset`` and/or move
+    them to ``category_id``, with one UPDATE per ``batch_size`` products, each
+    batch in its own transaction. ``update()`` skips the Product signals, so
+    category counts and the cache version are fixed once at the end. Raises
+    ``CatalogError`` for an unknown category or a price that would leave the
+    column's range. Returns how many products were updated.
+    """
+    changes = {}
+    price_change = _price_change(price, price_delta, price_percent)
+    if price_change is not None:
+        expression, apply = price_change
+        # Every change is monotonic, so checking the extremes covers all rows.
+        bounds = queryset.aggregate(low=Min('price'), high=Max('price'))
+        if bounds['low'] is not None and not all(0 <= apply(bound) <= MAX_PRICE for bound in bounds.values()):
+            raise CatalogError("Prices must stay between 0 and %s" % MAX_PRICE)
+        changes['price'] = expression
+    if category_id is not None:
+        if not Category.objects.filter(pk=category_id).exists():
+            raise CatalogError("Category not found")
+        changes['category_id'] = category_id
+    if not changes:
+        return 0
+
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    updated = 0
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            updated += Product.objects.filter(pk__in=ids[start:start + batch_size]).update(**changes)
+    if updated:
+        if category_id is not None:
+            recount_products()
+        bump_version(Product)
+        snapshots.invalidate()
+    return updated
+
+
+def delete_products(queryset, batch_size=1000):
+    """
+    Delete the products in ``queryset``, ``batch_size`` at a time, with one
+    statement per dependent table instead of Django's per-object collector and
+    signals: order lines and sales rollups keep their snapshot with the
+    product cleared, cart lines and stock rows (with their reservations) go,
+    photo variant files once the batch commits. Category counts, the cache
+    version and the search index are fixed once at the end. Returns how many
+    products were deleted.
+    """
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    deleted = 0
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            photos = Product.objects.filter(pk__in=batch).exclude(photoVariants={})
+            for variants in photos.values_list('photoVariants', flat=True):
+                transaction.on_commit(partial(delete_variants, variants))
+            OrderProduct.objects.filter(product_id__in=batch).update(product=None)
+            OrderProductArchive.objects.filter(product_id__in=batch).update(product=None)
+            ProductSales.objects.filter(product_id__in=batch).update(product=None)
+            CartProduct.objects.filter(product_id__in=batch).delete()
+            Stock.objects.filter(product_id__in=batch).delete()
+            products = Product.objects.filter(pk__in=batch)
+            # Nothing references these rows any more, so no collector is needed.
+            deleted += products._raw_delete(products.db)
+    if deleted:
+        recount_products()
+        bump_version(Product)
+        snapshots.invalidate()
+        if not uses_database_search():
+            for pk in ids:
+                inverted_index.remove(pk)
+    return deleted
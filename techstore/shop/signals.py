@@ -0,0 +1,122 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from shop import snapshots
+from shop.analytics import record_order, record_status_change
+from shop.authentication import forget_user
+from shop.cache import bump_version
+from shop.categories import adjust_product_count
+from shop.events import record_order_change
+from shop.images import delete_variants, variants_saved
+from shop.models import Category, DeliveryStatus, Order, OrderStatusEvent, Product, ShopAddress
+from shop.search import inverted_index, uses_database_search
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ShopAddress)
+@receiver(post_delete, sender=ShopAddress)
+@receiver(post_save, sender=DeliveryStatus)
+@receiver(post_delete, sender=DeliveryStatus)
+def invalidate_response_cache(sender, **kwargs):
+    # Deferred to the commit by bump_version.
+    bump_version(sender)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    if not uses_database_search():
+        inverted_index.update(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    if not uses_database_search():
+        inverted_index.remove(instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, update_fields=None, **kwargs):
+    instance._previous_category_id = None
+    if not instance._state.adding and (update_fields is None or {'category', 'category_id'} & update_fields):
+        instance._previous_category_id = (
+            Product.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_category_id', None)
+    if created:
+        adjust_product_count(instance.category_id, 1)
+    elif previous is not None and previous != instance.category_id:
+        adjust_product_count(previous, -1)
+        adjust_product_count(instance.category_id, 1)
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    adjust_product_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=Product)
+def refresh_saved_product_snapshots(sender, instance, **kwargs):
+    snapshots.invalidate([getattr(instance, '_previous_category_id', None), instance.category_id])
+
+
+@receiver(post_delete, sender=Product)
+def refresh_deleted_product_snapshots(sender, instance, **kwargs):
+    snapshots.invalidate([instance.category_id])
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_variants(sender, instance, **kwargs):
+    if instance.photoVariants:
+        transaction.on_commit(partial(delete_variants, instance.photoVariants))
+
+
+@receiver(variants_saved, sender=Product)
+def refresh_product_photo_snapshots(sender, product_id, **kwargs):
+    snapshots.invalidate(list(Product.objects.filter(pk=product_id).values_list('category_id', flat=True)))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def refresh_category_snapshots(sender, instance, **kwargs):
+    snapshots.invalidate([instance.pk])
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._previous_values = None
+    if not instance._state.adding:
+        instance._previous_values = (
+            Order.objects.filter(pk=instance.pk).values(*OrderStatusEvent.TRACKED_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def count_order_status(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_values', None)
+    record_status_change(instance.pk, previous and previous['deliveryStatus_id'], instance.deliveryStatus_id, created=created)
+    if previous:
+        record_order_change(instance, previous)
+
+
+@receiver(pre_delete, sender=Order)
+def uncount_order(sender, instance, **kwargs):
+    # Before the cascade removes the line snapshots.
+    record_order(instance, list(instance.lines.all()), sign=-1)
+    record_status_change(instance.pk, instance.deliveryStatus_id, None, deleted=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
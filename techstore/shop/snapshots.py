@@ -0,0 +1,334 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from itertools import groupby
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, close_old_connections, connections, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import quote_etag
+
+from shop import fastpath
+from shop.models import Category, Product
+from shop.renderers import FastJSONRenderer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FULL_CATALOG = 'all'
+MANIFEST = 'manifest.json'
+
+
+class SnapshotNotReady(Exception):
+    """The snapshot hasn't been built yet; the worker is on it."""
+
+
+def get_config():
+    config = {
+        'DIR': os.path.join(settings.MEDIA_ROOT, 'snapshots'),
+        'DELAY': 2.0,
+        'MAX_AGE': 300,
+        'GZIP': True,
+        'BROTLI': True,
+        'ACCEL_REDIRECT': None,
+    }
+    config.update(getattr(settings, 'SHOP_SNAPSHOTS', {}))
+    return config
+
+
+def category_key(category_id):
+    return 'category-%d' % category_id
+
+
+def _render(rows):
+    return FastJSONRenderer().render(fastpath.products.serialize(rows))
+
+
+def _write(directory, name, content):
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+    return name
+
+
+def _store(directory, key, body):
+    """Write ``body`` and its compressed copies under content-addressed names; returns the manifest entry."""
+    config = get_config()
+    version = hashlib.sha256(body).hexdigest()[:20]
+    stem = '%s-%s.json' % (key, version)
+    files = {'identity': _write(directory, stem, body)}
+    if config['GZIP']:
+        files['gzip'] = _write(directory, stem + '.gz', gzip.compress(body, compresslevel=6, mtime=0))
+    if config['BROTLI'] and brotli is not None:
+        files['br'] = _write(directory, stem + '.br', brotli.compress(body))
+    return {'version': version, 'size': len(body), 'files': files}
+
+
+class _BuildLock:
+    """Serializes builds in this process and, where ``fcntl`` exists, across processes sharing the directory."""
+    _lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, '.lock')
+
+    def __enter__(self):
+        self._lock.acquire()
+        if fcntl is not None:
+            self.file = open(self.path, 'w')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            self.file.close()
+        self._lock.release()
+
+
+def read_manifest():
+    try:
+        with open(os.path.join(get_config()['DIR'], MANIFEST), 'rb') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def build(category_ids=None):
+    """
+    Regenerate the snapshots of ``category_ids`` (every category when None)
+    and the full catalog, which is stitched together from the per-category
+    files instead of being queried again. Each snapshot is the
+    ``ProductSerializer`` list of its products ordered by id; the full
+    catalog is ordered by category, then id. The new set is published by
+    replacing the manifest, and files it no longer references are deleted.
+    Categories missing from the manifest are always built, so ``[]`` builds
+    only what is missing, and nothing if another build already did.
+    Returns the manifest.
+    """
+    directory = get_config()['DIR']
+    os.makedirs(directory, exist_ok=True)
+    with _BuildLock(directory):
+        previous = read_manifest() or {'entries': {}}
+        existing = set(Category.objects.using(DEFAULT_DB_ALIAS).values_list('id', flat=True))
+        if category_ids is None:
+            stale = existing
+        else:
+            # Categories never built before are added along the way.
+            stale = (set(category_ids) | {pk for pk in existing if category_key(pk) not in previous['entries']}) & existing
+            expected = {category_key(pk) for pk in existing} | {FULL_CATALOG}
+            if not stale and set(previous['entries']) == expected:
+                return previous
+
+        bodies = {pk: b'[]' for pk in stale}
+        products = Product.objects.using(DEFAULT_DB_ALIAS).filter(category_id__in=stale).order_by('category_id', 'id')
+        for category_id, rows in groupby(fastpath.products.rows(products).iterator(), key=lambda row: row.category_id):
+            bodies[category_id] = _render(list(rows))
+
+        entries = {}
+        parts = []
+        for category_id in sorted(existing):
+            key = category_key(category_id)
+            if category_id in bodies:
+                entries[key] = _store(directory, key, bodies[category_id])
+                body = bodies[category_id]
+            else:
+                entries[key] = previous['entries'][key]
+                with open(os.path.join(directory, entries[key]['files']['identity']), 'rb') as f:
+                    body = f.read()
+            if body != b'[]':
+                parts.append(body[1:-1])
+        entries[FULL_CATALOG] = _store(directory, FULL_CATALOG, b'[' + b','.join(parts) + b']')
+
+        manifest = {'built': time.time(), 'entries': entries}
+        _write_manifest(directory, manifest)
+        referenced = {name for entry in entries.values() for name in entry['files'].values()}
+        for entry in previous['entries'].values():
+            for name in entry['files'].values():
+                if name not in referenced:
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+    _manifest_cache.clear()
+    return manifest
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+class _ManifestCache:
+    """The parsed manifest, reloaded when the file's mtime changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._manifest = None
+
+    def get(self):
+        path = os.path.join(get_config()['DIR'], MANIFEST)
+        try:
+            stat = os.stat(path)
+            stamp = (path, stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if stamp != self._stamp:
+                self._manifest, self._stamp = read_manifest(), stamp
+            return self._manifest
+
+    def clear(self):
+        with self._lock:
+            self._stamp = self._manifest = None
+
+
+_manifest_cache = _ManifestCache()
+
+
+class SnapshotWorker:
+    """
+    Rebuilds snapshots in a daemon thread after catalog writes. Changes are
+    collected for ``DELAY`` seconds, so a burst of writes costs one build, and
+    only the categories they touched are rendered again. Writes made by
+    other processes are picked up once the manifest is older than
+    ``MAX_AGE`` and a request asks for a snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._dirty = set()
+        self._everything = False
+        self._thread = None
+
+    def mark(self, category_ids=None):
+        """Queue a rebuild of ``category_ids``, or of everything when None."""
+        with self._lock:
+            if category_ids is None:
+                self._everything = True
+            else:
+                self._dirty.update(pk for pk in category_ids if pk is not None)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shop-snapshots', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(get_config()['DELAY'])
+            self._wake.clear()
+            with self._lock:
+                category_ids = None if self._everything else self._dirty
+                self._dirty, self._everything = set(), False
+            close_old_connections()
+            try:
+                build(category_ids)
+            except (DatabaseError, OSError):
+                logger.exception('Failed to rebuild catalog snapshots')
+            finally:
+                connections.close_all()
+
+
+worker = SnapshotWorker()
+
+
+def invalidate(category_ids=None):
+    """
+    Rebuild the snapshots of ``category_ids`` (all when None) after the
+    current transaction commits. Nothing happens until snapshots were built
+    once, so processes that never serve them don't write any.
+    """
+    if os.path.exists(os.path.join(get_config()['DIR'], MANIFEST)):
+        transaction.on_commit(lambda: worker.mark(category_ids))
+
+
+def get_snapshot(category_id=None):
+    """
+    The manifest entry for a category's products or, without ``category_id``,
+    the whole catalog; None for unknown categories. Missing snapshots (none
+    built yet, or a category created since the last build) are queued for
+    the worker and raise ``SnapshotNotReady`` meanwhile, so a cold start
+    costs one build rather than one per request.
+    """
+    key = FULL_CATALOG if category_id is None else category_key(category_id)
+    manifest = _manifest_cache.get()
+    if manifest is None or key not in manifest['entries']:
+        if category_id is not None and not Category.objects.filter(pk=category_id).exists():
+            return None
+        worker.mark([])
+        raise SnapshotNotReady
+    if time.time() - manifest['built'] > get_config()['MAX_AGE']:
+        worker.mark()
+    return manifest['entries'][key]
+
+
+def snapshot_response(request, category_id=None):
+    """The response for a snapshot, or None for unknown categories. Raises ``SnapshotNotReady``."""
+    for attempt in range(2):
+        entry = get_snapshot(category_id)
+        if entry is None:
+            return None
+        try:
+            return serve(request, entry)
+        except FileNotFoundError:
+            # Replaced by a build since the manifest was read; the next read sees the new one.
+            if attempt:
+                raise
+            _manifest_cache.clear()
+
+
+def _encoding(request, files):
+    accepted = {
+        token.split(';')[0].strip(): 'q=0' not in token.replace(' ', '')
+        for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')
+    }
+    for encoding in ('br', 'gzip'):
+        if encoding in files and accepted.get(encoding):
+            return encoding
+    return 'identity'
+
+
+def serve(request, entry):
+    """
+    Answer with a snapshot file in the best encoding the client accepts, via
+    ``X-Accel-Redirect`` when ``ACCEL_REDIRECT`` names the internal nginx
+    location of ``DIR``, otherwise as a ``FileResponse`` the WSGI server can
+    send with sendfile.
+    """
+    config = get_config()
+    encoding = _encoding(request, entry['files'])
+    etag = quote_etag(entry['version'] if encoding == 'identity' else '%s-%s' % (entry['version'], encoding))
+    if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+        response = HttpResponseNotModified()
+    else:
+        name = entry['files'][encoding]
+        if config['ACCEL_REDIRECT']:
+            response = HttpResponse(content_type='application/json')
+            response['X-Accel-Redirect'] = config['ACCEL_REDIRECT'].rstrip('/') + '/' + name
+        else:
+            response = FileResponse(open(os.path.join(config['DIR'], name), 'rb'), content_type='application/json')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'no-cache'
+    return response
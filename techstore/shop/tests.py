@@ -1,3 +1,1863 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt import tokens as jwt_tokens
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from shop import fastpath, schema, snapshots
+from shop.analytics import backfill as backfill_analytics
+from shop.async_views import AsyncOrderEventStreamAPIView
+from shop.authentication import get_user_cache
+from shop.bench import clear_seed, seed, sync_only_middleware
+from shop.cache import LocMemLRUBackend, ResponseCache, SingleFlight, get_response_cache
+from shop.catalog_io import import_catalog
+from shop.categories import recount_products
+from shop.events import fetch_events, hub
+from shop.metrics import registry
+from shop.middleware import RequestMetricsMiddleware
+from shop.models import (
+    Cart,
+    CartProduct,
+    Category,
+    DailyRevenue,
+    DeliveryStatus,
+    DeliveryStatusCount,
+    Order,
+    OrderArchive,
+    OrderProduct,
+    OrderProductArchive,
+    OrderStatusEvent,
+    Product,
+    ProductSales,
+    ShopAddress,
+    Stock,
+    StockReservation,
+)
+from shop.renderers import FastJSONRenderer
+from shop.routers import PrimaryReplicaRouter, ReplicaRoutingMiddleware, check_pin_cache, current_replica
+from shop.search import inverted_index
+from shop.serializers import CartProductSerializer, CategorySerializer, OrderSerializer, ProductSerializer
+from shop.services import (
+    apply_cart_deltas,
+    archive_purchased_carts,
+    delete_abandoned_carts,
+    delete_products,
+    release_expired_reservations,
+    rotate_orders,
+    update_products,
+)
+from shop.throttling import parse_rate, take_token
+
+
+# Checkouts racing on one cart or stock row need row locks, or a SQLite
+# database whose transactions take its write lock up front.
+SERIALIZES_WRITERS = (
+    connection.features.has_select_for_update
+    or connection.settings_dict['OPTIONS'].get('transaction_mode') == 'IMMEDIATE'
+)
+
+
+class ExpandedReadModelQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Laptops')
+        self.products = [
+            Product.objects.create(name='Laptop %d' % i, price=Decimal('100.50'), category=category)
+            for i in range(10)
+        ]
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Nezavisimosti 1')
+        self.delivery_status = DeliveryStatus.objects.create(name='Delivered')
+
+    def fill_cart(self, cart, products):
+        CartProduct.objects.bulk_create(
+            CartProduct(cart=cart, product=product, amount=2) for product in products
+        )
+
+    def create_orders(self, count, lines):
+        for _ in range(count):
+            cart = Cart.objects.create(user=self.user, isPurchase=True)
+            self.fill_cart(cart, self.products[:lines])
+            order = Order.objects.create(
+                user=self.user, cart=cart, deliveryType=True,
+                shopAddress=self.shop_address, deliveryStatus=self.delivery_status,
+            )
+            OrderProduct.objects.bulk_create(
+                OrderProduct(order=order, product=product, name=product.name, price=product.price, amount=2)
+                for product in self.products[:lines]
+            )
+
+    def test_cart_expand_query_count_is_constant(self):
+        cart = Cart.objects.create(user=self.user)
+        self.fill_cart(cart, self.products[:1])
+        with self.assertNumQueries(2):
+            response = self.client.get('/shop/api/v1/cartproducts/?expand=1')
+        self.assertEqual(len(response.data['items']), 1)
+
+        self.fill_cart(cart, self.products[1:])
+        with self.assertNumQueries(2):
+            response = self.client.get('/shop/api/v1/cartproducts/?expand=1')
+        self.assertEqual(len(response.data['items']), 10)
+        self.assertEqual(response.data['items'][0]['product']['name'], 'Laptop 0')
+        self.assertEqual(response.data['items'][0]['line_total'], '201.00')
+        self.assertEqual(response.data['total'], '2010.00')
+
+    def test_order_expand_query_count_is_constant(self):
+        # Orders with their lines, then the (empty) archive the short page runs on into.
+        self.create_orders(1, 1)
+        with self.assertNumQueries(3):
+            self.client.get('/shop/api/v1/orders/?expand=1')
+
+        self.create_orders(5, 10)
+        with self.assertNumQueries(3):
+            response = self.client.get('/shop/api/v1/orders/?expand=1')
+        self.assertEqual(len(response.data['results']), 6)
+        order = response.data['results'][0]
+        self.assertEqual(order['shopAddress']['address'], 'Minsk, Nezavisimosti 1')
+        self.assertEqual(order['deliveryStatus']['name'], 'Delivered')
+        self.assertEqual(len(order['items']), 10)
+        self.assertEqual(order['total'], '2010.00')
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        self.client.post('/shop/api/v1/cartproducts/', {'product_id': self.product.id, 'amount': 3}, format='json')
+
+    def test_checkout_snapshots_line_prices(self):
+        response = self.client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': self.shop_address.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('99.00'))
+        line = OrderProduct.objects.get(order_id=response.data['id'])
+        self.assertEqual((line.name, line.price, line.amount), ('Phone', Decimal('10.00'), 3))
+        self.assertFalse(CartProduct.objects.filter(cart__user=self.user, cart__isPurchase=False).exists())
+
+    def test_idempotency_key_replays_original_order(self):
+        payload = {'deliveryType': True, 'shopAddress_id': self.shop_address.id}
+        first = self.client.post('/shop/api/v1/orders/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        second = self.client.post('/shop/api/v1/orders/', payload, format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_of_empty_cart_is_rejected(self):
+        payload = {'deliveryType': True, 'shopAddress_id': self.shop_address.id}
+        self.client.post('/shop/api/v1/orders/', payload, format='json')
+        response = self.client.post('/shop/api/v1/orders/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.count(), 1)
+
+
+@skipUnless(SERIALIZES_WRITERS, 'needs row locks or SQLite write locks taken at BEGIN, see techstore/settings_test.py')
+class ConcurrentCheckoutTests(TransactionTestCase):
+    threads = 16
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        category = Category.objects.create(name='Phones')
+        product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        cart = Cart.objects.create(user=self.user)
+        CartProduct.objects.create(cart=cart, product=product, amount=1)
+
+    def submit(self, idempotency_key):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            headers = {'HTTP_IDEMPOTENCY_KEY': idempotency_key} if idempotency_key else {}
+            payload = {'deliveryType': True, 'shopAddress_id': self.shop_address.id}
+            return client.post('/shop/api/v1/orders/', payload, format='json', **headers).status_code
+        finally:
+            connection.close()
+
+    def hammer(self, idempotency_key=None):
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return list(pool.map(self.submit, [idempotency_key] * self.threads))
+
+    def test_double_submit_creates_one_order(self):
+        codes = self.hammer()
+        self.assertEqual(codes.count(201), 1)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Cart.objects.filter(user=self.user, isPurchase=False).count(), 0)
+
+    def test_retries_with_idempotency_key_create_one_order(self):
+        codes = self.hammer('retry-key')
+        self.assertEqual(codes.count(201), 1)
+        self.assertEqual(codes.count(200), self.threads - 1)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.stock = Stock.objects.create(product=self.product, available=5)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+
+    def add(self, amount):
+        return self.client.post('/shop/api/v1/cartproducts/', {'product_id': self.product.id, 'amount': amount}, format='json')
+
+    def assertStock(self, available, reserved):
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.available, self.stock.reserved), (available, reserved))
+
+    def test_cart_reserves_and_releases_stock(self):
+        self.assertEqual(self.add(3).status_code, 201)
+        self.assertStock(2, 3)
+        self.assertEqual(self.add(3).status_code, 409)
+        self.assertStock(2, 3)
+        self.add(-1)
+        self.assertStock(3, 2)
+        line = CartProduct.objects.get(cart__user=self.user)
+        self.client.delete('/shop/api/v1/cartproducts/%d/' % line.id)
+        self.assertStock(5, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_checkout_sells_reserved_stock(self):
+        self.add(2)
+        response = self.client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': self.shop_address.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertStock(3, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        self.add(2)
+        StockReservation.objects.update(expiresAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertStock(5, 0)
+        # The line is still in the cart, checkout reserves it again.
+        Stock.objects.filter(pk=self.stock.pk).update(available=1)
+        response = self.client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': self.shop_address.id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertStock(1, 0)
+
+    def test_expired_pickup_reservation_is_sold_from_pickup_point(self):
+        Stock.objects.all().delete()
+        pickup = Stock.objects.create(product=self.product, shopAddress=self.shop_address, available=4)
+        response = self.client.post('/shop/api/v1/cartproducts/', {
+            'product_id': self.product.id, 'amount': 3, 'shopAddress_id': self.shop_address.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        StockReservation.objects.update(expiresAt=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(release_expired_reservations(), 1)
+        response = self.client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': self.shop_address.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        pickup.refresh_from_db()
+        self.assertEqual((pickup.available, pickup.reserved), (1, 0))
+
+    def test_untracked_products_are_not_limited(self):
+        Stock.objects.all().delete()
+        self.assertEqual(self.add(100).status_code, 201)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+@skipUnless(SERIALIZES_WRITERS, 'needs row locks or SQLite write locks taken at BEGIN, see techstore/settings_test.py')
+class StockContentionTests(TransactionTestCase):
+    buyers = 24
+    stock = 10
+
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        Stock.objects.create(product=self.product, available=self.stock)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        self.users = [User.objects.create_user('buyer%d' % i, password='secret') for i in range(self.buyers)]
+
+    def buy(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            added = client.post('/shop/api/v1/cartproducts/', {'product_id': self.product.id, 'amount': 1}, format='json')
+            if added.status_code != 201:
+                return added.status_code
+            payload = {'deliveryType': True, 'shopAddress_id': self.shop_address.id}
+            return client.post('/shop/api/v1/orders/', payload, format='json').status_code
+        finally:
+            connection.close()
+
+    def test_flash_sale_never_oversells(self):
+        with ThreadPoolExecutor(max_workers=self.buyers) as pool:
+            codes = list(pool.map(self.buy, self.users))
+        self.assertEqual(codes.count(201), self.stock)
+        self.assertEqual(codes.count(409), self.buyers - self.stock)
+        sold = OrderProduct.objects.filter(product=self.product).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(sold, self.stock)
+        stock = Stock.objects.get(product=self.product)
+        self.assertEqual((stock.available, stock.reserved), (0, 0))
+
+
+@override_settings(SHOP_DB_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 60, 'CACHE': 'default'})
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def route(self, method, authorization='Bearer a', status_code=200):
+        seen = []
+
+        def view(request):
+            seen.append(current_replica.get())
+            return HttpResponse(status=status_code)
+
+        request = self.factory.generic(method, '/shop/api/v1/cartproducts/', HTTP_AUTHORIZATION=authorization)
+        ReplicaRoutingMiddleware(view)(request)
+        return seen[0]
+
+    def test_router_follows_current_request(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Product))
+        token = current_replica.set('replica')
+        try:
+            self.assertEqual(router.db_for_read(Product), 'replica')
+            self.assertEqual(router.db_for_write(Product), 'default')
+        finally:
+            current_replica.reset(token)
+
+    def test_safe_methods_read_from_replica(self):
+        self.assertEqual(self.route('GET'), 'replica')
+        self.assertIsNone(self.route('POST'))
+
+    def test_successful_write_pins_client_to_primary(self):
+        self.route('POST', status_code=400)
+        self.assertEqual(self.route('GET'), 'replica')
+        self.route('POST', status_code=201)
+        self.assertIsNone(self.route('GET'))
+        self.assertEqual(self.route('GET', authorization='Bearer b'), 'replica')
+
+    async def aroute(self, method, authorization='Bearer a', status_code=200):
+        seen = []
+
+        async def view(request):
+            seen.append(current_replica.get())
+            return HttpResponse(status=status_code)
+
+        request = self.factory.generic(method, '/shop/api/v1/cartproducts/', HTTP_AUTHORIZATION=authorization)
+        await ReplicaRoutingMiddleware(view)(request)
+        self.assertIsNone(current_replica.get())
+        return seen[0]
+
+    async def test_async_requests_are_routed_and_pinned(self):
+        self.assertEqual(await self.aroute('GET'), 'replica')
+        self.assertIsNone(await self.aroute('POST', status_code=201))
+        self.assertIsNone(await self.aroute('GET'))
+        self.assertEqual(await self.aroute('GET', authorization='Bearer b'), 'replica')
+
+    @override_settings(DEBUG=True)
+    def test_asgi_handler_chain_is_not_adapted(self):
+        self.assertEqual(sync_only_middleware(), [])
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    @override_settings(SHOP_DB_ROUTING={'REPLICAS': []})
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertIsNone(self.route('GET'))
+
+    def test_per_process_pin_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_pin_cache(None)], ['shop.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}):
+            self.assertEqual(check_pin_cache(None), [])
+
+
+@skipUnless('replica' in settings.DATABASES, 'needs a replica alias, see techstore/settings_test.py')
+@override_settings(SHOP_DB_ROUTING={'REPLICAS': ['replica'], 'STICKY_SECONDS': 60, 'CACHE': 'default'})
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        get_response_cache().backend.clear()
+        # Users exist on both databases, as they would after replication; the catalog only on the primary.
+        self.buyer = User.objects.create_user('buyer', password='secret')
+        self.other = User.objects.create_user('other', password='secret')
+        for user in (self.buyer, self.other):
+            User.objects.using('replica').create(pk=user.pk, username=user.username, password=user.password)
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % RefreshToken.for_user(user).access_token)
+        return client
+
+    def test_reads_are_served_by_replica(self):
+        Order.objects.create(user=self.other, cart=Cart.objects.create(user=self.other, isPurchase=True),
+                             deliveryType=False, deliveryAddress='Minsk')
+        response = self.client_for(self.other).get('/shop/api/v1/orders/')
+        self.assertEqual(response.data['results'], [])
+
+    def test_cached_response_misses_read_from_primary(self):
+        # Whatever a miss stores is served to every client until the next write.
+        response = self.client_for(self.other).get('/shop/api/v1/products/%d/' % self.product.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_client_reads_its_own_writes(self):
+        buyer = self.client_for(self.buyer)
+        response = buyer.post('/shop/api/v1/cartproducts/', {'product_id': self.product.pk, 'amount': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(buyer.get('/shop/api/v1/cartproducts/').data), 1)
+        self.assertEqual(self.client_for(self.other).get('/shop/api/v1/cartproducts/').data, [])
+
+
+class IndexUsageTests(TestCase):
+    """The hot lookups of the views are answered from an index, not a scan of the table."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.cart = Cart.objects.create(user=self.user)
+        if connection.vendor == 'postgresql':
+            # The test tables are tiny, so the planner would rather scan them.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index=None):
+        plan = queryset.explain()
+        if connection.vendor == 'sqlite':
+            self.assertIn('USING', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        elif connection.vendor == 'postgresql':
+            self.assertIn('Index', plan)
+            self.assertNotIn('Sort', plan)
+        if index is not None and connection.vendor in ('sqlite', 'postgresql'):
+            self.assertIn(index, plan)
+
+    def test_open_cart_by_user(self):
+        self.assertUsesIndex(Cart.objects.filter(user=self.user, isPurchase=False))
+
+    def test_cart_lines(self):
+        self.assertUsesIndex(CartProduct.objects.filter(cart=self.cart))
+        self.assertUsesIndex(CartProduct.objects.filter(cart=self.cart, product=self.product))
+
+    def test_orders_by_user_by_date(self):
+        self.assertUsesIndex(
+            Order.objects.filter(user_id=self.user.id).order_by('date', 'id'), 'shop_order_user_date_idx'
+        )
+
+    def test_product_by_name(self):
+        self.assertUsesIndex(Product.objects.filter(name='Phone'))
+
+    def test_products_of_category_by_price(self):
+        # Fresh statistics of a catalog with several categories: those earlier
+        # tests leave behind can make another index look as cheap. The view
+        # reads a page at a time, hence the LIMIT.
+        categories = [self.product.category] + [Category.objects.create(name='Category %d' % i) for i in range(9)]
+        Product.objects.bulk_create(
+            Product(name='Product %d' % i, price=Decimal(i % 50), category=categories[i % 10]) for i in range(5000)
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE shop_product')
+        self.assertUsesIndex(
+            Product.objects.filter(category_id=self.product.category_id).order_by('price', 'id')[:21],
+            'shop_product_cat_price_idx',
+        )
+
+    def test_order_event_feed(self):
+        self.assertUsesIndex(
+            OrderStatusEvent.objects.filter(user_id=self.user.id, id__gt=0).order_by('id'), 'shop_orderstatusevent_feed_idx'
+        )
+
+
+class OrderConstraintTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Nezavisimosti 1')
+
+    def test_delivery_rules_are_checked_by_the_database(self):
+        cart = Cart.objects.create(user=self.user, isPurchase=True)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(user=self.user, cart=cart, deliveryType=True, deliveryAddress='Minsk')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(user=self.user, cart=cart, deliveryType=False, shopAddress=self.shop_address)
+        Order.objects.create(user=self.user, cart=cart, deliveryType=True, shopAddress=self.shop_address)
+
+    def test_changing_delivery_type_replaces_destination(self):
+        cart = Cart.objects.create(user=self.user, isPurchase=True)
+        order = Order.objects.create(user=self.user, cart=cart, deliveryType=True, shopAddress=self.shop_address)
+        response = self.client.put('/shop/api/v1/orders/%d/' % order.pk, {'deliveryType': False, 'deliveryAddress': 'Minsk'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual((order.deliveryAddress, order.shopAddress_id), ('Minsk', None))
+
+    def test_duplicate_product_name_is_a_field_error(self):
+        category = Category.objects.create(name='Phones')
+        Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.post('/shop/api/v1/products/', {'name': 'Phone', 'price': '5.00', 'category_id': category.pk, 'description': 'd'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('name', response.data)
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Nezavisimosti 1')
+        now = timezone.now()
+        self.orders = []
+        for days in range(10, 0, -1):
+            cart = Cart.objects.create(user=self.user, isPurchase=True)
+            order = Order.objects.create(user=self.user, cart=cart, deliveryType=True, shopAddress=self.shop_address)
+            OrderProduct.objects.create(order=order, product=self.product, name='Phone', price=Decimal('10.00'), amount=days)
+            Order.objects.filter(pk=order.pk).update(date=now - timedelta(days=days))
+            self.orders.append(order.pk)
+
+    def rotate(self, days):
+        return list(rotate_orders(timezone.now() - timedelta(days=days), batch_size=2))
+
+    def pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_rotation_moves_old_orders_and_lines(self):
+        batches = self.rotate(5.5)
+        self.assertEqual(sum(orders for orders, _ in batches), 5)
+        self.assertEqual(list(OrderArchive.objects.order_by('date').values_list('id', flat=True)), self.orders[:5])
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(OrderProductArchive.objects.get(order_id=self.orders[0]).amount, 10)
+        self.assertFalse(OrderProduct.objects.filter(order_id__in=self.orders[:5]).exists())
+        self.assertEqual(self.client.get('/shop/api/v1/orders/%d/' % self.orders[0]).data['id'], self.orders[0])
+
+    def test_pages_run_from_active_into_archived_orders(self):
+        self.rotate(5.5)
+        self.assertEqual(self.pages('/shop/api/v1/orders/?page_size=3'), self.orders[::-1])
+        self.assertEqual(self.pages('/shop/api/v1/orders/?page_size=3&ordering=date'), self.orders)
+        response = self.client.get('/shop/api/v1/orders/?page_size=3')
+        previous = self.client.get(self.client.get(response.data['next']).data['previous'])
+        self.assertEqual([order['id'] for order in previous.data['results']], self.orders[:-4:-1])
+
+    def test_first_page_of_recent_orders_skips_archive(self):
+        self.rotate(5.5)
+        with self.assertNumQueries(1):
+            self.client.get('/shop/api/v1/orders/?page_size=3')
+
+    def test_staff_listing_filters(self):
+        self.rotate(5.5)
+        other = User.objects.create_user('other', password='secret')
+        Order.objects.create(user=other, cart=Cart.objects.create(user=other, isPurchase=True),
+                             deliveryType=False, deliveryAddress='Minsk')
+        self.assertEqual(self.client.get('/shop/api/v1/orders/all/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(len(self.pages('/shop/api/v1/orders/all/')), 11)
+        self.assertEqual(len(self.pages('/shop/api/v1/orders/all/?deliveryType=false')), 1)
+        self.assertEqual(len(self.pages('/shop/api/v1/orders/all/?user_id=%d' % self.user.pk)), 10)
+        day = timezone.localdate(timezone.now() - timedelta(days=7))
+        self.assertEqual(self.pages('/shop/api/v1/orders/all/?date_from=%s&date_to=%s' % (day, day)), [self.orders[3]])
+
+
+class OrderEventFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.order = Order.objects.create(user=self.user, cart=Cart.objects.create(user=self.user, isPurchase=True),
+                                          deliveryType=False, deliveryAddress='Minsk')
+
+    def event(self, **kwargs):
+        return OrderStatusEvent.objects.create(order=self.order, user=self.user, changes={'deliveryAddress': 'Brest'}, **kwargs)
+
+    def test_events_behind_an_uncommitted_id_are_held_back(self):
+        first = self.event()
+        # The id in between belongs to a transaction that hasn't committed yet.
+        third = self.event(id=first.id + 2)
+        self.assertEqual([event['id'] for event in fetch_events(self.user.id, 0, 10)], [first.id])
+        self.event(id=first.id + 1)
+        self.assertEqual([event['id'] for event in fetch_events(self.user.id, first.id, 10)], [first.id + 1, third.id])
+
+    def test_gap_is_given_up_after_the_grace_period(self):
+        first = self.event()
+        third = self.event(id=first.id + 2)
+        OrderStatusEvent.objects.filter(pk=third.pk).update(createdAt=timezone.now() - timedelta(minutes=1))
+        self.assertEqual([event['id'] for event in fetch_events(self.user.id, 0, 10)], [first.id, third.id])
+
+
+@override_settings(SHOP_ORDER_EVENTS={'POLL_INTERVAL': 0.05, 'KEEPALIVE': 1})
+class OrderEventPushTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.order = Order.objects.create(user=self.user, cart=Cart.objects.create(user=self.user, isPurchase=True),
+                                          deliveryType=False, deliveryAddress='Minsk')
+        self.status = DeliveryStatus.objects.create(name='Shipped')
+
+    def change_later(self, delay=0.2, **fields):
+        def change():
+            try:
+                for field, value in fields.items():
+                    setattr(self.order, field, value)
+                self.order.save()
+            finally:
+                connection.close()
+        timer = threading.Timer(delay, change)
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_hub_wakes_subscriber_and_waits_for_gaps(self):
+        async def scenario():
+            subscription = await hub.subscribe(self.user.id, 0)
+            try:
+                self.assertEqual(await subscription.next(0.1), [])
+                self.change_later(deliveryStatus=self.status)
+                events = await subscription.next(5)
+                self.assertEqual([event['deliveryStatus_id'] for event in events], [self.status.id])
+                gap = events[-1]['id'] + 1
+                await asyncio.to_thread(self.event_in_thread, id=gap + 1)
+                self.assertEqual(await subscription.next(0.3), [])
+                await asyncio.to_thread(self.event_in_thread, id=gap)
+                self.assertEqual([event['id'] for event in await subscription.next(5)], [gap, gap + 1])
+            finally:
+                hub.unsubscribe(subscription)
+        async_to_sync(scenario)()
+
+    def event_in_thread(self, **kwargs):
+        try:
+            OrderStatusEvent.objects.create(order=self.order, user=self.user, changes={}, **kwargs)
+        finally:
+            connection.close()
+
+    def test_long_poll_returns_change(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.change_later(deliveryAddress='Brest')
+        response = client.get('/shop/api/v1/async/orders/changes/?timeout=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['changes'] for event in response.json()['events']], [{'deliveryAddress': 'Brest'}])
+        self.assertEqual(response.json()['cursor'], response.json()['events'][-1]['id'])
+
+    def test_stream_sends_changes_and_keepalives(self):
+        async def scenario():
+            stream = AsyncOrderEventStreamAPIView().stream(self.user.id, 0)
+            try:
+                self.assertEqual(await stream.__anext__(), 'retry: 3000\n\n')
+                self.change_later(deliveryStatus=self.status)
+                chunk = await stream.__anext__()
+                self.assertTrue(chunk.startswith('id: '), chunk)
+                self.assertIn('"deliveryStatus_id":%d' % self.status.id, chunk)
+                self.assertEqual(await stream.__anext__(), ': keepalive\n\n')
+            finally:
+                await stream.aclose()
+            self.assertFalse(hub._subscriptions)
+        async_to_sync(scenario)()
+
+
+class BenchSeedTests(TransactionTestCase):
+    def test_clear_removes_seeded_products_with_their_rollups(self):
+        seed(categories=3, products=50, users=3, cart_lines=2, orders=2)
+        self.assertTrue(ProductSales.objects.filter(product__name__startswith='bench-').exists())
+        # Commits its own transaction, so foreign keys are checked on the way.
+        clear_seed()
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(ProductSales.objects.filter(product__isnull=False).exists())
+
+
+@override_settings(SHOP_ANALYTICS={'BUCKETS': 4})
+class AnalyticsRollupTests(TestCase):
+    urls = ['/shop/api/v1/analytics/revenue/', '/shop/api/v1/analytics/products/',
+            '/shop/api/v1/analytics/deliverystatuses/']
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Phones')
+        self.products = [Product.objects.create(name=name, price=price, category=category)
+                         for name, price in (('Phone', Decimal('10.50')), ('Case', Decimal('3.00')))]
+        self.shop_address = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        self.status = DeliveryStatus.objects.create(name='Shipped')
+        self.orders = []
+        for amount in range(1, 6):
+            for product in self.products:
+                self.client.post('/shop/api/v1/cartproducts/', {'product_id': product.id, 'amount': amount}, format='json')
+            response = self.client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': self.shop_address.id}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.orders.append(response.data['id'])
+
+    def reports(self):
+        return [self.client.get(url).data for url in self.urls]
+
+    def assertMatchesBackfill(self):
+        reports = self.reports()
+        backfill_analytics()
+        self.assertEqual(reports, self.reports())
+
+    def test_checkouts_spread_over_buckets(self):
+        self.assertEqual(DailyRevenue.objects.count(), 4)
+        revenue = self.client.get(self.urls[0]).data
+        self.assertEqual([(day['orders'], day['units'], day['revenue']) for day in revenue], [(5, 30, '202.50')])
+        self.assertMatchesBackfill()
+
+    def test_status_changes_and_deletes_match_backfill(self):
+        self.client.post('/shop/api/v1/orders/status/', {'order_ids': self.orders[:3], 'deliveryStatus_id': self.status.id}, format='json')
+        order = Order.objects.get(pk=self.orders[3])
+        order.deliveryStatus = self.status
+        order.save()
+        Order.objects.get(pk=self.orders[0]).delete()
+        statuses = self.client.get(self.urls[2]).data
+        self.assertEqual([(row['deliveryStatus_id'], row['orders']) for row in statuses], [(None, 1), (self.status.id, 3)])
+        self.assertMatchesBackfill()
+
+
+class OrderStatusBulkTests(TestCase):
+    url = '/shop/api/v1/orders/status/'
+
+    def setUp(self):
+        self.buyer = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='secret', is_staff=True))
+        self.shipped = DeliveryStatus.objects.create(name='Shipped')
+        shop = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        self.orders = [
+            Order.objects.create(user=self.buyer, cart=Cart.objects.create(user=self.buyer, isPurchase=True),
+                                 deliveryType=True, shopAddress=shop, deliveryStatus=status)
+            for status in (None, None, None, self.shipped)
+        ]
+        self.ids = [order.pk for order in self.orders]
+
+    def post(self, order_ids, status_id):
+        return self.client.post(self.url, {'order_ids': order_ids, 'deliveryStatus_id': status_id}, format='json')
+
+    def status_counts(self):
+        rows = DeliveryStatusCount.objects.values('deliveryStatus_id').annotate(total=Sum('orders'))
+        return {row['deliveryStatus_id']: row['total'] for row in rows if row['total']}
+
+    def test_staff_only(self):
+        data = {'order_ids': self.ids, 'deliveryStatus_id': self.shipped.pk}
+        client = APIClient()
+        self.assertEqual(client.post(self.url, data, format='json').status_code, 401)
+        client.force_authenticate(self.buyer)
+        self.assertEqual(client.post(self.url, data, format='json').status_code, 403)
+        self.assertEqual(Order.objects.filter(deliveryStatus=self.shipped).count(), 1)
+        self.assertFalse(OrderStatusEvent.objects.exists())
+
+    def test_unknown_status_is_rejected(self):
+        response = self.post(self.ids, self.shipped.pk + 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Delivery status not found'})
+        self.assertFalse(OrderStatusEvent.objects.exists())
+        self.assertEqual(self.status_counts(), {None: 3, self.shipped.pk: 1})
+
+    def test_changed_orders_get_one_event_each(self):
+        response = self.post(self.ids, self.shipped.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 3})
+        self.assertEqual(Order.objects.filter(deliveryStatus=self.shipped).count(), 4)
+        events = OrderStatusEvent.objects.order_by('order_id')
+        self.assertEqual([event.order_id for event in events], self.ids[:3])
+        for event in events:
+            self.assertEqual((event.user_id, event.deliveryStatus_id), (self.buyer.pk, self.shipped.pk))
+            self.assertEqual(event.changes, {'deliveryStatus_id': self.shipped.pk})
+
+    def test_orders_already_in_status_are_skipped(self):
+        self.post(self.ids[:2], self.shipped.pk)
+        response = self.post(self.ids, self.shipped.pk)
+        self.assertEqual(response.data, {'updated': 1})
+        self.assertEqual(self.post(self.ids, self.shipped.pk).data, {'updated': 0})
+        self.assertEqual(OrderStatusEvent.objects.count(), 3)
+
+    def test_status_counts_follow_the_transition(self):
+        self.post(self.ids[:2], self.shipped.pk)
+        self.assertEqual(self.status_counts(), {None: 1, self.shipped.pk: 3})
+        self.post(self.ids[1:], None)
+        self.assertEqual(self.status_counts(), {None: 3, self.shipped.pk: 1})
+        counts = self.status_counts()
+        backfill_analytics()
+        self.assertEqual(self.status_counts(), counts)
+
+
+class ResponseCacheTests(TestCase):
+    url = '/shop/api/v1/categories/'
+
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('buyer', password='secret'))
+        self.category = Category.objects.create(name='Phones')
+
+    def names(self, response):
+        return [category['name'] for category in response.data]
+
+    def test_hit_miss_and_not_modified(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_invalidate_on_commit(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Tablets')
+            # Not before the commit: this request could cache the old list under the new version.
+            self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        response = self.client.get(self.url)
+        self.assertEqual((response['X-Cache'], self.names(response)), ('MISS', ['Phones', 'Tablets']))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertEqual(self.names(self.client.get(self.url)), ['Tablets'])
+
+    def test_versions_expire(self):
+        cache = ResponseCache(LocMemLRUBackend(), version_timeout=0.05)
+        version = cache.get_version(Category)
+        self.assertEqual(cache.get_version(Category), version)
+        time.sleep(0.1)
+        self.assertNotEqual(cache.get_version(Category), version)
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', password='secret', is_staff=True))
+        self.phones = Category.objects.create(name='Phones')
+        self.smartphones = Category.objects.create(name='Smartphones', parent=self.phones)
+        self.android = Category.objects.create(name='Android', parent=self.smartphones)
+        self.gadgets = Category.objects.create(name='Gadgets')
+        for name, category in (('Pixel', self.android), ('Galaxy', self.android), ('iPhone', self.smartphones)):
+            Product.objects.create(name=name, price=Decimal('10.00'), category=category)
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'productCount'))
+
+    def subtree_products(self, category):
+        response = self.client.get('/shop/api/v1/products/?category_id=%d&include_subcategories=true' % category.pk)
+        return sorted(product['name'] for product in response.data['results'])
+
+    def move(self, category, parent):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.put('/shop/api/v1/categories/%d/' % category.pk,
+                                   {'name': category.name, 'parent_id': parent and parent.pk}, format='json')
+
+    def test_product_counts_include_subcategories(self):
+        self.assertEqual(self.counts(), {'Phones': 3, 'Smartphones': 3, 'Android': 2, 'Gadgets': 0})
+        Product.objects.get(name='Pixel').delete()
+        self.assertEqual(self.counts(), {'Phones': 2, 'Smartphones': 2, 'Android': 1, 'Gadgets': 0})
+        # Bulk updates skip the signals and leave the counts to recount_products.
+        Product.objects.filter(name='iPhone').update(category=self.gadgets)
+        recount_products()
+        self.assertEqual(self.counts(), {'Phones': 1, 'Smartphones': 1, 'Android': 1, 'Gadgets': 1})
+
+    def test_moving_a_subtree(self):
+        self.assertEqual(self.subtree_products(self.gadgets), [])
+        self.assertEqual(self.move(self.smartphones, self.gadgets).status_code, 200)
+        self.android.refresh_from_db()
+        self.assertEqual((self.android.path, self.android.depth), ('%d/%d/%d/' % (self.gadgets.pk, self.smartphones.pk, self.android.pk), 2))
+        self.assertEqual(self.counts(), {'Phones': 0, 'Smartphones': 3, 'Android': 2, 'Gadgets': 3})
+        # The cached listing of the old, empty subtree is not served any more.
+        self.assertEqual(self.subtree_products(self.gadgets), ['Galaxy', 'Pixel', 'iPhone'])
+        self.assertEqual(self.subtree_products(self.phones), [])
+        response = self.move(self.gadgets, self.android)
+        self.assertEqual(response.status_code, 400)
+
+    def test_tree_endpoint(self):
+        def shape(nodes):
+            return [(node['name'], node['productCount'], shape(node['children'])) for node in nodes]
+
+        response = self.client.get('/shop/api/v1/categories/tree/')
+        self.assertEqual(shape(response.data), [
+            ('Gadgets', 0, []),
+            ('Phones', 3, [('Smartphones', 3, [('Android', 2, [])])]),
+        ])
+        self.move(self.android, None)
+        response = self.client.get('/shop/api/v1/categories/tree/')
+        self.assertEqual([name for name, _, _ in shape(response.data)], ['Android', 'Gadgets', 'Phones'])
+
+
+@override_settings(SHOP_IMAGE_VARIANTS={'WIDTHS': [16, 32], 'WORKERS': 0, 'QUALITY': 80})
+class PhotoVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', password='secret', is_staff=True))
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+
+    def upload(self, name):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (64, 48), 'red').save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/shop/api/v1/products/%d/' % self.product.pk,
+                                       {'photo': SimpleUploadedFile(name, buffer.getvalue())}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        return self.files()
+
+    def files(self):
+        names = [variant['name'] for files in self.product.photoVariants.values() for variant in files]
+        self.assertTrue(all(os.path.exists(os.path.join(settings.MEDIA_ROOT, name)) for name in names))
+        return names
+
+    def exists(self, names):
+        return [name for name in names if os.path.exists(os.path.join(settings.MEDIA_ROOT, name))]
+
+    def test_replaced_photo_variants_are_deleted(self):
+        first = self.upload('first.png')
+        self.assertEqual(len(first), 4)
+        second = self.upload('second.png')
+        self.assertEqual(len(second), 4)
+        self.assertEqual(self.exists(first), [])
+
+    def test_deleting_products_deletes_variants(self):
+        names = self.upload('photo.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertEqual(self.exists(names), [])
+
+    def test_bulk_delete_deletes_variants(self):
+        names = self.upload('photo.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_products(Product.objects.filter(pk=self.product.pk))
+        self.assertEqual(self.exists(names), [])
+
+
+class CachedAuthenticationTests(TestCase):
+    url = '/shop/api/v1/cartproducts/'
+
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user('buyer', password='secret')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer %s' % RefreshToken.for_user(user).access_token)
+        return client
+
+    def test_user_is_served_from_the_shared_cache(self):
+        client = self.client_for(self.user)
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.assertTrue(cache.get('shop:auth-user:%d' % self.user.pk))
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get(self.url).status_code, 200)
+
+    def test_deactivated_user_is_rejected(self):
+        client = self.client_for(self.user)
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(client.get(self.url).status_code, 401)
+
+    # simplejwt's modules share one settings object; override_settings would replace it in one only.
+    @mock.patch.object(jwt_tokens.api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_tokens_issued_before_a_password_change_are_rejected(self):
+        client = self.client_for(self.user)
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertEqual(client.get(self.url).status_code, 401)
+        self.assertEqual(self.client_for(self.user).get(self.url).status_code, 200)
+
+
+class CatalogSnapshotTests(TestCase):
+    url = '/shop/api/v1/catalog/snapshot/'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(SHOP_SNAPSHOTS={'DIR': directory.name, 'DELAY': 0}))
+        self.mark = self.enterContext(mock.patch.object(snapshots.worker, 'mark'))
+        snapshots._manifest_cache.clear()
+        self.addCleanup(snapshots._manifest_cache.clear)
+        self.client = APIClient()
+        self.phones = Category.objects.create(name='Phones')
+        self.tablets = Category.objects.create(name='Tablets')
+        for index in range(4):
+            Product.objects.create(name='Product %d' % index, price=Decimal('10.50'),
+                                   category=self.phones if index % 2 else self.tablets)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def live(self, products):
+        return json.loads(json.dumps(ProductSerializer(products, many=True).data))
+
+    def test_cold_start_queues_one_build(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.mark.assert_called_once_with([])
+        self.assertEqual(self.client.get(self.url + '?category_id=999').status_code, 404)
+        snapshots.build([])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(self.body(response)), self.live(Product.objects.order_by('category_id', 'id')))
+        # A second cold build finds nothing missing and keeps the files.
+        self.assertEqual(snapshots.build([]), snapshots.read_manifest())
+
+    def test_incremental_rebuild(self):
+        before = snapshots.build()
+        product = Product.objects.filter(category=self.phones).first()
+        Product.objects.filter(pk=product.pk).update(price=Decimal('99.00'))
+        after = snapshots.build([self.phones.pk])
+        tablets = snapshots.category_key(self.tablets.pk)
+        phones = snapshots.category_key(self.phones.pk)
+        self.assertEqual(after['entries'][tablets], before['entries'][tablets])
+        self.assertNotEqual(after['entries'][phones]['version'], before['entries'][phones]['version'])
+        response = self.client.get(self.url, {'category_id': self.phones.pk})
+        self.assertEqual(json.loads(self.body(response)), self.live(Product.objects.filter(category=self.phones).order_by('id')))
+        referenced = {name for entry in after['entries'].values() for name in entry['files'].values()}
+        self.assertEqual(set(os.listdir(settings.SHOP_SNAPSHOTS['DIR'])) - {'manifest.json', '.lock'}, referenced)
+
+    def test_encoding_negotiation_and_not_modified(self):
+        snapshots.build()
+        identity = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertIn('Accept-Encoding', identity['Vary'])
+        compressed = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(self.body(compressed)), self.body(identity))
+        self.assertNotIn('Content-Encoding', self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0'))
+        if snapshots.brotli is not None:
+            self.assertEqual(self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')['Content-Encoding'], 'br')
+        self.assertNotEqual(compressed['ETag'], identity['ETag'])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=identity['ETag']).status_code, 304)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=identity['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_writes_queue_a_full_rebuild(self):
+        snapshots.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            update_products(Product.objects.filter(category=self.phones), price_delta=Decimal('1.00'))
+        self.mark.assert_called_with(None)
+        self.mark.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_products(Product.objects.filter(category=self.tablets))
+        self.mark.assert_called_with(None)
+
+
+class RequestProfilingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.middleware = RequestMetricsMiddleware(lambda request: HttpResponse())
+
+    def profiles(self, **headers):
+        self.middleware(RequestFactory().get('/', headers=headers))
+        return len(os.listdir(self.directory))
+
+    def test_header_mode_needs_the_secret(self):
+        config = {'PROFILE': 'header', 'PROFILE_THRESHOLD_MS': 0, 'PROFILE_DIR': self.directory}
+        with override_settings(SHOP_METRICS=config):
+            self.assertEqual(self.profiles(x_profile='1'), 0)
+        with override_settings(SHOP_METRICS={**config, 'PROFILE_SECRET': 's3cret'}):
+            self.assertEqual(self.profiles(x_profile='1'), 0)
+            self.assertEqual(self.profiles(), 0)
+            self.assertEqual(self.profiles(x_profile='s3cret'), 1)
+
+
+class RequestMetricsTests(TestCase):
+    SERVER_TIMING = re.compile(
+        r'^db;dur=\d+\.\d;desc="(\d+) queries", serializer;dur=\d+\.\d, total;dur=\d+\.\d$'
+    )
+
+    def setUp(self):
+        get_response_cache().backend.clear()
+        registry.reset()
+        self.addCleanup(registry.reset)
+        Category.objects.create(name='Phones')
+        self.buyer = User.objects.create_user('buyer', password='secret')
+        self.headers = {'Authorization': 'Bearer %s' % RefreshToken.for_user(self.buyer).access_token}
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user('admin', password='secret', is_staff=True))
+
+    def queries(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        match = self.SERVER_TIMING.match(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        return int(match.group(1))
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/shop/api/v1/categories/', headers=self.headers)
+        self.assertEqual(self.queries(response), len(captured))
+        self.assertGreater(len(captured), 0)
+
+    async def test_async_requests_are_measured(self):
+        self.assertGreater(self.queries(await self.async_client.get('/shop/api/v1/async/categories/', headers=self.headers)), 0)
+
+    def test_middleware_is_async_capable(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(RequestMetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(RequestMetricsMiddleware(lambda request: HttpResponse())))
+
+    def test_prometheus_output(self):
+        self.client.get('/shop/api/v1/categories/', headers=self.headers)
+        response = self.admin.get('/shop/api/v1/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        labels = 'route="/shop/api/v1/categories/",method="GET"'
+        self.assertIn('# TYPE shop_requests_total counter', lines)
+        self.assertIn('shop_requests_total{%s,status="200"} 1' % labels, lines)
+        self.assertIn('# TYPE shop_request_duration_seconds histogram', lines)
+        self.assertIn('shop_request_duration_seconds_bucket{%s,le="+Inf"} 1' % labels, lines)
+        self.assertIn('shop_request_duration_seconds_count{%s} 1' % labels, lines)
+        self.assertIn('shop_request_queries_count{%s} 1' % labels, lines)
+
+    def test_metrics_are_admin_only(self):
+        self.assertEqual(self.client.get('/shop/api/v1/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/shop/api/v1/metrics/', headers=self.headers).status_code, 403)
+        self.assertEqual(self.admin.get('/shop/api/v1/metrics/').status_code, 200)
+
+
+class FastPathRenderingTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='buyer', password='secret')
+        category = Category.objects.create(name='Phones')
+        self.plain = Product.objects.create(name='Plain', price=Decimal('10.50'), category=category)
+        self.pictured = Product.objects.create(name='Pictured', price=Decimal('0.05'), category=category,
+                                               description='Ünïcode \u2028 text')
+        Product.objects.filter(pk=self.pictured.pk).update(photo='products/phone.jpg', photoVariants={
+            'webp': [{'name': 'products/variants/phone-320.webp', 'width': 320},
+                     {'name': 'products/variants/phone-640.webp', 'width': 640}],
+            'avif': [],
+        })
+        cart = Cart.objects.create(user=user)
+        CartProduct.objects.create(cart=cart, product=self.plain, amount=2)
+        CartProduct.objects.create(cart=cart, product=self.pictured, amount=1)
+        shop = ShopAddress.objects.create(address='Main st. 1')
+        Order.objects.create(cart=cart, user=user, deliveryType=True, shopAddress=shop)
+        Order.objects.create(cart=cart, user=user, deliveryType=False, deliveryAddress='Home',
+                             deliveryPhoneNumber='+70000000000', deliveryStatus=DeliveryStatus.objects.create(name='Shipped'))
+
+    def assertSameBytes(self, queryset, serializer_class, fast):
+        queryset = queryset.order_by('id')
+        expected = JSONRenderer().render(serializer_class(list(queryset), many=True).data)
+        self.assertEqual(FastJSONRenderer().render(fast.serialize(list(fast.rows(queryset)))), expected)
+        return json.loads(expected)
+
+    def test_products(self):
+        data = self.assertSameBytes(Product.objects.all(), ProductSerializer, fastpath.products)
+        self.assertIsNone(data[0]['photo'])
+        self.assertEqual(data[0]['price'], '10.50')
+        self.assertTrue(data[1]['photo'].endswith('products/phone.jpg'))
+        self.assertEqual(list(data[1]['photo_srcset']), ['webp'])
+
+    def test_categories(self):
+        self.assertSameBytes(Category.objects.all(), CategorySerializer, fastpath.categories)
+
+    def test_cart_products(self):
+        self.assertSameBytes(CartProduct.objects.all(), CartProductSerializer, fastpath.cart_products)
+
+    def test_orders(self):
+        Order.objects.update(date=timezone.now().replace(microsecond=0))
+        self.assertSameBytes(Order.objects.all(), OrderSerializer, fastpath.orders)
+        Order.objects.update(date=timezone.now().replace(microsecond=123456))
+        data = self.assertSameBytes(Order.objects.all(), OrderSerializer, fastpath.orders)
+        self.assertEqual(len(data), 2)
+
+
+class CartCleanupTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Phones')
+        self.product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        self.stock = Stock.objects.create(product=self.product, available=10)
+        self.users = [User.objects.create_user('buyer%d' % i, password='secret') for i in range(4)]
+
+    def open_cart(self, user, amount, days_ago):
+        cart = apply_cart_deltas(user.id, {self.product.id: amount} if amount else {})
+        Cart.objects.filter(pk=cart.pk).update(updatedAt=timezone.now() - timedelta(days=days_ago))
+        return cart
+
+    def assertStock(self, available, reserved):
+        self.stock.refresh_from_db()
+        self.assertEqual((self.stock.available, self.stock.reserved), (available, reserved))
+
+    def test_abandoned_carts_are_deleted_in_batches(self):
+        stale = [self.open_cart(user, 2, 40) for user in self.users[:2]]
+        empty = self.open_cart(self.users[2], 0, 2)
+        fresh = self.open_cart(self.users[3], 1, 0)
+        self.assertStock(5, 5)
+        out = StringIO()
+        call_command('cleanup_carts', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue().count('Deleted abandoned carts up to id'), 3)
+        self.assertIn('Deleted 3 abandoned carts, released 2 reservations.', out.getvalue())
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [fresh.pk])
+        self.assertFalse(CartProduct.objects.filter(cart__in=stale + [empty]).exists())
+        self.assertEqual(StockReservation.objects.get().cart_id, fresh.pk)
+        self.assertStock(9, 1)
+
+    def test_after_id_resumes(self):
+        first, second = [self.open_cart(user, 1, 40) for user in self.users[:2]]
+        batches = list(delete_abandoned_carts(timezone.now() - timedelta(days=30), after_id=first.pk))
+        self.assertEqual(batches, [(second.pk, 1, 1)])
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [first.pk])
+        self.assertStock(9, 1)
+
+    def test_purchased_cart_lines_become_order_snapshots(self):
+        user = self.users[0]
+        cart = self.open_cart(user, 2, 0)
+        Cart.objects.filter(pk=cart.pk).update(isPurchase=True)
+        shop = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        order = Order.objects.create(cart=cart, user=user, deliveryType=True, shopAddress=shop)
+        # Purchased without an order (checkout failed half-way): left alone.
+        orphan = Cart.objects.create(user=self.users[1], isPurchase=True)
+        CartProduct.objects.create(cart=orphan, product=self.product, amount=1)
+        self.assertEqual(list(archive_purchased_carts()), [(cart.pk, 1)])
+        line = OrderProduct.objects.get(order=order)
+        self.assertEqual((line.name, line.price, line.amount), ('Phone', Decimal('10.00'), 2))
+        self.assertEqual(list(CartProduct.objects.values_list('cart_id', flat=True)), [orphan.pk])
+        self.assertTrue(Cart.objects.filter(pk=cart.pk).exists())
+
+    def test_checkout_without_open_cart(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        shop = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        response = client.post('/shop/api/v1/orders/', {'deliveryType': True, 'shopAddress_id': shop.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Cart is empty'})
+        self.assertFalse(Cart.objects.exists())
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked, 'needs SELECT ... FOR UPDATE SKIP LOCKED')
+class CartCleanupLockTests(TransactionTestCase):
+    def test_carts_in_use_are_skipped(self):
+        category = Category.objects.create(name='Phones')
+        product = Product.objects.create(name='Phone', price=Decimal('10.00'), category=category)
+        carts = [Cart.objects.create(user=User.objects.create_user('buyer%d' % i)) for i in range(2)]
+        for cart in carts:
+            CartProduct.objects.create(cart=cart, product=product, amount=1)
+        Cart.objects.update(updatedAt=timezone.now() - timedelta(days=40))
+        locked, released = threading.Event(), threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    Cart.objects.select_for_update().get(pk=carts[0].pk)
+                    locked.set()
+                    released.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            locked.wait(10)
+            batches = list(delete_abandoned_carts(timezone.now() - timedelta(days=30)))
+        finally:
+            released.set()
+            thread.join()
+        self.assertEqual(batches, [(carts[1].pk, 1, 0)])
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [carts[0].pk])
+
+
+class ProductPaginationTests(TestCase):
+    url = '/shop/api/v1/products/'
+
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Phones')
+        # Ties on price must be broken by id, or rows would repeat or go missing between pages.
+        for index, price in enumerate(['30.00', '10.00', '20.00', '10.00', '30.00', '10.00', '20.00']):
+            Product.objects.create(name='Phone %d' % index, price=Decimal(price), category=category)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def walk(self, ordering):
+        pages = [self.get(self.url, ordering=ordering, page_size=3)]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        return pages
+
+    def ids(self, pages):
+        return [product['id'] for page in pages for product in page['results']]
+
+    def test_pages_follow_price_then_id(self):
+        for ordering, expected in [
+            ('price', Product.objects.order_by('price', 'id')),
+            ('-price', Product.objects.order_by('-price', '-id')),
+            ('name', Product.objects.order_by('name', 'id')),
+        ]:
+            with self.subTest(ordering=ordering):
+                pages = self.walk(ordering)
+                self.assertEqual(self.ids(pages), [product.id for product in expected])
+                self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+                self.assertIsNone(pages[0]['previous'])
+
+    def test_previous_links_walk_back(self):
+        pages = self.walk('price')
+        backwards = [pages[-1]]
+        while backwards[-1]['previous']:
+            backwards.append(self.get(backwards[-1]['previous']))
+        self.assertEqual([page['results'] for page in backwards[::-1]], [page['results'] for page in pages])
+        self.assertIsNotNone(backwards[1]['next'])
+
+    def test_pages_seek_instead_of_offset(self):
+        second = self.walk('price')[1]
+        with CaptureQueriesContext(connection) as queries:
+            self.get(second['next'])
+        sql = ' '.join(query['sql'] for query in queries).upper()
+        self.assertNotIn('OFFSET', sql)
+
+    def test_invalid_cursors(self):
+        cursor = parse_qs(urlsplit(self.walk('price')[0]['next']).query)['cursor'][0]
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 404)
+        # A cursor only fits the ordering it was made for.
+        self.assertEqual(self.client.get(self.url, {'cursor': cursor, 'ordering': 'name'}).status_code, 404)
+
+
+class CartBulkTests(TestCase):
+    url = '/shop/api/v1/cartproducts/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Phones')
+        self.products = [
+            Product.objects.create(name='Phone %d' % i, price=Decimal('10.00'), category=category) for i in range(10)
+        ]
+
+    def post(self, deltas):
+        items = [{'product_id': product.id, 'amount': amount} for product, amount in deltas]
+        return self.client.post(self.url, {'items': items}, format='json')
+
+    def amounts(self):
+        return dict(CartProduct.objects.filter(cart__user=self.user).values_list('product_id', 'amount'))
+
+    def test_deltas_create_update_and_remove_lines(self):
+        first, second, third = self.products[:3]
+        self.post([(first, 2), (second, 1), (first, 1)])
+        self.assertEqual(self.amounts(), {first.id: 3, second.id: 1})
+        response = self.post([(first, -1), (second, -5), (third, 4)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.amounts(), {first.id: 2, third.id: 4})
+        self.assertEqual({line['product_id']: line['amount'] for line in response.data}, self.amounts())
+
+    def test_query_count_does_not_grow_with_items(self):
+        counts = []
+        for size in (3, 10):
+            products = self.products[:size]
+            CartProduct.objects.all().delete()
+            apply_cart_deltas(self.user.id, {product.id: 1 for product in products[:-1]})
+            # One removed line, updated lines and one new line.
+            deltas = [(products[0], -1)] + [(product, 1) for product in products[1:-1]] + [(products[-1], 1)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.post(deltas).status_code, 200)
+            counts.append(len(queries))
+            self.assertEqual(self.amounts(), {product.id: 2 if product in products[1:-1] else 1 for product in products[1:]})
+        self.assertEqual(counts[0], counts[1])
+
+    def test_missing_products_reject_the_request(self):
+        response = self.client.post(self.url, {'items': [{'product_id': self.products[0].id}, {'product_id': 0}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Products not found: 0', str(response.data))
+        self.assertFalse(Cart.objects.exists())
+
+    def test_out_of_stock_applies_nothing(self):
+        Stock.objects.create(product=self.products[1], available=1)
+        self.post([(self.products[0], 1)])
+        response = self.post([(self.products[0], 1), (self.products[1], 2)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.amounts(), {self.products[0].id: 1})
+        self.assertEqual(Stock.objects.get().available, 1)
+
+
+class ProductSearchTests(TestCase):
+    """Full-text search on whichever backend the database offers."""
+    url = '/shop/api/v1/products/search/'
+
+    def setUp(self):
+        get_response_cache().backend.clear()
+        inverted_index.reset()
+        self.addCleanup(inverted_index.reset)
+        self.client = APIClient()
+        category = Category.objects.create(name='Phones')
+        self.iphone = Product.objects.create(name='Apple iPhone', price=Decimal('10.00'), category=category,
+                                             description='A phone by Apple')
+        self.galaxy = Product.objects.create(name='Samsung Galaxy', price=Decimal('10.00'), category=category,
+                                             description='Phone by Samsung')
+        self.case = Product.objects.create(name='Phone case', price=Decimal('10.00'), category=category,
+                                           description='Fits the iPhone')
+
+    def search(self, q):
+        response = self.client.get(self.url, {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in json.loads(response.content)['results']]
+
+    def test_name_matches_rank_first(self):
+        self.assertEqual(self.search('phone'), [self.case.id, self.iphone.id, self.galaxy.id])
+        self.assertEqual(self.search('iphone'), [self.iphone.id, self.case.id])
+
+    def test_every_token_must_match_as_a_prefix(self):
+        self.assertEqual(self.search('APP iph'), [self.iphone.id])
+        self.assertEqual(self.search('samsung case'), [])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_writes_are_searchable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.galaxy.name = 'Samsung Note'
+            self.galaxy.save()
+            self.case.delete()
+        self.assertEqual(self.search('galaxy'), [])
+        self.assertEqual(self.search('note'), [self.galaxy.id])
+        self.assertEqual(self.search('iphone'), [self.iphone.id])
+
+
+class InProcessSearchTests(ProductSearchTests):
+    """The same searches on the in-process index, the fallback without PostgreSQL."""
+
+    def setUp(self):
+        self.enterContext(mock.patch('shop.search.uses_database_search', return_value=False))
+        self.enterContext(mock.patch('shop.signals.uses_database_search', return_value=False))
+        super().setUp()
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        get_response_cache().backend.clear()
+        self.user = User.objects.create_user('buyer', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % RefreshToken.for_user(self.user).access_token)
+        category = Category.objects.create(name='Phones')
+        products = [
+            Product.objects.create(name='Phone %d' % i, price=Decimal(price), category=category)
+            for i, price in enumerate(['20.00', '10.50', '20.00', '5.00', '10.50'])
+        ]
+        cart = apply_cart_deltas(self.user.id, {products[0].id: 2, products[3].id: 1})
+        shop = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        Order.objects.create(cart=cart, user=self.user, deliveryType=True, shopAddress=shop)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content)
+
+    def test_responses_match_the_sync_views(self):
+        for path in ('categories/', 'cartproducts/', 'products/%d/' % Product.objects.first().pk):
+            with self.subTest(path=path):
+                self.assertEqual(self.get('/shop/api/v1/async/' + path), self.get('/shop/api/v1/' + path))
+        for path in ('products/', 'orders/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get('/shop/api/v1/async/' + path)['results'],
+                                 self.get('/shop/api/v1/' + path)['results'])
+
+    def test_pages_follow_cursors(self):
+        page = self.get('/shop/api/v1/async/products/', ordering='-price', page_size=2)
+        ids = [product['id'] for product in page['results']]
+        while page['next']:
+            self.assertIn('/shop/api/v1/async/products/', page['next'])
+            page = self.get(page['next'])
+            ids += [product['id'] for product in page['results']]
+        self.assertEqual(ids, list(Product.objects.order_by('-price', '-id').values_list('id', flat=True)))
+
+    def test_authentication_is_required(self):
+        client = APIClient()
+        response = client.get('/shop/api/v1/async/cartproducts/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        client.credentials(HTTP_AUTHORIZATION='Bearer garbage')
+        self.assertEqual(client.get('/shop/api/v1/async/orders/').status_code, 401)
+        # The product list is public, as long as no bad token is sent.
+        self.assertEqual(client.get('/shop/api/v1/async/products/').status_code, 401)
+        client.credentials()
+        self.assertEqual(client.get('/shop/api/v1/async/products/').status_code, 200)
+
+    @override_settings(SHOP_THROTTLE={'RATES': {'products': '2/min'}})
+    def test_product_list_is_throttled(self):
+        self.enterContext(mock.patch('shop.throttling._memory_buckets', None))
+        codes = [self.client.get('/shop/api/v1/async/products/').status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = self.client.get('/shop/api/v1/async/products/')
+        self.assertEqual(int(response['Retry-After']), 30)
+        # Budgets are per scope: categories are not limited here.
+        self.assertEqual(self.client.get('/shop/api/v1/async/categories/').status_code, 200)
+
+
+class CatalogTransferTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='secret', is_staff=True))
+        phones = Category.objects.create(name='Phones')
+        cases = Category.objects.create(name='Cases, "leather"')
+        Product.objects.create(name='Phone', price=Decimal('199.99'), category=phones,
+                               description='Ünïcode, "quoted"\nand multi-line')
+        Product.objects.create(name='Case', price=Decimal('0.50'), category=cases)
+
+    def catalog(self):
+        return sorted(Product.objects.values_list('name', 'price', 'description', 'category__name'))
+
+    def export(self, model, fmt):
+        response = self.client.get('/shop/api/v1/catalog/export/', {'model': model, 'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="%s.%s"' % (model, fmt))
+        return b''.join(response.streaming_content)
+
+    def upload(self, model, name, content):
+        response = self.client.post('/shop/api/v1/catalog/import/', {
+            'model': model, 'file': SimpleUploadedFile(name, content),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_round_trip_into_an_empty_catalog(self):
+        expected = self.catalog()
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(format=fmt):
+                categories, products = self.export('category', fmt), self.export('product', fmt)
+                Category.objects.all().delete()
+                self.assertEqual(self.upload('category', 'category.' + fmt, categories)['imported'], 2)
+                report = self.upload('product', 'product.' + fmt, products)
+                self.assertEqual((report['rows'], report['imported'], report['failed']), (2, 2, 0))
+                self.assertEqual(self.catalog(), expected)
+
+    def test_import_upserts_by_name(self):
+        ids = dict(Product.objects.values_list('name', 'id'))
+        report = self.upload('product', 'product.csv', (
+            'name,price,category\n'
+            'Phone,149.00,Phones\n'
+            'Charger,9.90,Phones\n'
+        ).encode())
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual(Product.objects.get(name='Phone').pk, ids['Phone'])
+        self.assertEqual(Product.objects.get(name='Phone').price, Decimal('149.00'))
+        self.assertEqual(Product.objects.count(), 3)
+
+    def test_bad_rows_are_reported_not_fatal(self):
+        rows = [
+            '{"name": "Charger", "price": "9.90", "category": "Phones"}',
+            '{"name": "Cable", "price": "cheap", "category": "Phones"}',
+            'not json',
+            '{"name": "Stand", "price": "5.00", "category": "Tablets"}',
+            '{"name": "Strap", "price": "3.00", "category_id": %d}' % Category.objects.get(name='Phones').pk,
+        ]
+        report = import_catalog('product', StringIO('\n'.join(rows)), 'jsonl', batch_size=2).as_dict()
+        self.assertEqual((report['rows'], report['imported'], report['failed']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 4])
+        self.assertIn('price', report['errors'][0]['errors'])
+        self.assertEqual(report['errors'][2]['errors'], {'category': ['Category not found']})
+        self.assertEqual(Product.objects.filter(name__in=['Charger', 'Strap']).count(), 2)
+
+    def test_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('buyer', password='secret'))
+        self.assertEqual(client.get('/shop/api/v1/catalog/export/', {'model': 'product'}).status_code, 403)
+
+
+class TokenBucketTests(TestCase):
+    url = '/shop/api/v1/products/'
+
+    def setUp(self):
+        self.enterContext(mock.patch('shop.throttling._memory_buckets', None))
+        get_response_cache().backend.clear()
+        self.users = [User.objects.create_user('buyer%d' % i, password='secret') for i in range(2)]
+
+    def test_bucket_arithmetic(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2.0))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('120 per minute')
+        state = None
+        for _ in range(3):
+            allowed, wait, state = take_token(state, 3, 0.5, 100.0)
+            self.assertTrue(allowed)
+        self.assertEqual(take_token(state, 3, 0.5, 100.0)[:2], (False, 2.0))
+        # Half a token trickled back after a second, the other half takes another one.
+        self.assertEqual(take_token(state, 3, 0.5, 101.0)[:2], (False, 1.0))
+        self.assertTrue(take_token(state, 3, 0.5, 102.0)[0])
+        # An idle bucket fills up to its capacity, no further.
+        self.assertEqual(take_token(state, 3, 0.5, 1000.0)[2], (2, 1000.0))
+
+    def burst(self, client, count):
+        return [client.get(self.url).status_code for _ in range(count)]
+
+    def assertLimitsPerClient(self):
+        clients = []
+        for user in self.users:
+            client = APIClient()
+            client.force_authenticate(user)
+            clients.append(client)
+        self.assertEqual(self.burst(clients[0], 4), [200, 200, 200, 429])
+        response = clients[0].get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(self.burst(clients[1], 3), [200, 200, 200])
+        self.assertEqual(self.burst(APIClient(), 4), [200, 200, 200, 429])
+        self.assertEqual(APIClient().get(self.url, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        # Other scopes have their own budget, or none.
+        self.assertEqual(clients[0].get('/shop/api/v1/deliverystatuses/').status_code, 200)
+
+    @override_settings(SHOP_THROTTLE={'RATES': {'products': '3/min'}})
+    def test_memory_buckets(self):
+        self.assertLimitsPerClient()
+
+    @override_settings(SHOP_THROTTLE={'BACKEND': 'cache', 'CACHE': 'default', 'RATES': {'products': '3/min'}})
+    def test_cache_buckets(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.assertLimitsPerClient()
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, do, func, callers=5, timeout=5):
+        """``callers`` calls of ``do('key', func, timeout)`` made while the first one is still running."""
+        started, release = threading.Event(), threading.Event()
+
+        def leader():
+            started.set()
+            release.wait(5)
+            return func()
+
+        with ThreadPoolExecutor(max_workers=callers) as pool:
+            first = pool.submit(do, 'key', leader, timeout)
+            started.wait(5)
+            others = [pool.submit(do, 'key', func, timeout) for _ in range(callers - 1)]
+            # Give the followers time to find the call in flight.
+            time.sleep(0.1)
+            release.set()
+            return [first.result()] + [future.result() for future in others]
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+            return {'products': []}
+
+        results = self.run_concurrently(SingleFlight().do, func)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [({'products': []}, False)] + [({'products': []}, True)] * 4)
+
+    def test_failed_call_is_retried_by_waiters(self):
+        calls = []
+
+        def func():
+            calls.append(1)
+            return None if len(calls) == 1 else 'data'
+
+        results = self.run_concurrently(SingleFlight().do, func)
+        self.assertEqual(results, [(None, False)] + [('data', False)] * 4)
+        self.assertEqual(len(calls), 5)
+
+    def test_slow_call_stops_blocking_waiters(self):
+        results = self.run_concurrently(SingleFlight().do, lambda: 'data', callers=2, timeout=0.01)
+        self.assertEqual(results, [('data', False), ('data', False)])
+
+    def test_coalesced_misses_are_counted(self):
+        cache = ResponseCache(LocMemLRUBackend())
+        self.run_concurrently(lambda key, func, timeout: cache.compute(key, func), lambda: 'data', callers=3)
+        self.assertEqual(cache.stats()['coalesced'], 2)
+
+
+class ProductBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='secret', is_staff=True))
+        self.phones = Category.objects.create(name='Phones')
+        self.smartphones = Category.objects.create(name='Smartphones', parent=self.phones)
+        self.tablets = Category.objects.create(name='Tablets')
+        self.phone = Product.objects.create(name='Phone', price=Decimal('10.00'), category=self.phones)
+        self.smartphone = Product.objects.create(name='Smartphone', price=Decimal('19.99'), category=self.smartphones)
+        self.tablet = Product.objects.create(name='Tablet', price=Decimal('30.00'), category=self.tablets)
+
+    def post(self, action, payload):
+        return self.client.post('/shop/api/v1/products/bulk/%s/' % action, payload, format='json')
+
+    def prices(self):
+        return dict(Product.objects.values_list('name', 'price'))
+
+    def test_price_changes(self):
+        subtree = {'category_id': self.phones.id, 'include_subcategories': True}
+        response = self.post('update', {**subtree, 'price_percent': '-10'})
+        self.assertEqual(response.data, {'updated': 2})
+        self.assertEqual(self.prices(), {'Phone': Decimal('9.00'), 'Smartphone': Decimal('17.99'), 'Tablet': Decimal('30.00')})
+        self.post('update', {'ids': [self.phone.id, self.tablet.id], 'price_delta': '1.50'})
+        self.post('update', {'category_id': self.phones.id, 'price': '5.00'})
+        self.assertEqual(self.prices(), {'Phone': Decimal('5.00'), 'Smartphone': Decimal('17.99'), 'Tablet': Decimal('31.50')})
+
+    def test_prices_that_leave_the_range_are_rejected(self):
+        for payload in [{'price_delta': '-15.00'}, {'price_delta': '99999990.00'}]:
+            with self.subTest(payload=payload):
+                response = self.post('update', {'ids': [self.phone.id, self.smartphone.id], **payload})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data, {'error': 'Prices must stay between 0 and 99999999.99'})
+        self.assertEqual(self.post('update', {'ids': [self.phone.id], 'price': '1', 'price_delta': '1'}).status_code, 400)
+        self.assertEqual(self.prices()['Phone'], Decimal('10.00'))
+
+    def test_move_recounts_categories(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post('update', {'category_id': self.phones.id, 'include_subcategories': True,
+                                            'new_category_id': self.tablets.id})
+        self.assertEqual(response.data, {'updated': 2})
+        counts = dict(Category.objects.values_list('name', 'productCount'))
+        self.assertEqual(counts, {'Phones': 0, 'Smartphones': 0, 'Tablets': 3})
+        response = self.post('update', {'ids': [self.phone.id], 'new_category_id': 0})
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'Category not found'}))
+
+    def test_batches(self):
+        self.assertEqual(update_products(Product.objects.all(), price_delta=Decimal('1'), batch_size=2), 3)
+        self.assertEqual(delete_products(Product.objects.all(), batch_size=2), 3)
+        self.assertFalse(Product.objects.exists())
+
+    def test_delete_keeps_order_line_snapshots(self):
+        user = User.objects.create_user('buyer', password='secret')
+        cart = apply_cart_deltas(user.id, {self.phone.id: 2, self.tablet.id: 1})
+        Stock.objects.create(product=self.phone, available=5)
+        shop = ShopAddress.objects.create(address='Minsk, Pobediteley 9')
+        order = Order.objects.create(cart=cart, user=user, deliveryType=True, shopAddress=shop)
+        OrderProduct.objects.create(order=order, product=self.phone, name='Phone', price=Decimal('10.00'), amount=2)
+        ProductSales.objects.create(product=self.phone, name='Phone', orders=1, units=2, revenue=Decimal('20.00'))
+        response = self.post('delete', {'category_id': self.phones.id, 'include_subcategories': True})
+        self.assertEqual(response.data, {'deleted': 2})
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Tablet'])
+        line = OrderProduct.objects.get()
+        self.assertEqual((line.product_id, line.name, line.amount), (None, 'Phone', 2))
+        self.assertIsNone(ProductSales.objects.get().product_id)
+        self.assertEqual(list(CartProduct.objects.values_list('product_id', flat=True)), [self.tablet.id])
+        self.assertFalse(Stock.objects.exists())
+        self.assertEqual(Category.objects.get(pk=self.phones.pk).productCount, 0)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(User.objects.create_user('buyer', password='secret'))
+        self.assertEqual(self.post('delete', {'ids': [self.phone.id]}).status_code, 403)
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class OpenAPISchemaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_file = os.path.join(directory.name, 'openapi.json')
+        self.enterContext(override_settings(SHOP_OPENAPI={'SCHEMA_FILE': self.schema_file}))
+
+    def test_serving_the_api_does_not_load_drf_yasg(self):
+        script = (
+            'import sys, django; django.setup()\n'
+            'from django.conf import settings; from importlib import import_module\n'
+            'import_module(settings.ROOT_URLCONF)\n'
+            'print(sorted(name for name in sys.modules if name.startswith("drf_yasg.")))\n'
+        )
+        # A fresh interpreter, on the settings module of this run from DJANGO_SETTINGS_MODULE.
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_generated_schema(self):
+        document = json.loads(schema.generate())
+        self.assertIn('/shop/api/v1/products/', document['paths'])
+        # Lazily declared parameters are resolved into the document.
+        parameters = document['paths']['/shop/api/v1/cartproducts/']['get']['parameters']
+        self.assertIn('expand', [parameter['name'] for parameter in parameters])
+        consumes = document['paths']['/shop/api/v1/catalog/import/']['post']['parameters']
+        self.assertEqual({parameter['name']: parameter['in'] for parameter in consumes}['file'], 'formData')
+
+    def test_pre_generated_file_is_served(self):
+        generated = json.loads(self.client.get('/swagger.json').content)
+        call_command('generate_schema', stdout=StringIO())
+        with open(self.schema_file, 'rb') as f:
+            content = f.read()
+        self.assertEqual(json.loads(content)['paths'].keys(), generated['paths'].keys())
+        response = self.client.get('/swagger.json')
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(self.client.get('/swagger/').status_code, 200)
+
+    def test_disabled(self):
+        with override_settings(SHOP_OPENAPI={'ENABLED': False}):
+            self.assertEqual(self.client.get('/swagger.json').status_code, 404)
+            self.assertEqual(self.client.get('/swagger/').status_code, 404)
+
+
+class DataMigrationTests(TransactionTestCase):
+    """The data steps of the migrations on rows the constraints that follow them forbid."""
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('shop', target)])
+        return executor.loader.project_state([('shop', target)]).apps
+
+    def setUp(self):
+        self.latest = MigrationExecutor(connection).loader.graph.leaf_nodes('shop')[0][1]
+        self.addCleanup(self.migrate, self.latest)
+
+    def test_open_carts_are_merged(self):
+        apps = self.migrate('0003_cartproduct_unique_product')
+        user = apps.get_model('auth', 'User').objects.create(username='buyer')
+        category = apps.get_model('shop', 'Category').objects.create(name='Phones')
+        product = apps.get_model('shop', 'Product').objects.create(name='Phone', price=1, category=category)
+        Cart, CartProduct = apps.get_model('shop', 'Cart'), apps.get_model('shop', 'CartProduct')
+        carts = [Cart.objects.create(user=user, isPurchase=False) for _ in range(2)]
+        for cart in carts:
+            CartProduct.objects.create(cart=cart, product=product, amount=2)
+        self.migrate(self.latest)
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [carts[0].pk])
+        self.assertEqual(list(CartProduct.objects.values_list('cart_id', 'amount')), [(carts[0].pk, 4)])
+
+    def test_duplicate_catalog_names_are_resolved(self):
+        apps = self.migrate('0006_product_photo_variants')
+        Category, Product = apps.get_model('shop', 'Category'), apps.get_model('shop', 'Product')
+        phones = [Category.objects.create(name='Phones') for _ in range(2)]
+        first, second = [Product.objects.create(name='Phone', price=1, category=category) for category in phones]
+        # Already taken: the renamed duplicate must not clash with it.
+        Product.objects.create(name='Phone (%d)' % second.pk, price=1, category=phones[0])
+        self.migrate(self.latest)
+        self.assertEqual(list(Category.objects.values_list('pk', flat=True)), [phones[0].pk])
+        self.assertEqual(set(Product.objects.values_list('category_id', flat=True)), {phones[0].pk})
+        self.assertEqual(Product.objects.get(pk=first.pk).name, 'Phone')
+        self.assertEqual(Product.objects.get(pk=second.pk).name, 'Phone (%d-2)' % second.pk)
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+DEFAULTS = {
+    'BACKEND': 'memory',
+    'CACHE': 'default',
+    'MAX_KEYS': 100000,
+    'RATES': {},
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SHOP_THROTTLE', {})}
+
+
+def parse_rate(rate):
+    """``'120/min'`` -> ``(120, 2.0)``: the bucket size and the tokens added per second."""
+    try:
+        count, period = rate.split('/')
+        return int(count), int(count) / PERIODS[period[0]]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured('Invalid throttle rate %r, expected e.g. "120/min"' % rate)
+
+
+def take_token(state, capacity, refill, now):
+    """
+    Refill a ``(tokens, stamp)`` bucket up to ``now`` and take one token.
+    Returns ``(allowed, wait, new_state)``; ``wait`` is the seconds until the
+    next token when the bucket is empty.
+    """
+    tokens, stamp = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - stamp) * refill)
+    if tokens >= 1:
+        return True, None, (tokens - 1, now)
+    return False, (1 - tokens) / refill, (tokens, now)
+
+
+class MemoryBuckets:
+    """Buckets of this process; the least recently used are dropped beyond ``max_keys``."""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill):
+        with self._lock:
+            allowed, wait, self._buckets[key] = take_token(self._buckets.get(key), capacity, refill, time.monotonic())
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, wait
+
+
+class CacheBuckets:
+    """
+    Buckets in a ``CACHES`` alias shared by all workers. The update is a plain
+    get and set, so concurrent requests from one client may get a request or
+    two past the limit.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, capacity, refill):
+        allowed, wait, state = take_token(self.cache.get(key), capacity, refill, time.time())
+        # A bucket left alone this long is full again, same as a missing one.
+        self.cache.set(key, state, int(capacity / refill) + 1)
+        return allowed, wait
+
+
+_memory_buckets = None
+_memory_buckets_lock = threading.Lock()
+
+
+def get_buckets(config):
+    global _memory_buckets
+    if config['BACKEND'] == 'cache':
+        return CacheBuckets(config['CACHE'])
+    if config['BACKEND'] != 'memory':
+        raise ImproperlyConfigured('SHOP_THROTTLE BACKEND must be "memory" or "cache"')
+    if _memory_buckets is None:
+        with _memory_buckets_lock:
+            if _memory_buckets is None:
+                _memory_buckets = MemoryBuckets(config['MAX_KEYS'])
+    return _memory_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket limit per client: the user for authenticated requests, the
+    client IP otherwise. Views pick their budget from ``SHOP_THROTTLE['RATES']``
+    with ``throttle_scope`` (``'default'`` when unset); scopes without a rate
+    are not limited. A full bucket allows a burst of the whole rate, after
+    which requests are let through as tokens trickle back in.
+    """
+
+    def __init__(self):
+        self._wait = None
+
+    def allow_request(self, request, view):
+        config = get_config()
+        scope = getattr(view, 'throttle_scope', 'default')
+        rate = config['RATES'].get(scope)
+        if not rate:
+            return True
+        capacity, refill = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = 'user:%s' % request.user.pk
+        else:
+            ident = 'ip:%s' % self.get_ident(request)
+        allowed, self._wait = get_buckets(config).take('shop:throttle:%s:%s' % (scope, ident), capacity, refill)
+        return allowed
+
+    def wait(self):
+        return self._wait
@@ -1,19 +1,68 @@
 from django.urls import path
 
-from shop.views import *
+from shop.async_views import (
+    AsyncCartProductListAPIView,
+    AsyncCategoryListAPIView,
+    AsyncOrderChangesAPIView,
+    AsyncOrderEventStreamAPIView,
+    AsyncOrderListAPIView,
+    AsyncProductDetailAPIView,
+    AsyncProductListAPIView,
+)
+from shop.views import (
+    CartProductBulkAPIView,
+    CartProductDetailAPIView,
+    CartProductListAPIView,
+    CatalogExportAPIView,
+    CatalogImportAPIView,
+    CatalogSnapshotAPIView,
+    CategoryDetailAPIView,
+    CategoryListAPIView,
+    CategorySalesAnalyticsAPIView,
+    CategoryTreeAPIView,
+    DeliveryStatusAnalyticsAPIView,
+    DeliveryStatusDetailAPIView,
+    DeliveryStatusListAPIView,
+    MetricsAPIView,
+    OrderDetailAPIView,
+    OrderListAPIView,
+    OrderStatusBulkAPIView,
+    ProductBulkDeleteAPIView,
+    ProductBulkUpdateAPIView,
+    ProductDetailAPIView,
+    ProductListAPIView,
+    ProductSalesAnalyticsAPIView,
+    ProductSearchAPIView,
+    ProductStockAPIView,
+    RevenueAnalyticsAPIView,
+    ShopAddressDetailAPIView,
+    ShopAddressListAPIView,
+    StaffOrderListAPIView,
+)
 
 urlpatterns = [
 
     #Products
     path('api/v1/products/', ProductListAPIView.as_view()),
+    path('api/v1/products/search/', ProductSearchAPIView.as_view()),
+    path('api/v1/products/bulk/update/', ProductBulkUpdateAPIView.as_view()),
+    path('api/v1/products/bulk/delete/', ProductBulkDeleteAPIView.as_view()),
     path('api/v1/products/<int:pk>/', ProductDetailAPIView.as_view()),
+    path('api/v1/products/<int:pk>/stock/', ProductStockAPIView.as_view()),
 
     #Categories
     path('api/v1/categories/', CategoryListAPIView.as_view()),
+    path('api/v1/categories/tree/', CategoryTreeAPIView.as_view()),
     path('api/v1/categories/<int:pk>/', CategoryDetailAPIView.as_view()),
 
+    #Catalog import/export
+    path('api/v1/catalog/import/', CatalogImportAPIView.as_view()),
+    path('api/v1/catalog/export/', CatalogExportAPIView.as_view()),
+    path('api/v1/catalog/snapshot/', CatalogSnapshotAPIView.as_view()),
+
     #CartProducts
     path('api/v1/cartproducts/', CartProductListAPIView.as_view()),
+    path('api/v1/cartproducts/bulk/', CartProductBulkAPIView.as_view()),
     path('api/v1/cartproducts/<int:pk>/', CartProductDetailAPIView.as_view()),
 
     #Shop addresses
@@ -26,5 +75,25 @@ urlpatterns = [
 
     # Orders
     path('api/v1/orders/', OrderListAPIView.as_view()),
+    path('api/v1/orders/all/', StaffOrderListAPIView.as_view()),
+    path('api/v1/orders/status/', OrderStatusBulkAPIView.as_view()),
     path('api/v1/orders/<int:pk>/', OrderDetailAPIView.as_view()),
-]
\ No newline at end of file
+
+    # Analytics
+    path('api/v1/analytics/revenue/', RevenueAnalyticsAPIView.as_view()),
+    path('api/v1/analytics/products/', ProductSalesAnalyticsAPIView.as_view()),
+    path('api/v1/analytics/categories/', CategorySalesAnalyticsAPIView.as_view()),
+    path('api/v1/analytics/deliverystatuses/', DeliveryStatusAnalyticsAPIView.as_view()),
+
+    # Metrics
+    path('api/v1/metrics/', MetricsAPIView.as_view()),
+
+    # Async (ASGI) read endpoints
+    path('api/v1/async/products/', AsyncProductListAPIView.as_view()),
+    path('api/v1/async/products/<int:pk>/', AsyncProductDetailAPIView.as_view()),
+    path('api/v1/async/categories/', AsyncCategoryListAPIView.as_view()),
+    path('api/v1/async/cartproducts/', AsyncCartProductListAPIView.as_view()),
+    path('api/v1/async/orders/', AsyncOrderListAPIView.as_view()),
+    path('api/v1/async/orders/changes/', AsyncOrderChangesAPIView.as_view()),
+    path('api/v1/async/orders/events/', AsyncOrderEventStreamAPIView.as_view()),
+]
@@ -1,32 +1,244 @@
-from django.db.migrations import serializer
+import io
+import math
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Prefetch, Sum
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from drf_yasg.utils import swagger_auto_schema
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
 from rest_framework.views import APIView
 
-from .models import Product, Category, ShopAddress, DeliveryStatus, Order
-from .serializers import *
+from . import fastpath
+from .cache import cached_response
+from .categories import build_category_tree, subtree
+from .catalog_io import export_catalog, guess_format, import_catalog
+from .models import (
+    Product, Category, Cart, CartProduct, ShopAddress, DeliveryStatus, Order, OrderProduct, OrderArchive,
+    OrderProductArchive, Stock, DailyRevenue, ProductSales, DeliveryStatusCount,
+)
+from .images import schedule_variants
+from .metrics import registry
+from .pagination import OrderKeysetPagination, ProductKeysetPagination, ProductSearchPagination
+from .schema import Parameter, swagger_auto_schema
+from .search import search_products
+from .serializers import (
+    AnalyticsRangeSerializer,
+    CartExpandedSerializer,
+    CartProductBulkSerializer,
+    CartProductDeltaSerializer,
+    CartProductSerializer,
+    CatalogSnapshotSerializer,
+    CatalogTransferSerializer,
+    CategorySalesSerializer,
+    CategorySerializer,
+    CategoryTreeSerializer,
+    DailyRevenueSerializer,
+    DeliveryStatusCountSerializer,
+    DeliveryStatusSerializer,
+    OrderExpandedSerializer,
+    OrderFilterSerializer,
+    OrderSerializer,
+    OrderStatusBulkSerializer,
+    ProductBulkUpdateSerializer,
+    ProductFilterSerializer,
+    ProductSalesSerializer,
+    ProductSearchSerializer,
+    ProductSelectionSerializer,
+    ProductSerializer,
+    ShopAddressSerializer,
+    StaffOrderFilterSerializer,
+    StockSerializer,
+    TopProductsSerializer,
+)
+from .services import (
+    CatalogError, CheckoutError, apply_cart_deltas, checkout, delete_products, remove_cart_line, transition_orders,
+    update_products,
+)
+from .snapshots import SnapshotNotReady, get_config as get_snapshots_config, snapshot_response
+
+expand_parameter = Parameter(
+    'expand', 'query', type='boolean',
+    description='Inline related products, totals, shop address and delivery status',
+)
+
+idempotency_key_parameter = Parameter(
+    'Idempotency-Key', 'header', type='string',
+    description='Retries with the same key return the original order instead of creating a new one',
+)
+
+
+def is_expanded(request):
+    return request.query_params.get('expand', '').lower() in ('1', 'true', 'yes')
+
+
+@contextmanager
+def unique_name(model, name, pk=None):
+    """
+    Report a write that hit the unique index on ``model.name`` as the field
+    error UniqueValidator gives, without its racy check before the write.
+    Writes that don't set the name run as they are.
+    """
+    if name is None:
+        yield
+        return
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        if not model.objects.filter(name=name).exclude(pk=pk).exists():
+            raise
+        raise ValidationError({'name': [UniqueValidator.message]})
+
+
+def filter_products(lst, data):
+    if 'category_id' in data:
+        if data.get('include_subcategories'):
+            lst = lst.filter(category__in=subtree(data['category_id']))
+        else:
+            lst = lst.filter(category_id=data['category_id'])
+    if 'min_price' in data:
+        lst = lst.filter(price__gte=data['min_price'])
+    if 'max_price' in data:
+        lst = lst.filter(price__lte=data['max_price'])
+    return lst
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def order_partitions(data, expanded=False):
+    """
+    The archived and the active orders matching ``data`` (the fields of
+    StaffOrderFilterSerializer), oldest first, as values_list rows for the
+    fast path or, when ``expanded``, as instances with their relations.
+    """
+    partitions = []
+    for model, line_model in ((OrderArchive, OrderProductArchive), (Order, OrderProduct)):
+        lst = model.objects.all()
+        for field in ('user_id', 'deliveryStatus_id', 'deliveryType'):
+            if field in data:
+                lst = lst.filter(**{field: data[field]})
+        if 'date_from' in data:
+            lst = lst.filter(date__gte=_day_start(data['date_from']))
+        if 'date_to' in data:
+            lst = lst.filter(date__lt=_day_start(data['date_to'] + timedelta(days=1)))
+        if expanded:
+            lst = lst.select_related('shopAddress', 'deliveryStatus').prefetch_related(
+                Prefetch('lines', queryset=line_model.objects.select_related('product'))
+            )
+        else:
+            lst = fastpath.orders.rows(lst)
+        partitions.append(lst)
+    return partitions
+
+
+def order_page(request, data):
+    expanded = is_expanded(request)
+    paginator = OrderKeysetPagination()
+    page = paginator.paginate_partitions(order_partitions(data, expanded), request)
+    if expanded:
+        return paginator.get_paginated_response(OrderExpandedSerializer(page, many=True).data)
+    return paginator.get_paginated_response(fastpath.orders.serialize(page))
 
 
 class ProductListAPIView(APIView):
     permission_classes = (AllowAny,)
-    @swagger_auto_schema(responses={200: ProductSerializer(many=True)})
+    throttle_scope = 'products'
+    pagination_class = ProductKeysetPagination
+
+    @swagger_auto_schema(query_serializer=ProductFilterSerializer, responses={200: ProductSerializer(many=True)})
+    # include_subcategories reads the category tree.
+    @cached_response(Product, Category)
     def get(self, request):
-        lst = Product.objects.all()
-        serializer = ProductSerializer(lst, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        filters = ProductFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        lst = filter_products(Product.objects.all(), filters.validated_data)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(fastpath.products.rows(lst), request, view=self)
+        return paginator.get_paginated_response(fastpath.products.serialize(page))
 
     @swagger_auto_schema(request_body=ProductSerializer)
     def post(self, request):
         serializer = ProductSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        product = Product.objects.create(**serializer.validated_data)
+        with unique_name(Product, serializer.validated_data['name']):
+            product = Product.objects.create(**serializer.validated_data)
+        schedule_variants(product)
         return Response(ProductSerializer(product).data, status=status.HTTP_201_CREATED)
 
 
+class ProductSearchAPIView(APIView):
+    permission_classes = (AllowAny,)
+    throttle_scope = 'search'
+    pagination_class = ProductSearchPagination
+
+    @swagger_auto_schema(query_serializer=ProductSearchSerializer, responses={200: ProductSerializer(many=True)})
+    @cached_response(Product)
+    def get(self, request):
+        query = ProductSearchSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        matches = search_products(query.validated_data['q'])
+        paginator = self.pagination_class()
+        if isinstance(matches, list):
+            page = paginator.paginate_queryset(matches, request, view=self)
+            products = {row.id: row for row in fastpath.products.rows(Product.objects.filter(pk__in=page))}
+            page = [products[pk] for pk in page if pk in products]
+        else:
+            page = paginator.paginate_queryset(fastpath.products.rows(matches), request, view=self)
+        return paginator.get_paginated_response(fastpath.products.serialize(page))
+
+
+def select_products(data):
+    lst = filter_products(Product.objects.all(), data)
+    if 'ids' in data:
+        lst = lst.filter(pk__in=data['ids'])
+    return lst
+
+
+class ProductBulkUpdateAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(request_body=ProductBulkUpdateSerializer)
+    def post(self, request):
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            updated = update_products(
+                select_products(data),
+                price=data.get('price'),
+                price_delta=data.get('price_delta'),
+                price_percent=data.get('price_percent'),
+                category_id=data.get('new_category_id'),
+            )
+        except CatalogError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
+
+class ProductBulkDeleteAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(request_body=ProductSelectionSerializer)
+    def post(self, request):
+        serializer = ProductSelectionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deleted = delete_products(select_products(serializer.validated_data))
+        return Response({'deleted': deleted}, status=status.HTTP_200_OK)
+
+
 class ProductDetailAPIView(APIView):
+    @cached_response(Product)
     def get(self, request, pk):
         product = get_object_or_404(Product, pk=pk)
         serializer = ProductSerializer(product)
@@ -34,38 +246,153 @@ class ProductDetailAPIView(APIView):
 
     @swagger_auto_schema(request_body=ProductSerializer)
     def put(self, request, pk):
+        # Fields left out keep their value, and only the given columns are written.
         product = get_object_or_404(Product, pk=pk)
-        serializer = ProductSerializer(data=request.data)
+        serializer = ProductSerializer(product, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        product.name = data.get('name', product.name)
-        product.description = data.get('description', product.description)
-        product.price = data.get('price', product.price)
-        product.photo = data.get('photo', product.photo)
-        product.category_id = data.get('category_id', product.category_id)
-        product.save()
+        fields = [field for field in ('name', 'description', 'price', 'category_id') if field in data]
+        for field in fields:
+            setattr(product, field, data[field])
+        stale = None
+        if 'photo' in data:
+            stale = product.photoVariants
+            product.photo = data['photo']
+            product.photoVariants = {}
+            fields += ['photo', 'photoVariants']
+        if fields:
+            with unique_name(Product, data.get('name'), product.pk):
+                product.save(update_fields=fields)
+        if 'photo' in data:
+            schedule_variants(product, stale)
         return Response(ProductSerializer(product).data, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(request_body=ProductSerializer)
+    def patch(self, request, pk):
+        return self.put(request, pk)
+
     def delete(self, request, pk):
         product = get_object_or_404(Product, pk=pk)
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ProductStockAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(responses={200: StockSerializer(many=True)})
+    def get(self, request, pk):
+        get_object_or_404(Product, pk=pk)
+        lst = Stock.objects.filter(product_id=pk).order_by('shopAddress_id')
+        serializer = StockSerializer(lst, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(request_body=StockSerializer, responses={200: StockSerializer})
+    def put(self, request, pk):
+        get_object_or_404(Product, pk=pk)
+        serializer = StockSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        stock, created = Stock.objects.update_or_create(
+            product_id=pk, shopAddress_id=data['shopAddress_id'], defaults={'available': data['available']}
+        )
+        return Response(StockSerializer(stock).data, status=status.HTTP_200_OK)
+
+
+class CatalogImportAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    @swagger_auto_schema(manual_parameters=[
+        Parameter('file', 'formData', type='file', required=True),
+        Parameter('model', 'formData', type='string', enum=['category', 'product'], required=True),
+        Parameter('format', 'formData', type='string', enum=['csv', 'jsonl']),
+    ])
+    def post(self, request):
+        serializer = CatalogTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': "file is required"}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = serializer.validated_data.get('format') or guess_format(upload.name)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        report = import_catalog(serializer.validated_data['model'], stream, fmt)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+
+class CatalogExportAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= names the file format here, not one of DRF's renderers.
+        return super().perform_content_negotiation(request, force=True)
+
+    @swagger_auto_schema(query_serializer=CatalogTransferSerializer)
+    def get(self, request):
+        serializer = CatalogTransferSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        model = serializer.validated_data['model']
+        fmt = serializer.validated_data.get('format', 'csv')
+        response = StreamingHttpResponse(
+            export_catalog(model, fmt),
+            content_type='text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (model, fmt)
+        return response
+
+
+class CatalogSnapshotAPIView(APIView):
+    """The whole catalog, or one category's products, as pre-rendered JSON files."""
+    permission_classes = (AllowAny,)
+
+    @swagger_auto_schema(query_serializer=CatalogSnapshotSerializer, responses={200: ProductSerializer(many=True)})
+    def get(self, request):
+        query = CatalogSnapshotSerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        try:
+            response = snapshot_response(request, query.validated_data.get('category_id'))
+        except SnapshotNotReady:
+            retry_after = math.ceil(get_snapshots_config()['DELAY']) + 1
+            return Response({'error': "Catalog snapshot is being built"}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': str(retry_after)})
+        if response is None:
+            return Response({'error': "Category not found"}, status=status.HTTP_404_NOT_FOUND)
+        return response
+
+
+class MetricsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(operation_description='Per-route request metrics in Prometheus text format')
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class CategoryListAPIView(APIView):
     @swagger_auto_schema(responses={200: CategorySerializer(many=True)})
+    @cached_response(Category)
     def get(self, request):
-        lst = Category.objects.all()
-        serializer = CategorySerializer(lst, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        lst = fastpath.categories.rows(Category.objects.all())
+        return Response(fastpath.categories.serialize(lst), status=status.HTTP_200_OK)
 
     @swagger_auto_schema(request_body=CategorySerializer)
     def post(self, request):
         serializer = CategorySerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        category = Category.objects.create(**serializer.validated_data)
+        with unique_name(Category, serializer.validated_data['name']):
+            category = Category.objects.create(**serializer.validated_data)
         return Response(CategorySerializer(category).data, status=status.HTTP_201_CREATED)
 
+class CategoryTreeAPIView(APIView):
+    permission_classes = (AllowAny,)
+    throttle_scope = 'categories'
+
+    @swagger_auto_schema(responses={200: CategoryTreeSerializer(many=True)})
+    @cached_response(Category)
+    def get(self, request):
+        return Response(build_category_tree(), status=status.HTTP_200_OK)
+
+
 class CategoryDetailAPIView(APIView):
     def get(self, request, pk):
         category = get_object_or_404(Category, pk=pk)
@@ -79,7 +406,11 @@ class CategoryDetailAPIView(APIView):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         category.name = data.get('name', category.name)
-        category.save()
+        category.parent_id = data.get('parent_id', category.parent_id)
+        if category.parent_id is not None and category.pk in Category.objects.get(pk=category.parent_id).ancestor_ids:
+            return Response({'error': "A category can't be moved into its own subtree"}, status=status.HTTP_400_BAD_REQUEST)
+        with unique_name(Category, category.name, category.pk):
+            category.save()
         return Response(CategorySerializer(category).data, status=status.HTTP_200_OK)
 
     def delete(self, request, pk):
@@ -89,45 +420,70 @@ class CategoryDetailAPIView(APIView):
 
 
 class CartProductListAPIView(APIView):
-    @swagger_auto_schema(responses={200: CartProductSerializer(many=True)})
+    @swagger_auto_schema(manual_parameters=[expand_parameter], responses={200: CartProductSerializer(many=True)})
     def get(self, request):
         active_cart = Cart.objects.filter(user=request.user, isPurchase=False).first()
         if active_cart:
             lst = CartProduct.objects.filter(cart=active_cart)
         else:
             lst = []
-        serializer = CartProductSerializer(lst, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if is_expanded(request):
+            if active_cart:
+                lst = list(lst.select_related('product'))
+            cart = {
+                'id': active_cart.id if active_cart else None,
+                'items': lst,
+                'total': sum((line.total for line in lst), Decimal('0.00')),
+            }
+            return Response(CartExpandedSerializer(cart).data, status=status.HTTP_200_OK)
+        if active_cart:
+            lst = fastpath.cart_products.rows(lst)
+        return Response(fastpath.cart_products.serialize(lst), status=status.HTTP_200_OK)
 
-    @swagger_auto_schema(request_body=CartProductSerializer)
+    @swagger_auto_schema(request_body=CartProductDeltaSerializer)
     def post(self, request):
-        product_id = request.data.get('product_id')
-        additional_amount = int(request.data.get('amount', 1))
-        cart, created = Cart.objects.get_or_create(
-            user_id=request.user.id,
-            isPurchase=False
-        )
-        cart_product, created = CartProduct.objects.get_or_create(
-            cart=cart,
-            product_id=product_id,
-            defaults={'amount': additional_amount}
-        )
-        if not created:
-            cart_product.amount += additional_amount
-            cart_product.save()
+        serializer = CartProductDeltaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        get_object_or_404(Product, pk=data['product_id'])
+        try:
+            cart = apply_cart_deltas(
+                request.user.id, {data['product_id']: data['amount']}, data.get('shopAddress_id')
+            )
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        cart_product = CartProduct.objects.filter(cart=cart, product_id=data['product_id']).first()
+        if cart_product is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
         serializer = CartProductSerializer(cart_product)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class CartProductBulkAPIView(APIView):
+    @swagger_auto_schema(request_body=CartProductBulkSerializer, responses={200: CartProductSerializer(many=True)})
+    def post(self, request):
+        serializer = CartProductBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            cart = apply_cart_deltas(
+                request.user.id, serializer.validated_data['items'], serializer.validated_data.get('shopAddress_id')
+            )
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        lst = fastpath.cart_products.rows(CartProduct.objects.filter(cart=cart))
+        return Response(fastpath.cart_products.serialize(lst), status=status.HTTP_200_OK)
+
+
 class CartProductDetailAPIView(APIView):
     def delete(self, request, pk):
         cartProduct = get_object_or_404(CartProduct, pk=pk)
-        cartProduct.delete()
+        remove_cart_line(cartProduct)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class ShopAddressListAPIView(APIView):
     @swagger_auto_schema(responses={200: ShopAddressSerializer(many=True)})
+    @cached_response(ShopAddress)
     def get(self, request):
         lst = ShopAddress.objects.all()
         serializer = ShopAddressSerializer(lst, many=True)
@@ -163,6 +519,7 @@ class ShopAddressDetailAPIView(APIView):
 
 class DeliveryStatusListAPIView(APIView):
     @swagger_auto_schema(responses={200: DeliveryStatusSerializer(many=True)})
+    @cached_response(DeliveryStatus)
     def get(self, request):
         lst = DeliveryStatus.objects.all()
         serializer = DeliveryStatusSerializer(lst, many=True)
@@ -197,36 +554,34 @@ class DeliveryStatusDetailAPIView(APIView):
 
 
 class OrderListAPIView(APIView):
-    @swagger_auto_schema(responses={200: OrderSerializer(many=True)})
+    @swagger_auto_schema(query_serializer=OrderFilterSerializer, manual_parameters=[expand_parameter],
+                         responses={200: OrderSerializer(many=True)})
     def get(self, request):
-        lst = Order.objects.filter(user_id=request.user.id)
-        serializer = OrderSerializer(lst, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # A plain dict, so that a missing deliveryType isn't read as an unchecked checkbox.
+        filters = OrderFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return order_page(request, {**filters.validated_data, 'user_id': request.user.id})
 
-    @swagger_auto_schema(request_body=OrderSerializer)
+    @swagger_auto_schema(request_body=OrderSerializer, manual_parameters=[idempotency_key_parameter])
     def post(self, request):
-        cart = Cart.objects.filter(user_id=request.user.id, isPurchase=False).first()
-        if not cart:
-            return Response({'error':"No active cart found"}, status=status.HTTP_404_NOT_FOUND)
         serializer = OrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        order = Order.objects.create(
-            user_id=request.user.id,
-            cart_id=cart.id,
-            **serializer.validated_data
-        )
-        cart.isPurchase = True
-        cart.save()
-        Cart.objects.create(
-            user_id=request.user.id,
-            isPurchase=False
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        if idempotency_key is not None and len(idempotency_key) > 64:
+            return Response({'error': "Idempotency-Key must be at most 64 characters"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order, created = checkout(request.user.id, serializer.validated_data, idempotency_key)
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=e.status_code)
+        return Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
-        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 
 
 class OrderDetailAPIView(APIView):
     def get(self, request, pk):
-        order = get_object_or_404(Order, pk=pk)
+        order = Order.objects.filter(pk=pk).first() or get_object_or_404(OrderArchive, pk=pk)
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -235,14 +590,98 @@ class OrderDetailAPIView(APIView):
         serializer = OrderSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data=serializer.validated_data
-        order.deliveryAddress = data.get('deliveryAddress', order.deliveryAddress)
-        order.deliveryType = data.get('deliveryType', order.deliveryType)
+        # The validated destination replaces the old one as a whole, keeping the delivery check constraint.
+        order.deliveryType = data['deliveryType']
+        order.deliveryAddress = data.get('deliveryAddress')
+        order.shopAddress_id = data.get('shopAddress_id')
         order.deliveryPhoneNumber = data.get('deliveryPhoneNumber', order.deliveryPhoneNumber)
-        order.shopAddress_id = data.get('shopAddress_id', order.shopAddress_id)
         order.save()
         return Response(OrderSerializer(order).data, status=status.HTTP_200_OK)
 
     def delete(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         order.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class StaffOrderListAPIView(APIView):
+    """Every user's orders, for staff."""
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(query_serializer=StaffOrderFilterSerializer, manual_parameters=[expand_parameter],
+                         responses={200: OrderSerializer(many=True)})
+    def get(self, request):
+        filters = StaffOrderFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        return order_page(request, filters.validated_data)
+
+
+class OrderStatusBulkAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(request_body=OrderStatusBulkSerializer)
+    def post(self, request):
+        serializer = OrderStatusBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        status_id = data['deliveryStatus_id']
+        if status_id is not None and not DeliveryStatus.objects.filter(pk=status_id).exists():
+            return Response({'error': "Delivery status not found"}, status=status.HTTP_400_BAD_REQUEST)
+        updated = transition_orders(data['order_ids'], status_id)
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
+
+class RevenueAnalyticsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(query_serializer=AnalyticsRangeSerializer, responses={200: DailyRevenueSerializer(many=True)})
+    def get(self, request):
+        filters = AnalyticsRangeSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        lst = DailyRevenue.objects.all()
+        if 'date_from' in filters.validated_data:
+            lst = lst.filter(date__gte=filters.validated_data['date_from'])
+        if 'date_to' in filters.validated_data:
+            lst = lst.filter(date__lte=filters.validated_data['date_to'])
+        lst = lst.values('date').annotate(orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue')).order_by('date')
+        serializer = DailyRevenueSerializer(lst, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ProductSalesAnalyticsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(query_serializer=TopProductsSerializer, responses={200: ProductSalesSerializer(many=True)})
+    def get(self, request):
+        params = TopProductsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        lst = ProductSales.objects.order_by('-' + data['ordering'], 'id')[:data['limit']]
+        serializer = ProductSalesSerializer(lst, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class CategorySalesAnalyticsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(responses={200: CategorySalesSerializer(many=True)})
+    def get(self, request):
+        lst = (
+            ProductSales.objects.filter(product__isnull=False).order_by()
+            .values(category_id=F('product__category_id'), category_name=F('product__category__name'))
+            .annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by('-revenue')
+        )
+        serializer = CategorySalesSerializer(lst, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class DeliveryStatusAnalyticsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @swagger_auto_schema(responses={200: DeliveryStatusCountSerializer(many=True)})
+    def get(self, request):
+        lst = DeliveryStatusCount.objects.values(
+            'deliveryStatus_id', name=F('deliveryStatus__name')
+        ).annotate(orders=Sum('orders')).order_by(F('deliveryStatus_id').asc(nulls_first=True))
+        serializer = DeliveryStatusCountSerializer(lst, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -44,13 +44,14 @@ INSTALLED_APPS = [
     'shop.apps.ShopConfig',
     'rest_framework',
     'rest_framework.authtoken',
-    'drf_yasg',
     'rest_framework_simplejwt',
     'djoser',
     'psycopg2',
 ]
 
 MIDDLEWARE = [
+    'shop.middleware.RequestMetricsMiddleware',
+    'shop.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,10 +98,34 @@ DATABASES = {
         'USER': env('POSTGRES_USER'),
         'PASSWORD': env('POSTGRES_PASSWORD'),
         'HOST': '127.0.0.1',
-        'PORT': '5433'
+        'PORT': '5433',
+        # Persistent connections, checked before reuse so a restarted server doesn't break requests.
+        'CONN_MAX_AGE': env.int('POSTGRES_CONN_MAX_AGE', default=60),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas as "host:port" pairs, e.g. POSTGRES_REPLICAS=10.0.0.2:5432,10.0.0.3:5432.
+# Safe-method requests read from them (shop.routers), writes go to default.
+for number, replica in enumerate(env.list('POSTGRES_REPLICAS', default=[]), start=1):
+    host, _, port = replica.partition(':')
+    DATABASES['replica%d' % number] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+
+# Every alias other than default is a replica. Clients that wrote within
+# STICKY_SECONDS keep reading from the primary; the marker lives in the CACHE
+# alias, which must be shared when running several workers.
+SHOP_DB_ROUTING = {
+    'STICKY_SECONDS': env.int('SHOP_DB_STICKY_SECONDS', default=5),
+    'CACHE': 'default',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -144,11 +169,22 @@ MEDIA_URL = '/media/'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'shop.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Uses orjson when installed (the "fast" extra), with the same output as JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': (
+        'shop.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'shop.throttling.TokenBucketThrottle',
+    ),
+    # Proxies in front of the app whose X-Forwarded-For entries identify anonymous
+    # clients for throttling; 0 uses the socket address.
+    'NUM_PROXIES': env.int('SHOP_NUM_PROXIES', default=0),
 }
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('Bearer',),
@@ -158,6 +194,123 @@ DJOSER = {
     'TOKEN_MODEL': None,
 }
 
+# Versioned GET response cache (shop.cache). LocMemLRUBackend is per-process,
+# use DjangoCacheBackend with a shared CACHES alias when running several workers.
+# A process-local backend only sees other workers' writes once its version
+# stamps expire after VERSION_TIMEOUT seconds; 0 keeps them (shared backends).
+SHOP_RESPONSE_CACHE = {
+    'BACKEND': env('SHOP_RESPONSE_CACHE_BACKEND', default='shop.cache.LocMemLRUBackend'),
+    'TIMEOUT': env.int('SHOP_RESPONSE_CACHE_TIMEOUT', default=300),
+    'VERSION_TIMEOUT': env.int('SHOP_RESPONSE_CACHE_VERSION_TIMEOUT', default=30) or None,
+    'OPTIONS': {
+        'max_entries': env.int('SHOP_RESPONSE_CACHE_MAX_ENTRIES', default=1024),
+    },
+    # Seconds concurrent misses of one key wait for the request computing it.
+    'COALESCE_TIMEOUT': env.int('SHOP_RESPONSE_CACHE_COALESCE_TIMEOUT', default=10),
+}
+
+# Token-bucket rate limits (shop.throttling) per view throttle_scope, keyed by
+# user or client IP. BACKEND 'memory' limits each process on its own, 'cache'
+# shares the buckets through the CACHE alias.
+SHOP_THROTTLE = {
+    'BACKEND': env('SHOP_THROTTLE_BACKEND', default='memory'),
+    'CACHE': 'default',
+    'RATES': {
+        'products': env('SHOP_THROTTLE_PRODUCTS', default='120/min'),
+        'search': env('SHOP_THROTTLE_SEARCH', default='60/min'),
+        'categories': env('SHOP_THROTTLE_CATEGORIES', default='120/min'),
+    },
+}
+
+# Resized product photo variants (shop.images). WORKERS=0 generates them inline.
+SHOP_IMAGE_VARIANTS = {
+    'WIDTHS': [320, 640, 1280],
+    'WORKERS': env.int('SHOP_IMAGE_WORKERS', default=2),
+    'QUALITY': 80,
+}
+
+# Pre-rendered catalog JSON (shop.snapshots), rebuilt in the background DELAY
+# seconds after catalog writes, or once older than MAX_AGE. Set ACCEL_REDIRECT to
+# an internal nginx location aliasing DIR to have nginx send the files.
+SHOP_SNAPSHOTS = {
+    'DIR': env('SHOP_SNAPSHOTS_DIR', default=os.path.join(MEDIA_ROOT, 'snapshots')),
+    'DELAY': env.float('SHOP_SNAPSHOTS_DELAY', default=2.0),
+    'MAX_AGE': env.int('SHOP_SNAPSHOTS_MAX_AGE', default=300),
+    'ACCEL_REDIRECT': env('SHOP_SNAPSHOTS_ACCEL_REDIRECT', default=None),
+}
+
+# Stock reservations (shop.services). Carts hold added units this long;
+# run the release_reservations command periodically to free expired ones.
+SHOP_STOCK = {
+    'RESERVATION_TTL': env.int('SHOP_RESERVATION_TTL', default=900),
+}
+
+# Cart cleanup (cleanup_carts command). Open carts untouched for ABANDONED_DAYS,
+# or EMPTY_DAYS when they have no lines, are deleted.
+SHOP_CARTS = {
+    'ABANDONED_DAYS': env.int('SHOP_CART_ABANDONED_DAYS', default=30),
+    'EMPTY_DAYS': env.int('SHOP_CART_EMPTY_DAYS', default=1),
+}
+
+# Order history (rotate_orders command). Orders older than ARCHIVE_AFTER_DAYS
+# move to the archive tables, keeping the active ones small; listings and
+# analytics read both.
+SHOP_ORDERS = {
+    'ARCHIVE_AFTER_DAYS': env.int('SHOP_ORDER_ARCHIVE_DAYS', default=180),
+}
+
+# Sales rollups (shop.analytics). Each day and delivery status is spread over
+# BUCKETS rows, picked by order id, so checkouts don't all update one row.
+SHOP_ANALYTICS = {
+    'BUCKETS': env.int('SHOP_ANALYTICS_BUCKETS', default=16),
+}
+
+# Users resolved from access tokens (shop.authentication), kept in the CACHES
+# alias so that saving a user (deactivation, password change) drops it for
+# every worker; the alias must be shared when running several. With the
+# process-local LocMemLRUBackend other workers notice only after TIMEOUT.
+SHOP_AUTH_CACHE = {
+    'BACKEND': env('SHOP_AUTH_CACHE_BACKEND', default='shop.cache.DjangoCacheBackend'),
+    'TIMEOUT': env.int('SHOP_AUTH_CACHE_TIMEOUT', default=60),
+    'OPTIONS': {
+        'alias': env('SHOP_AUTH_CACHE_ALIAS', default='default'),
+    },
+}
+
+# Order status feed (shop.events). One poller per process reads new events
+# every POLL_INTERVAL seconds for all waiting long-poll and SSE clients.
+# Events behind a gap in the ids are held back until the gap is filled or
+# COMMIT_GRACE seconds old, which must exceed the longest order transaction.
+SHOP_ORDER_EVENTS = {
+    'POLL_INTERVAL': env.float('SHOP_EVENTS_POLL_INTERVAL', default=1.0),
+    'BUFFER_SIZE': env.int('SHOP_EVENTS_BUFFER_SIZE', default=10000),
+    'LONG_POLL_TIMEOUT': env.int('SHOP_EVENTS_LONG_POLL_TIMEOUT', default=25),
+    'KEEPALIVE': env.int('SHOP_EVENTS_KEEPALIVE', default=15),
+    'COMMIT_GRACE': env.int('SHOP_EVENTS_COMMIT_GRACE', default=10),
+}
+
+# Per-request metrics (shop.middleware). PROFILE is 'off', 'header' (requests
+# sent with an "X-Profile: <PROFILE_SECRET>" header; nothing without a secret)
+# or 'all'; profiles slower than the threshold are dumped to PROFILE_DIR as
+# .prof files.
+SHOP_METRICS = {
+    'PROFILE': env('SHOP_PROFILE', default='off'),
+    'PROFILE_SECRET': env('SHOP_PROFILE_SECRET', default=''),
+    'PROFILE_THRESHOLD_MS': env.int('SHOP_PROFILE_THRESHOLD_MS', default=500),
+    'PROFILE_DIR': env('SHOP_PROFILE_DIR', default=os.path.join(BASE_DIR, 'profiles')),
+}
+
+# Swagger UI and OpenAPI schema (shop.schema). drf_yasg is loaded on the first
+# request to /swagger/; run generate_schema at deploy time to serve SCHEMA_FILE
+# instead of building the schema in a worker. Disabled, none of it is loaded.
+SHOP_OPENAPI = {
+    'ENABLED': env.bool('SHOP_OPENAPI_ENABLED', default=True),
+    'SCHEMA_FILE': env('SHOP_OPENAPI_SCHEMA_FILE', default=os.path.join(BASE_DIR, 'openapi.json')),
+}
+
+if SHOP_OPENAPI['ENABLED']:
+    INSTALLED_APPS.append('drf_yasg')
+
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -0,0 +1,42 @@
+"""
+Test settings: two SQLite databases stand in for the PostgreSQL primary and a
+read replica, so the suite (replica routing included) runs without a server.
+
+    python manage.py test shop --settings=techstore.settings_test
+
+The checkout concurrency tests run here too, but SQLite serializes whole
+transactions; the row locks they are about are only exercised on PostgreSQL,
+e.g. the database from docker-compose.dev.yml with the default settings:
+
+    docker compose -f docker-compose.dev.yml up -d db
+    python manage.py test shop
+"""
+import tempfile
+from pathlib import Path
+
+from .settings import *  # noqa: F401,F403
+
+# Outside the source tree.
+DATA_DIR = Path(tempfile.gettempdir())
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATA_DIR / 'techstore-test-primary.sqlite3',
+        # SQLite has no row locks: checkouts serialize on the database write
+        # lock instead, taken at BEGIN so concurrent transactions queue on it
+        # rather than fail upgrading a read lock. The concurrency tests need a
+        # file for their threads to share.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 30},
+        'TEST': {'NAME': DATA_DIR / 'techstore-test-primary-run.sqlite3'},
+    },
+    # Deliberately not a TEST mirror: replica reads must not see primary writes.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATA_DIR / 'techstore-test-replica.sqlite3',
+    },
+}
+
+# Routing stays off so the rest of the suite reads what it writes; the
+# replica tests switch it on with override_settings.
+SHOP_DB_ROUTING = {'REPLICAS': []}
@@ -19,20 +19,10 @@ from django.conf.urls.static import static
 from django.contrib import admin
 
 from django.urls import path, include, re_path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
 
-from shop.views import *
-
-schema_view = get_schema_view(
-   openapi.Info(title="Snippets API", default_version='v1'),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from shop import schema
 
 urlpatterns = [
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('admin/', admin.site.urls),
     path('shop/', include('shop.urls')),
     path('api/v1/shopauth/', include('rest_framework.urls')),
@@ -41,5 +31,12 @@ urlpatterns = [
 ]
 
 
+# drf_yasg is only imported when one of these is first requested.
+if settings.SHOP_OPENAPI['ENABLED']:
+    urlpatterns += [
+        path('swagger/', schema.swagger_ui, name='schema-swagger-ui'),
+        path('swagger.json', schema.schema_json, name='schema-json'),
+    ]
+
 if settings.DEBUG:
     urlpatterns+=static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)